@@ -0,0 +1,347 @@
+#!/bin/bash
+BASE="$( cd "$(dirname "$0")" >/dev/null 2>&1 ; pwd -P )"
+
+if [[ ! -f ${BASE}/../../util.sh ]] || [[ ! -f ${BASE}/../../mysql/util.sh ]]; then
+    echo "Missing util.sh"
+    exit 1
+fi
+
+source ${BASE}/../../util.sh # log_info/log_error/is_local
+source ${BASE}/../../mysql/util.sh # bootstrap
+
+PLOAD=${BASE}/../../mysql/pload.py
+GEN_DUMP=${BASE}/gen_dump.py
+PYTHON=$(which python3 2>/dev/null || which python)
+
+function usage()
+{
+    echo -e "Utility to benchmark pload.py with synthetic mysqldump files, splitting only or loading into a throwaway local mysqld\n\n\
+SYNOPSIS:\n\
+    $0 [PARAMETERs] COMMAND\n\n\
+PARAMETERs:\n\
+    -b | --base=<MYSQL_BINARY_DIR>: Specify directory of mysql binary, for load\n\
+    -d | --data=<DATA_HOME>: Specify home directory of the throwaway mysqld, /tmp/pload_bench_server by default\n\
+    -P | --port=<PORT>: Specify port on which the throwaway mysqld runs, 13306 by default\n\
+    -o | --output=<RESULT_DIR>: Specify directory of dump file, chunks and results, ${BASE}/results by default\n\
+    -f | --dump=<DUMP_FILE>: Specify dump file to benchmark with, <RESULT_DIR>/bench.sql by default\n\
+    --tables=<TABLES>: Specify num of tables to generate, 4 by default\n\
+    --rows=<ROWS>: Specify num of rows per table to generate, 100000 by default\n\
+    --row-width=<BYTES>: Specify bytes of a generated row, 200 by default\n\
+    --indexes=<INDEXES>: Specify num of secondary indexes per generated table, 1 by default\n\
+    --single-row: Generate one row per INSERT instead of extended INSERTs\n\
+    --tpch=<TBL_DIR>: Generate dump file from TPC-H data files of benchmark/tpch/data_kit.sh instead\n\
+    --parallel=\"<N> ...\": Specify list of --parallel (--split_parallel for split) to sweep, \"1 4 8 16\" by default\n\
+    --chunk-size=\"<SIZE> ...\": Specify list of --chunk_size to sweep, \"16M 64M\" by default\n\
+    --pload-args=\"<ARGS>\": Specify extra arguments of pload.py, e.g. \"-L -i\"\n\
+    -h | --help: Print this help message\n\n\
+COMMAND:\n\
+    generate: Generate dump file\n\
+    split: Split dump file only and measure throughput of splitter\n\
+    load: Start a throwaway mysqld, load dump file into it, and stop it\n\
+    all: generate, split and load in one shot"
+}
+
+# parse options
+DATA_HOME=/tmp/pload_bench_server
+PORT=13306
+RESULT_DIR=${BASE}/results
+TABLES=4
+ROWS=100000
+ROW_WIDTH=200
+INDEXES=1
+SINGLE_ROW=0
+PARALLELS="1 4 8 16"
+CHUNK_SIZES="16M 64M"
+OPT_END=0
+while [[ ${OPT_END} -eq 0 ]]; do
+    case "$1" in
+    -b|--base)
+        shift
+        MYSQL_BASE=$(get_key_value "$1")
+        shift;;
+    --base=*)
+        MYSQL_BASE=$(get_key_value "$1")
+        shift;;
+
+    -d|--data)
+        shift
+        DATA_HOME=$(get_key_value "$1")
+        shift;;
+    --data=*)
+        DATA_HOME=$(get_key_value "$1")
+        shift;;
+
+    -P|--port)
+        shift
+        PORT=$(get_key_value "$1")
+        shift;;
+    --port=*)
+        PORT=$(get_key_value "$1")
+        shift;;
+
+    -o|--output)
+        shift
+        RESULT_DIR=$(get_key_value "$1")
+        shift;;
+    --output=*)
+        RESULT_DIR=$(get_key_value "$1")
+        shift;;
+
+    -f|--dump)
+        shift
+        DUMP_FILE=$(get_key_value "$1")
+        shift;;
+    --dump=*)
+        DUMP_FILE=$(get_key_value "$1")
+        shift;;
+
+    --tables)
+        shift
+        TABLES=$(get_key_value "$1")
+        shift;;
+    --tables=*)
+        TABLES=$(get_key_value "$1")
+        shift;;
+
+    --rows)
+        shift
+        ROWS=$(get_key_value "$1")
+        shift;;
+    --rows=*)
+        ROWS=$(get_key_value "$1")
+        shift;;
+
+    --row-width)
+        shift
+        ROW_WIDTH=$(get_key_value "$1")
+        shift;;
+    --row-width=*)
+        ROW_WIDTH=$(get_key_value "$1")
+        shift;;
+
+    --indexes)
+        shift
+        INDEXES=$(get_key_value "$1")
+        shift;;
+    --indexes=*)
+        INDEXES=$(get_key_value "$1")
+        shift;;
+
+    --single-row)
+        shift
+        SINGLE_ROW=1;;
+
+    --tpch)
+        shift
+        TPCH_DIR=$(get_key_value "$1")
+        shift;;
+    --tpch=*)
+        TPCH_DIR=$(get_key_value "$1")
+        shift;;
+
+    --parallel)
+        shift
+        PARALLELS=$(get_key_value "$1")
+        shift;;
+    --parallel=*)
+        PARALLELS=$(get_key_value "$1")
+        shift;;
+
+    --chunk-size)
+        shift
+        CHUNK_SIZES=$(get_key_value "$1")
+        shift;;
+    --chunk-size=*)
+        CHUNK_SIZES=$(get_key_value "$1")
+        shift;;
+
+    --pload-args)
+        shift
+        PLOAD_ARGS=$(get_key_value "$1")
+        shift;;
+    --pload-args=*)
+        PLOAD_ARGS=$(get_key_value "$1")
+        shift;;
+
+    -h|--help)
+        usage
+        exit 0;;
+    *)
+        OPT_END=1;;
+    esac
+done
+
+[[ ! -z ${PYTHON} ]] || fatal_error "No python is available"
+[[ ! -z ${DUMP_FILE} ]] || DUMP_FILE=${RESULT_DIR}/bench.sql
+WORK_DIR=${RESULT_DIR}/tmp
+DATABASE=pload_bench
+mkdir -p ${WORK_DIR}
+
+function generate_dump() {
+    local gen_args="-o ${DUMP_FILE}"
+    if [[ ! -z ${TPCH_DIR} ]]; then
+        [[ -d ${TPCH_DIR} ]] || fatal_error "Invalid parameter value for --tpch, ${TPCH_DIR} isn't a directory"
+        log_info "Generating dump file ${DUMP_FILE} from TPC-H data files under ${TPCH_DIR} ..."
+        gen_args="${gen_args} -T ${TPCH_DIR} -i ${INDEXES}"
+    else
+        log_info "Generating dump file ${DUMP_FILE} with ${TABLES} tables of ${ROWS} rows (${ROW_WIDTH} bytes per row, ${INDEXES} indexes) ..."
+        gen_args="${gen_args} -t ${TABLES} -r ${ROWS} -w ${ROW_WIDTH} -i ${INDEXES}"
+    fi
+    [[ ${SINGLE_ROW} -eq 0 ]] || gen_args="${gen_args} -1"
+
+    ${PYTHON} ${GEN_DUMP} ${gen_args} || fatal_error "Failed to generate dump file"
+    log_info "Dump file ${DUMP_FILE} is generated"
+}
+
+# append a line of a run to result file from the JSON report of pload.py
+function append_result() {
+    local result_file=$1
+    local report_file=$2
+    local mode=$3
+    local parallel=$4
+    local chunk_size=$5
+
+    [[ -f ${result_file} ]] || echo -e "mode\tparallel\tchunk_size\targs\tsucceeded\tchunks\tsize_mb\tsplit_s\tschema_s\tdata_s\tindexes_s\ttotal_s\tmb_per_s\trows_per_s" > ${result_file}
+    if [[ ! -f ${report_file} ]]; then
+        log_error "No report file ${report_file} of ${mode} run (parallel=${parallel}, chunk_size=${chunk_size})"
+        echo -e "${mode}\t${parallel}\t${chunk_size}\t${PLOAD_ARGS}\tFalse\t-\t-\t-\t-\t-\t-\t-\t-\t-" >> ${result_file}
+        return 1
+    fi
+
+    ${PYTHON} - "${report_file}" "${mode}" "${parallel}" "${chunk_size}" "${PLOAD_ARGS}" >> ${result_file} <<'EOF'
+import json
+import sys
+report_file, mode, parallel, chunk_size, args = sys.argv[1:6]
+with open(report_file) as f_report:
+    report = json.load(f_report)
+phases = report['phase_seconds']
+split = report['split']
+if mode == 'split':
+    seconds = phases.get('split', 0)
+    rows = split['rows']
+else:
+    seconds = report['elapsed_seconds']
+    rows = report['total']['rows']
+seconds = max(seconds, 0.001)
+print("\t".join([str(v) for v in [
+    mode, parallel, chunk_size, args, report['succeeded'], split['chunks'],
+    round(split['bytes'] / 1048576.0, 1),
+    phases.get('split', '-'), phases.get('schema', '-'), phases.get('data', '-'), phases.get('indexes', '-'),
+    round(seconds, 3), round(split['bytes'] / 1048576.0 / seconds, 1), int(rows / seconds)]]))
+EOF
+}
+
+# print a result file as markdown table
+function print_result() {
+    local result_file=$1
+    awk -F'\t' '{
+        line = "|"
+        for (i = 1; i <= NF; i++) line = line " " $i " |"
+        print line
+        if (NR == 1) {
+            line = "|"
+            for (i = 1; i <= NF; i++) line = line " --- |"
+            print line
+        }
+    }' ${result_file} | tee ${result_file%.tsv}.md
+}
+
+function split_dump() {
+    [[ -f ${DUMP_FILE} ]] || fatal_error "Dump file ${DUMP_FILE} not exists, generate it first"
+
+    local result_file=${RESULT_DIR}/split.tsv
+    /bin/rm -f ${result_file}
+    for chunk_size in ${CHUNK_SIZES}; do
+        for parallel in ${PARALLELS}; do
+            log_info "Splitting ${DUMP_FILE} with split_parallel=${parallel}, chunk_size=${chunk_size} ..."
+            local report_file=${WORK_DIR}/split_${parallel}_${chunk_size}.json
+            /bin/rm -f ${report_file}
+            ${PYTHON} ${PLOAD} -f ${DUMP_FILE} -d ${DATABASE} -t ${WORK_DIR} -S \
+                -w ${parallel} -z ${chunk_size} -j ${report_file} -e 0 ${PLOAD_ARGS} >${WORK_DIR}/split.log 2>&1 || \
+                log_error "Failed to split, see ${WORK_DIR}/split.log"
+            append_result ${result_file} ${report_file} split ${parallel} ${chunk_size}
+        done
+    done
+    /bin/rm -rf ${WORK_DIR}/this_is_temp_dir_for_chunks*
+
+    log_info "Results of split are written to ${result_file}"
+    print_result ${result_file}
+}
+
+function start_server() {
+    [[ ! -z ${MYSQL_BASE} ]] || fatal_error "Missing parameter for --base"
+    check_binary 127.0.0.1 ${MYSQL_BASE} 0 || fatal_error "Invalid value for --base"
+
+    # throwaway server with the deployment template of mysql/deploy_rds.sh
+    MY_CNF=${WORK_DIR}/my.cnf
+    cp ${BASE}/../../mysql/my_rds_template.cnf ${MY_CNF}
+    sed -i -e "s#<DATA_HOME>#${DATA_HOME}#g" \
+           -e "s#<BASE_DIR>#${MYSQL_BASE}#g" \
+           -e "s#<PORT>#${PORT}#g" \
+           -e "s#^mysqlx_port.*#mysqlx_port = $((PORT + 10))#" \
+           -e "s#^\[mysqld\]#[mysqld]\nlocal_infile = ON#" \
+           ${MY_CNF}
+    get_mysql_params ${MY_CNF} 127.0.0.1
+
+    pid=$(check_mysqld ${MYSQL_BASE}/bin 127.0.0.1 ${PORT})
+    [[ $pid -ne 0 ]] && fatal_error "Database server is already running with pid=${pid} at 127.0.0.1:${PORT}"
+
+    init_mysql_datadir 127.0.0.1 ${DATA_HOME}
+    cp ${MY_CNF} ${DATA_HOME}/my.cnf
+    MY_CNF=${DATA_HOME}/my.cnf
+
+    bootstrap ${MYSQL_BASE}/bin 127.0.0.1 ${PORT} ${MY_CNF} || fatal_error "Failed to start throwaway database server"
+    init_root_user ${MYSQL_BASE}/bin 127.0.0.1 || fatal_error "Failed to init root user"
+}
+
+function stop_server() {
+    stop_mysqld ${MYSQL_BASE}/bin 127.0.0.1 ${PORT} || kill_mysqld ${MYSQL_BASE}/bin 127.0.0.1 ${PORT}
+    /bin/rm -rf ${DATA_HOME}
+    log_info "Throwaway database server at 127.0.0.1:${PORT} is removed"
+}
+
+function load_dump() {
+    [[ -f ${DUMP_FILE} ]] || fatal_error "Dump file ${DUMP_FILE} not exists, generate it first"
+
+    start_server
+    trap stop_server EXIT
+
+    local result_file=${RESULT_DIR}/load.tsv
+    local mysql_cmd="${MYSQL_BASE}/bin/mysql -uroot -S ${SOCKET}"
+    /bin/rm -f ${result_file}
+    for chunk_size in ${CHUNK_SIZES}; do
+        for parallel in ${PARALLELS}; do
+            log_info "Loading ${DUMP_FILE} with parallel=${parallel}, chunk_size=${chunk_size} ..."
+            ${mysql_cmd} -e "DROP DATABASE IF EXISTS ${DATABASE};" || fatal_error "Failed to drop database ${DATABASE}"
+            local report_file=${WORK_DIR}/load_${parallel}_${chunk_size}.json
+            /bin/rm -f ${report_file}
+            ${PYTHON} ${PLOAD} -m ${MYSQL_BASE}/bin/mysql -s ${SOCKET} -u root -f ${DUMP_FILE} -d ${DATABASE} -t ${WORK_DIR} \
+                -x ${parallel} -z ${chunk_size} -j ${report_file} -e 0 ${PLOAD_ARGS} >${WORK_DIR}/load.log 2>&1 || \
+                log_error "Failed to load, see ${WORK_DIR}/load.log"
+            append_result ${result_file} ${report_file} load ${parallel} ${chunk_size}
+        done
+    done
+    /bin/rm -rf ${WORK_DIR}/this_is_temp_dir_for_chunks*
+
+    log_info "Results of load are written to ${result_file}"
+    print_result ${result_file}
+}
+
+case "$1" in
+    "generate")
+        generate_dump
+        ;;
+    "split")
+        split_dump
+        ;;
+    "load")
+        load_dump
+        ;;
+    "all")
+        generate_dump
+        split_dump
+        load_dump
+        ;;
+    *)
+        fatal_error "Invalid command: $1";;
+esac
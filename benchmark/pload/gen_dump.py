@@ -0,0 +1,229 @@
+#!/usr/bin/python
+#coding:utf-8
+
+# Synthetic mysqldump file generator for benchmarking pload.py
+
+from __future__ import print_function
+
+from optparse import OptionParser
+import glob
+import os
+import random
+import re
+import sys
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+
+parser = OptionParser()
+parser.add_option("-t", "--tables",
+                  dest="tables",
+                  help="Num of tables",
+                  default=4, type="int", action="store")
+parser.add_option("-r", "--rows",
+                  dest="rows",
+                  help="Num of rows per table",
+                  default=100000, type="int", action="store")
+parser.add_option("-w", "--row_width",
+                  dest="row_width",
+                  help="Approximate bytes of a row in the dump",
+                  default=200, type="int", action="store")
+parser.add_option("-i", "--indexes",
+                  dest="indexes",
+                  help="Num of secondary indexes per table",
+                  default=1, type="int", action="store")
+parser.add_option("-1", "--single_row",
+                  dest="single_row",
+                  help="One row per INSERT, as mysqldump --skip-extended-insert",
+                  default=False,
+                  action="store_true")
+parser.add_option("-g", "--insert_size",
+                  dest="insert_size",
+                  help="Max size of an extended INSERT, as mysqldump --net-buffer-length",
+                  default="1M", type="string", action="store")
+parser.add_option("-s", "--seed",
+                  dest="seed",
+                  help="Seed of random values, to generate the same dump again",
+                  default=0, type="int", action="store")
+parser.add_option("-T", "--tpch",
+                  dest="tpch",
+                  help="Convert TPC-H data files (<table>.tbl[.<n>] of dbgen) under this dir instead of generating rows",
+                  default=None, type="string", action="store")
+parser.add_option("-D", "--ddl",
+                  dest="ddl",
+                  help="DDL of TPC-H tables for --tpch",
+                  default=os.path.join(current_file_dir, "..", "tpch", "innodb.ddl"),
+                  type="string", action="store")
+parser.add_option("-o", "--output",
+                  dest="output",
+                  help="Output dump file (stdout by default)",
+                  default=None, type="string", action="store")
+(options, args) = parser.parse_args()
+
+NUMERIC_TYPES = ['TINYINT', 'SMALLINT', 'MEDIUMINT', 'INT', 'INTEGER', 'BIGINT',
+                 'DECIMAL', 'NUMERIC', 'FLOAT', 'DOUBLE']
+# Width of a varchar column of generated tables
+PAD_COLUMN_WIDTH = 250
+
+def parse_size(size_str):
+    units = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+    size_str = str(size_str).strip().upper()
+    if len(size_str) and size_str[-1] in units:
+        return int(float(size_str[:-1]) * units[size_str[-1]])
+    return int(size_str)
+
+def escape_string(value):
+    """ Quote a string value the way mysqldump does """
+    value = value.replace('\\', '\\\\').replace("'", "\\'")
+    value = value.replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0')
+    return "'{}'".format(value)
+
+class Table:
+    """
+        Name, columns [(name, type)], primary key columns and secondary index
+        columns of a table.
+    """
+    def __init__(self, name, columns, primary_key):
+        self.name = name
+        self.columns = columns
+        self.primary_key = primary_key
+        non_key_columns = [name for name, _ in columns if name not in primary_key]
+        self.indexes = []
+        for idx in range(min(options.indexes, len(non_key_columns))):
+            self.indexes.append(non_key_columns[idx])
+
+    def is_numeric(self, col_idx):
+        col_type = self.columns[col_idx][1].upper()
+        return re.split(r'[\s(]', col_type)[0] in NUMERIC_TYPES
+
+    def create_table_stmt(self):
+        lines = ["  `{}` {}".format(name, col_type) for name, col_type in self.columns]
+        lines.append("  PRIMARY KEY ({})".format(",".join(["`{}`".format(c) for c in self.primary_key])))
+        for idx, column in enumerate(self.indexes):
+            lines.append("  KEY `idx_{}_{}` (`{}`)".format(self.name, idx + 1, column))
+        return "CREATE TABLE `{}` (\n{}\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n".format(
+            self.name, ",\n".join(lines))
+
+def parse_tpch_ddl(ddl_file):
+    """ Tables of TPC-H DDL in benchmark/tpch """
+    with open(ddl_file) as f_ddl:
+        ddl = f_ddl.read()
+    tables = []
+    for m in re.finditer(r'CREATE TABLE\s+(\w+)\s*\((.*?)\)\s*(ENGINE[^;]*)?;', ddl, re.S | re.I):
+        columns = []
+        primary_key = []
+        # split items at commas out of parentheses
+        items = []
+        depth = 0
+        item = ''
+        for ch in m.group(2):
+            if ch == ',' and depth == 0:
+                items.append(item.strip())
+                item = ''
+                continue
+            depth += {'(': 1, ')': -1}.get(ch, 0)
+            item += ch
+        items.append(item.strip())
+        for item in items:
+            if item.upper().startswith('PRIMARY KEY'):
+                primary_key = [c.strip() for c in item[item.index('(') + 1:item.rindex(')')].split(',')]
+            elif not item.upper().startswith(('FOREIGN KEY', 'KEY', 'INDEX', 'UNIQUE', 'CONSTRAINT')):
+                name, col_type = item.split(None, 1)
+                columns.append((name, ' '.join(col_type.split())))
+        tables.append(Table(m.group(1), columns, primary_key))
+    return tables
+
+def tpch_data_files(table):
+    """ <table>.tbl, or <table>.tbl.<n> ordered by n of chunked dbgen output """
+    path = os.path.join(options.tpch, "{}.tbl".format(table))
+    if os.path.exists(path):
+        return [path]
+    chunks = glob.glob("{}.*".format(path))
+    return sorted(chunks, key=lambda p: int(p.rsplit('.', 1)[1]))
+
+def tpch_rows(table):
+    for path in tpch_data_files(table.name):
+        with open(path) as f_tbl:
+            for line in f_tbl:
+                values = line.rstrip('\r\n').rstrip('|').split('|')
+                yield ",".join([v if table.is_numeric(i) else escape_string(v) for i, v in enumerate(values)])
+
+def synthetic_table(table_idx):
+    # id, k and varchar columns to make up the row width
+    pad_columns = max(1, (options.row_width + PAD_COLUMN_WIDTH - 1) // PAD_COLUMN_WIDTH)
+    columns = [('id', 'bigint NOT NULL'), ('k', 'int NOT NULL')]
+    for col_idx in range(pad_columns):
+        columns.append(('c{}'.format(col_idx + 1), 'varchar({}) DEFAULT NULL'.format(PAD_COLUMN_WIDTH)))
+    return Table("sbtest{}".format(table_idx + 1), columns, ['id'])
+
+def synthetic_rows(table, rng):
+    # Slice values out of a random pool, which is much faster than random chars
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -'\\\n"
+    pool = ''.join([rng.choice(alphabet) for _ in range(64 * 1024)])
+    pad_columns = len(table.columns) - 2
+    width = max(1, options.row_width // pad_columns - 4)
+    width = min(width, PAD_COLUMN_WIDTH)
+    for row_id in range(1, options.rows + 1):
+        values = [str(row_id), str(rng.randint(0, options.rows))]
+        for _ in range(pad_columns):
+            start = rng.randint(0, len(pool) - width)
+            values.append(escape_string(pool[start:start + width]))
+        yield ",".join(values)
+
+def write_table(f_out, table, rows):
+    insert_size = parse_size(options.insert_size)
+    f_out.write("\n--\n-- Table structure for table `{}`\n--\n\n".format(table.name))
+    f_out.write("DROP TABLE IF EXISTS `{}`;\n".format(table.name))
+    f_out.write(table.create_table_stmt())
+    f_out.write("\n--\n-- Dumping data for table `{}`\n--\n\n".format(table.name))
+    f_out.write("LOCK TABLES `{}` WRITE;\n".format(table.name))
+    f_out.write("/*!40000 ALTER TABLE `{}` DISABLE KEYS */;\n".format(table.name))
+    prefix = "INSERT INTO `{}` VALUES ".format(table.name)
+    stmt = []
+    stmt_size = len(prefix)
+    row_cnt = 0
+    for row in rows:
+        row_cnt += 1
+        if len(stmt) and (options.single_row or stmt_size + len(row) + 3 > insert_size):
+            f_out.write("{}{};\n".format(prefix, ",".join(stmt)))
+            stmt = []
+            stmt_size = len(prefix)
+        stmt.append("({})".format(row))
+        stmt_size += len(row) + 3
+    if len(stmt):
+        f_out.write("{}{};\n".format(prefix, ",".join(stmt)))
+    f_out.write("/*!40000 ALTER TABLE `{}` ENABLE KEYS */;\n".format(table.name))
+    f_out.write("UNLOCK TABLES;\n")
+    return row_cnt
+
+def write_dump(f_out):
+    f_out.write("-- MySQL dump 10.13  Distrib 8.0, generated by gen_dump.py\n\n")
+    f_out.write("/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;\n")
+    f_out.write("/*!40101 SET NAMES utf8mb4 */;\n")
+    f_out.write("/*!40014 SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS, UNIQUE_CHECKS=0 */;\n")
+    f_out.write("/*!40014 SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS=0 */;\n")
+    rng = random.Random(options.seed)
+    if options.tpch is not None:
+        tables = parse_tpch_ddl(options.ddl)
+        if not len(tables):
+            raise Exception("No table found in DDL file: {}".format(options.ddl))
+        for table in tables:
+            if not len(tpch_data_files(table.name)):
+                raise Exception("No data file of table {} under {}".format(table.name, options.tpch))
+            row_cnt = write_table(f_out, table, tpch_rows(table))
+            print("Table {}: {} rows".format(table.name, row_cnt), file=sys.stderr)
+    else:
+        for table_idx in range(options.tables):
+            table = synthetic_table(table_idx)
+            row_cnt = write_table(f_out, table, synthetic_rows(table, rng))
+            print("Table {}: {} rows".format(table.name, row_cnt), file=sys.stderr)
+    f_out.write("\n/*!40014 SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS */;\n")
+    f_out.write("/*!40014 SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS */;\n")
+    f_out.write("/*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;\n\n")
+    f_out.write("-- Dump completed\n")
+
+if options.output is None:
+    write_dump(sys.stdout)
+else:
+    with open(options.output, "w") as f_out:
+        write_dump(f_out)
+    print("Dump is written to {} ({} bytes)".format(options.output, os.path.getsize(options.output)), file=sys.stderr)
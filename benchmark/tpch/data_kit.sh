@@ -19,6 +19,8 @@ PARAMETERs:\n\
     -g | --generator=<DBGEN_BINARY_DIR>: Specify directory of dbgen binary\n\
     -s | --scale-factor=<SCALE_FACTOR>: Specify value for scale factor [0.001, inf)\n\
     -c | --chunks=<CHUNKS>: Specify value for chunks, same as <PARALLEL_THREADS> by default\n\
+    --cache=<CACHE_DIR>: Specify directory to cache generated data by scale factor, chunks and checksum of dbgen, reused by generate\n\
+    --cache-size=<SIZE_GB>: Specify size budget of cache, least recently used data is evicted beyond it, unlimited by default\n\
     -H | --host=<hostname>: Specify hostname/ip of mysql database server to load data, localhost by default\n\
     -P | --port=<PORT>: Specify port on which mysql server run\n\
     -S | --socket=<socket_file>: Specify mysqld socket file to connect\n\
@@ -29,14 +31,21 @@ PARAMETERs:\n\
     --ddl=<DDL_SQL>: Specify path for DDL SQL commands\n\
     --table=<TABLE_NAME>: Load data for a single table\n\
     --sql=<SQL_FILE>: Specify path for SQL commands\n\
+    --stream: Generate and load data at the same time through named pipes in command all, no data file is written\n\
+    --compare=\"<DDL_SQL> ...\": Specify list of DDL to compare in command compare, e.g. \"innodb.ddl columnar.ddl\"\n\
+    --query-args=\"<ARGS>\": Specify extra arguments of run_queries.py, e.g. \"-n 4 -r 3 -o result.json\"\n\
     -h | --help: Print this help message\n\n\
 COMMAND:\n\
     generate: Generate data for TPC-H\n\
     prepare: Prepare schema for TPC-H\n\
     load: Load data for TPC-H\n\
+    stream: Generate data and load it at the same time through named pipes, without data files\n\
     verify: Verify prepared schema and count of tables\n\
     exec_sql: execute command in a specified SQL file\n\
-    all: generate, prepare, load and verify in one shot"
+    query: Run power and throughput tests of the 22 TPC-H queries\n\
+    compare: Prepare and load a database for each DDL of --compare, and run queries against them side by side\n\
+    cache: List data cached under --cache\n\
+    all: generate, prepare, load and verify in one shot, generate and load at the same time with --stream"
 }
 
 uid=$(get_uid)
@@ -148,6 +157,22 @@ while [[ ${OPT_END} -eq 0 ]]; do
         CHUNKS=$(get_key_value "$1")
         shift;;
 
+    --cache)
+        shift
+        CACHE_DIR=$(get_key_value "$1")
+        shift;;
+    --cache=*)
+        CACHE_DIR=$(get_key_value "$1")
+        shift;;
+
+    --cache-size)
+        shift
+        CACHE_SIZE=$(get_key_value "$1")
+        shift;;
+    --cache-size=*)
+        CACHE_SIZE=$(get_key_value "$1")
+        shift;;
+
     --table)
         shift
         TABLE_NAME=$(get_key_value "$1")
@@ -160,6 +185,10 @@ while [[ ${OPT_END} -eq 0 ]]; do
     #    shift
     #    SAVE_ON_LOAD=1;;
 
+    --stream)
+        shift
+        STREAM=1;;
+
     --sql)
         shift
         SQL_FILE=$(get_key_value "$1")
@@ -168,6 +197,22 @@ while [[ ${OPT_END} -eq 0 ]]; do
         SQL_FILE=$(get_key_value "$1")
         shift;;
 
+    --compare)
+        shift
+        COMPARE_DDLS=$(get_key_value "$1")
+        shift;;
+    --compare=*)
+        COMPARE_DDLS=$(get_key_value "$1")
+        shift;;
+
+    --query-args)
+        shift
+        QUERY_ARGS=$(get_key_value "$1")
+        shift;;
+    --query-args=*)
+        QUERY_ARGS=$(get_key_value "$1")
+        shift;;
+
     -h|--help)
         usage
         exit 0;;
@@ -189,10 +234,9 @@ function generate_chunk() {
     [[ -z ${FLAG_FILE} ]] || echo 1 > ${FLAG_FILE}
 }
 
-function generate_data() {
+function check_generator() {
     [[ ! -z ${DBGEN_PATH} ]] || fatal_error "Missing parameter for --generator"
     [[ -x ${DBGEN_PATH}/dbgen ]] || fatal_error "${DBGEN_PATH}/dbgen isn't available"
-    [[ ! -z ${DATA_DIR} ]] || fatal_error "Missing parameter for --data"
 
     [[ ! -z ${SCALE_FACTOR} ]] || fatal_error "Missing parameter value for scale factor!"
     [[ `echo "${SCALE_FACTOR} < 0.001" | bc` -eq 1 ]] && fatal_error "Invalid value (${SCALE_FACTOR}) for scale factor!"
@@ -204,10 +248,115 @@ function generate_data() {
     if [[ -z ${CHUNKS} ]] || [[ ${CHUNKS} -lt 1 ]]; then CHUNKS=1; fi
     if [[ -z ${PARALLEL} ]] || [[ ${PARALLEL} -lt 1 ]]; then PARALLEL=1; fi
     if [[ ${PARALLEL} -gt ${CHUNKS} ]]; then PARALLEL=${CHUNKS}; fi
+}
+
+function dataset_name() {
+    # sets DBGEN_SUM and DATASET_NAME, call it directly rather than in a subshell
+    DBGEN_SUM=`cat ${DBGEN_PATH}/dbgen ${DBGEN_PATH}/dists.dss | md5sum | awk '{print $1}'`
+    DATASET_NAME=sf${SCALE_FACTOR}_chunks${CHUNKS}_${DBGEN_SUM:0:16}
+}
+
+function link_file() {
+    # reflink where the filesystem supports it, hard link within a filesystem, copy otherwise
+    # a failed reflink leaves an empty file behind
+    cp --reflink=always $1 $2 >/dev/null 2>&1 || { rm -f $2; ln $1 $2 >/dev/null 2>&1; } || cp $1 $2
+}
+
+function evict_datasets() {
+    KEEP_DATASET=$1
+    [[ ! -z ${CACHE_SIZE} ]] || return 0
+    BUDGET_KB=`awk -v size=${CACHE_SIZE} 'BEGIN { printf "%d", size * 1024 * 1024 }'`
+
+    # least recently used first, never the one just used
+    for dataset in `ls -tr ${CACHE_DIR}/*/last_used 2>/dev/null | xargs -r -n 1 dirname`; do
+        [[ `du -sk ${CACHE_DIR} | awk '{print $1}'` -gt ${BUDGET_KB} ]] || break
+        [[ $(basename ${dataset}) != ${KEEP_DATASET} ]] || continue
+        rm -rf ${dataset}
+        log_info "Evicted data $(basename ${dataset}) from cache ${CACHE_DIR}"
+    done
+}
+
+function restore_dataset() {
+    dataset_name
+    DATASET=${CACHE_DIR}/${DATASET_NAME}
+    (
+        flock 9
+        [[ -f ${DATASET}/rows ]] || exit 1
+        for tbl_file in `awk '{print $1}' ${DATASET}/rows`; do
+            if ! link_file ${DATASET}/${tbl_file} ${DATA_DIR}/${tbl_file}; then
+                log_warn "Failed to reuse ${DATASET}/${tbl_file}, data will be generated"
+                rm -f ${DATA_DIR}/*.tbl*
+                exit 1
+            fi
+        done
+        cp ${DATASET}/rows ${DATA_DIR}/.rows
+        touch ${DATASET}/last_used
+    ) 9>${CACHE_DIR}/.lock
+}
+
+function store_dataset() {
+    dataset_name
+    DATASET=${CACHE_DIR}/${DATASET_NAME}
+
+    # counted once here, verify uses the counts instead of reading all files again
+    log_info "Counting rows of data files under ${DATA_DIR} ..."
+    (cd ${DATA_DIR} && ls *.tbl* | xargs -P ${PARALLEL} -n 1 wc -l | awk '{print $2, $1}' | sort) > ${DATA_DIR}/.rows
+
+    (
+        flock 9
+        if [[ ! -f ${DATASET}/rows ]]; then
+            # a dataset is complete once it is renamed to its name
+            TMP_DATASET=${CACHE_DIR}/.tmp_${DATASET_NAME}
+            rm -rf ${TMP_DATASET}
+            mkdir ${TMP_DATASET}
+            for tbl_file in `awk '{print $1}' ${DATA_DIR}/.rows`; do
+                if ! link_file ${DATA_DIR}/${tbl_file} ${TMP_DATASET}/${tbl_file}; then
+                    rm -rf ${TMP_DATASET}
+                    exit 1
+                fi
+            done
+            echo "scale_factor=${SCALE_FACTOR} chunks=${CHUNKS} dbgen_md5=${DBGEN_SUM}" > ${TMP_DATASET}/meta
+            cp ${DATA_DIR}/.rows ${TMP_DATASET}/rows
+            rm -rf ${DATASET}
+            mv ${TMP_DATASET} ${DATASET}
+        fi
+        touch ${DATASET}/last_used
+        evict_datasets ${DATASET_NAME}
+    ) 9>${CACHE_DIR}/.lock || log_warn "Failed to store data into cache ${DATASET}"
+    log_info "Data is cached as ${DATASET}"
+}
+
+function list_cache() {
+    [[ -d ${CACHE_DIR} ]] || fatal_error "Missing parameter for --cache"
+
+    echo "+----------------------------------------+-----------+------------+---------------------+"
+    echo "| DATA                                   | SIZE (MB) | ROWS       | LAST_USED           |"
+    echo "+----------------------------------------+-----------+------------+---------------------+"
+    for dataset in `ls -t ${CACHE_DIR}/*/last_used 2>/dev/null | xargs -r -n 1 dirname`; do
+        size_mb=`du -sm ${dataset} | awk '{print $1}'`
+        rows=`awk '{ n += $2 } END { print n + 0 }' ${dataset}/rows`
+        last_used=`date -r ${dataset}/last_used "+%Y-%m-%d %H:%M:%S"`
+        echo "| $(basename ${dataset}) | ${size_mb} | ${rows} | ${last_used} |"
+    done
+    echo "+----------------------------------------+-----------+------------+---------------------+"
+}
+
+function generate_data() {
+    check_generator
+    [[ ! -z ${DATA_DIR} ]] || fatal_error "Missing parameter for --data"
 
     [[ -d ${DATA_DIR} ]] && log_warn "Data directory(${DATA_DIR}) exists, it will be recreated!" && rm -r ${DATA_DIR}
     mkdir ${DATA_DIR}
 
+    if [[ ! -z ${CACHE_DIR} ]]; then
+        mkdir -p ${CACHE_DIR}
+        CACHE_DIR=$(cd ${CACHE_DIR} && pwd -P)
+        if restore_dataset; then
+            log_info "$SIZE $UNIT data for TPC-H is reused from cache ${DATASET} under $DATA_DIR/"
+            return
+        fi
+    fi
+
     TBL_FILES=""
     cd ${DBGEN_PATH}
     if [[ ${PARALLEL} -gt 1 ]]; then
@@ -253,6 +402,8 @@ function generate_data() {
 
     log_info "$SIZE $UNIT data for TPC-H is generated under $DATA_DIR/"
     cd ${BASE}
+
+    [[ -z ${CACHE_DIR} ]] || store_dataset
 }
 
 function set_mysql_cmd() {
@@ -295,65 +446,60 @@ function prepare_schema() {
 function load_data_file() {
     [[ ! -z $1 ]] || fatal_error "Missing value for table_name"
     TBL_NAME=$1
+    CHUNK=""
     [[ -z $2 ]] || [[ $2 -le 0 ]] || CHUNK=$2
     TBL_PATH=${DATA_DIR}/${TBL_NAME}.tbl
     [[ -z ${CHUNK} ]] || TBL_PATH=${TBL_PATH}.${CHUNK}
+    # a named pipe written by dbgen in stream mode
+    [[ -z $3 ]] || TBL_PATH=$3
+
+    [[ -f ${TBL_PATH} ]] || [[ -p ${TBL_PATH} ]] || fatal_error "Can't find file ${TBL_PATH} to load!"
+    LOAD_START=`date +%s%3N`
+    if ! ${MYSQL_CMD} -D ${DATABASE} -e "${LOAD_SESSION_SQL}LOAD DATA LOCAL INFILE '${TBL_PATH}' INTO TABLE ${TBL_NAME} FIELDS TERMINATED BY '|';"; then
+        log_error "Failed to load data for ${DATABASE}.${TBL_NAME} from ${TBL_PATH}"
+        return 1
+    fi
 
-    [[ -f ${TBL_PATH} ]] || fatal_error "Can't find file ${TBL_PATH} to load!"
-    ${MYSQL_CMD} -D ${DATABASE} -e "LOAD DATA LOCAL INFILE '${TBL_PATH}' INTO TABLE ${TBL_NAME} FIELDS TERMINATED BY '|';"
+    LOAD_TIME=`expr $(date +%s%3N) - ${LOAD_START}`
+    [[ -z ${TIMING_FILE} ]] || echo "${TBL_NAME} ${CHUNK:-0} ${LOAD_TIME}" >> ${TIMING_FILE}
 
     if [[ ! -z ${CHUNK} ]]; then
-        log_info "Loaded data part ${CHUNK} for ${DATABASE}.${TBL_NAME} from ${TBL_PATH} ..."
+        log_info "Loaded data part ${CHUNK} for ${DATABASE}.${TBL_NAME} from ${TBL_PATH} in ${LOAD_TIME} ms ..."
     else
-        log_info "Loaded data for ${DATABASE}.${TBL_NAME} from ${TBL_PATH} ..."
+        log_info "Loaded data for ${DATABASE}.${TBL_NAME} from ${TBL_PATH} in ${LOAD_TIME} ms ..."
     fi
 }
 
-function load_data_worker() {
-    chunk=$1
-    tbl_name=$2
-    FLAG_FILE=$3
+function next_load_item() {
+    # take the next (table, chunk) of the queue, the counter is shared by all workers
+    (
+        flock 9
+        item=`cat ${QUEUE_FILE}.next`
+        echo `expr ${item} + 1` > ${QUEUE_FILE}.next
+        sed -n "${item}p" ${QUEUE_FILE}
+    ) 9>${QUEUE_FILE}.lock
+}
 
-    [[ -z ${FLAG_FILE} ]] || echo 0 > ${FLAG_FILE}
-    while [[ ${chunk} -le ${CHUNKS} ]]; do
-        load_data_file ${tbl_name} ${chunk}
-        chunk=`expr ${chunk} + ${PARALLEL}`
+function load_data_worker() {
+    result=0
+    while true; do
+        item=`next_load_item`
+        [[ ! -z ${item} ]] || break
+        # a missing file is a fatal error of load_data_file, keep it in this worker
+        (load_data_file ${item}) || result=1
     done
-
-    [[ -z ${FLAG_FILE} ]] || echo 1 > ${FLAG_FILE}
+    return ${result}
 }
 
-function load_table_data() {
-    tbl_name=$1
-    if [[ ${tbl_name} == "region" ]] || [[ ${tbl_name} == "nation" ]]; then
-        load_data_file ${tbl_name}
-    elif [[ ${PARALLEL} -gt 1 ]]; then
-        PREFIX="${uid}_${DATABASE}_LOAD_${CHUNKS}_${PARALLEL}_${tbl_name}"
-        for thd in `seq 1 ${PARALLEL}`; do
-            load_data_worker ${thd} ${tbl_name} /dev/shm/${PREFIX}_${thd} &
-        done
-
-        log_info "Waiting all ${PARALLEL} threads for ${DATABASE}.${tbl_name} finish ..."
-        for thd in `seq 1 ${PARALLEL}`; do
-            while [[ `cat /dev/shm/${PREFIX}_${thd}` -eq 0 ]]; do
-                sleep 1
-            done
-            rm /dev/shm/${PREFIX}_${thd}
-        done
-
-        log_info "All ${PARALLEL} threads for ${DATABASE}.${tbl_name} finish"
-
-        #if [[ ${SAVE_ON_LOAD} -eq 1 ]]; then
-        #    ${MYSQL_CMD} -e "SET GLOBAL innodb_imci_save_checkpoint = ON;"
-        #    log_info "imci checkpoint is saved!"
-        #fi
-    elif [[ ${CHUNKS} -gt 1 ]]; then
-        for chunk in `seq 1 ${CHUNKS}`; do
-            load_data_file ${tbl_name} ${chunk}
-        done
-    else
-        load_data_file ${tbl_name}
-    fi
+function report_load_timing() {
+    echo "+------------+--------+------------+----------+---------------+"
+    echo "| TABLE_NAME | CHUNKS | TOTAL (ms) | MAX (ms) | SLOWEST_CHUNK |"
+    echo "+------------+--------+------------+----------+---------------+"
+    for tbl_name in ${LOAD_TABLES}; do
+        awk -v tbl=${tbl_name} '$1 == tbl { n++; total += $3; if ($3 >= max) { max = $3; chunk = $2 } }
+            END { if (n) printf "| %s | %d | %d | %d | %d |\n", tbl, n, total, max, chunk }' ${TIMING_FILE}
+    done
+    echo "+------------+--------+------------+----------+---------------+"
 }
 
 function load_data() {
@@ -362,26 +508,163 @@ function load_data() {
 
     if [[ -z ${CHUNKS} ]] || [[ ${CHUNKS} -lt 1 ]]; then CHUNKS=1; fi
     if [[ -z ${PARALLEL} ]] || [[ ${PARALLEL} -lt 1 ]]; then PARALLEL=1; fi
-    if [[ ${PARALLEL} -gt ${CHUNKS} ]]; then PARALLEL=${CHUNKS}; fi
 
-    if [[ -z ${TABLE_NAME} ]]; then
-        task_info="loading data for database ${DATABASE}"
-        if [[ ${PARALLEL} -gt 1 ]]; then
-            task_info="${task_info} with ${CHUNKS} chunks in ${PARALLEL} threads"
-        elif [[ ${CHUNKS} -gt 1 ]]; then
-            task_info="${task_info} with ${CHUNKS} chunks in sequence"
+    # largest tables first, so that the small ones fill up the tail
+    LOAD_TABLES="lineitem orders partsupp part customer supplier nation region"
+    [[ -z ${TABLE_NAME} ]] || LOAD_TABLES=${TABLE_NAME}
+
+    PREFIX="${uid}_${DATABASE}_LOAD_${CHUNKS}_${PARALLEL}"
+    QUEUE_FILE=/dev/shm/${PREFIX}.queue
+    TIMING_FILE=/dev/shm/${PREFIX}.timing
+    > ${QUEUE_FILE}
+    > ${TIMING_FILE}
+    for tbl_name in ${LOAD_TABLES}; do
+        if [[ ${tbl_name} == "region" ]] || [[ ${tbl_name} == "nation" ]] || [[ ${CHUNKS} -le 1 ]]; then
+            echo "${tbl_name} 0" >> ${QUEUE_FILE}
+        else
+            for chunk in `seq 1 ${CHUNKS}`; do
+                echo "${tbl_name} ${chunk}" >> ${QUEUE_FILE}
+            done
         fi
+    done
+    echo 1 > ${QUEUE_FILE}.next
+
+    ITEMS=`wc -l < ${QUEUE_FILE}`
+    if [[ ${PARALLEL} -gt ${ITEMS} ]]; then PARALLEL=${ITEMS}; fi
+    # tables are loaded at the same time, in no particular order
+    LOAD_SESSION_SQL="SET foreign_key_checks = 0; "
+
+    task_info="loading data for database ${DATABASE}"
+    [[ -z ${TABLE_NAME} ]] || task_info="loading data for single table ${DATABASE}.${TABLE_NAME}"
+    task_info="${task_info} with ${ITEMS} chunks in ${PARALLEL} threads"
+
+    log_info "Begin ${task_info} ..."
+    WORKER_PIDS=""
+    for thd in `seq 1 ${PARALLEL}`; do
+        load_data_worker &
+        WORKER_PIDS="${WORKER_PIDS} $!"
+    done
 
-        log_info "Begin ${task_info} ..."
-        for tbl_name in region nation part supplier partsupp customer orders lineitem; do
-            load_table_data ${tbl_name}
-        done
-        log_info "Finish ${task_info}"
-    else
-        log_info "Begin loading data for single table ${DATABASE}.${TABLE_NAME} ..."
-        load_table_data ${TABLE_NAME}
-        log_info "Finish loading data for single table ${DATABASE}.${TABLE_NAME}"
+    failed=0
+    for pid in ${WORKER_PIDS}; do
+        wait ${pid} || failed=1
+    done
+
+    report_load_timing
+    rm ${QUEUE_FILE} ${QUEUE_FILE}.next ${QUEUE_FILE}.lock ${TIMING_FILE}
+    [[ ${failed} -eq 0 ]] || fatal_error "Failed ${task_info}"
+    log_info "Finish ${task_info}"
+}
+
+function stream_chunk() {
+    chunk=$1
+    FIFO_DIR=$2/${chunk}
+
+    DBGEN_ARGS="-f -s ${SCALE_FACTOR}"
+    SUFFIX=""
+    if [[ ${CHUNKS} -gt 1 ]]; then
+        DBGEN_ARGS="${DBGEN_ARGS} -C ${CHUNKS} -S ${chunk}"
+        SUFFIX=".${chunk}"
     fi
+    TBL_NAMES="part partsupp supplier customer orders lineitem"
+    # region and nation are generated by every chunk, load them with the first one
+    [[ ${chunk} -ne 1 ]] || TBL_NAMES="region nation ${TBL_NAMES}"
+
+    mkdir -p ${FIFO_DIR}
+    for tbl_name in ${TBL_NAMES}; do
+        TBL_FILE=${tbl_name}.tbl${SUFFIX}
+        [[ ${tbl_name} != "region" ]] && [[ ${tbl_name} != "nation" ]] || TBL_FILE=${tbl_name}.tbl
+        mkfifo ${FIFO_DIR}/${TBL_FILE}
+    done
+    # dbgen writes into the pipes as they are read by LOAD DATA
+    (cd ${DBGEN_PATH} && DSS_PATH=${FIFO_DIR} DSS_CONFIG=${DBGEN_PATH} exec ./dbgen ${DBGEN_ARGS} >/dev/null 2>&1) &
+    DBGEN_PID=$!
+
+    LOADER_PIDS=""
+    for tbl_name in ${TBL_NAMES}; do
+        TBL_CHUNK=0
+        [[ ${CHUNKS} -le 1 ]] || TBL_CHUNK=${chunk}
+        TBL_FILE=${tbl_name}.tbl${SUFFIX}
+        if [[ ${tbl_name} == "region" ]] || [[ ${tbl_name} == "nation" ]]; then
+            TBL_CHUNK=0
+            TBL_FILE=${tbl_name}.tbl
+        fi
+        # dbgen blocks on the pipe of a failed loader, stop it
+        (load_data_file ${tbl_name} ${TBL_CHUNK} ${FIFO_DIR}/${TBL_FILE} || (kill ${DBGEN_PID} >/dev/null 2>&1; exit 1)) &
+        LOADER_PIDS="${LOADER_PIDS} $!"
+    done
+
+    failed=0
+    wait ${DBGEN_PID} || failed=1
+    # loaders of pipes never opened by a failed dbgen are released by an end of file
+    for pid in ${LOADER_PIDS}; do
+        while kill -0 ${pid} >/dev/null 2>&1; do
+            if [[ ${failed} -ne 0 ]]; then
+                for fifo in ${FIFO_DIR}/*.tbl*; do
+                    [[ ! -p ${fifo} ]] || (exec 3<>${fifo})
+                done
+            fi
+            sleep 1
+        done
+        wait ${pid} || failed=1
+    done
+    rm -r ${FIFO_DIR}
+    return ${failed}
+}
+
+function stream_worker() {
+    chunk=$1
+    FIFO_ROOT=$2
+    FLAG_FILE=$3
+
+    [[ -z ${FLAG_FILE} ]] || echo 0 > ${FLAG_FILE}
+    result=1
+    while [[ ${chunk} -le ${CHUNKS} ]]; do
+        if ! stream_chunk ${chunk} ${FIFO_ROOT}; then
+            log_error "Failed to generate and load chunk ${chunk}"
+            result=2
+        fi
+        chunk=`expr ${chunk} + ${PARALLEL}`
+    done
+
+    [[ -z ${FLAG_FILE} ]] || echo ${result} > ${FLAG_FILE}
+}
+
+function stream_data() {
+    check_generator
+    [[ ! -z ${DATABASE} ]] || fatal_error "Missing parameter for --database"
+
+    # tables of a chunk are loaded at the same time, in no particular order
+    LOAD_SESSION_SQL="SET foreign_key_checks = 0; "
+    # dbgen opens its output files one table at a time, nation/region last, so
+    # LOAD DATA LOCAL of a pipe waits until dbgen of the chunk gets to its table,
+    # up to generating the whole chunk for nation/region. The server gives up
+    # waiting for file data after net_read_timeout (30s by default), wait as
+    # long as it allows instead.
+    # A dbgen per table would open every pipe at once, but costs every dbgen
+    # process its own 300MB text pool and generates orders and parts twice.
+    LOAD_SESSION_SQL="${LOAD_SESSION_SQL}SET SESSION net_read_timeout = 31536000; "
+    FIFO_ROOT=`mktemp -d /tmp/dbgen_stream_${uid}_XXXXXX`
+    PREFIX="${uid}_${DATABASE}_STREAM_${CHUNKS}_${PARALLEL}"
+    task_info="generating and loading ${SIZE} ${UNIT} data for database ${DATABASE} with ${CHUNKS} chunks in ${PARALLEL} threads"
+
+    log_info "Begin ${task_info} ..."
+    for thd in `seq 1 ${PARALLEL}`; do
+        stream_worker ${thd} ${FIFO_ROOT} /dev/shm/${PREFIX}_${thd} &
+    done
+
+    failed=0
+    for thd in `seq 1 ${PARALLEL}`; do
+        while [[ `cat /dev/shm/${PREFIX}_${thd}` -eq 0 ]]; do
+            sleep 1
+        done
+        [[ `cat /dev/shm/${PREFIX}_${thd}` -eq 1 ]] || failed=1
+        rm /dev/shm/${PREFIX}_${thd}
+    done
+    rm -r ${FIFO_ROOT}
+
+    [[ ${failed} -eq 0 ]] || fatal_error "Failed ${task_info}"
+    log_info "Finish ${task_info}"
 }
 
 function verify() {
@@ -401,7 +684,11 @@ function verify() {
         echo "+------------+--------------+-------------------+"
         for tbl_name in region nation part supplier partsupp customer orders lineitem; do
             query_count=`${MYSQL_CMD} -D ${DATABASE} -N -e "SELECT COUNT(*) AS ${tbl_name}_count FROM ${tbl_name};" 2>/dev/null`
-            data_count=`wc -l ${DATA_DIR}/${tbl_name}.tbl* | tail -n 1 | awk '{print $1}'`
+            if [[ -f ${DATA_DIR}/.rows ]]; then
+                data_count=`awk -v tbl=${tbl_name} 'index($1, tbl ".tbl") == 1 { n += $2 } END { print n + 0 }' ${DATA_DIR}/.rows`
+            else
+                data_count=`wc -l ${DATA_DIR}/${tbl_name}.tbl* | tail -n 1 | awk '{print $1}'`
+            fi
             [[ ${query_count} -eq ${data_count} ]] || stat="  \033[0;31m!!!not match\033[0m"
             echo -e "|${tbl_name} | ${query_count}  | ${data_count} |${stat} "
         done
@@ -426,6 +713,50 @@ function exec_sql() {
   fi
 }
 
+function run_queries() {
+    TARGETS=$1
+    PYTHON=$(which python3 2>/dev/null || which python)
+    [[ ! -z ${PYTHON} ]] || fatal_error "No python is available"
+    [[ ! -z ${SCALE_FACTOR} ]] || fatal_error "Missing parameter value for scale factor!"
+
+    log_info "Running TPC-H queries against ${TARGETS} ..."
+    ${PYTHON} ${BASE}/run_queries.py -c "${MYSQL_CMD}" -d ${TARGETS} -s ${SCALE_FACTOR} ${QUERY_ARGS} || \
+        fatal_error "Failed to run TPC-H queries against ${TARGETS}"
+    log_info "Finish running TPC-H queries against ${TARGETS}"
+}
+
+function compare_schemas() {
+    [[ ! -z ${DATABASE} ]] || fatal_error "Missing parameter for --database"
+    [[ ! -z ${COMPARE_DDLS} ]] || fatal_error "Missing parameter for --compare"
+
+    # data files are generated once and loaded for every DDL, unless streamed
+    if [[ ${STREAM} -ne 1 ]] && [[ ! -d ${DATA_DIR} ]]; then
+        generate_data
+    fi
+
+    DATABASE_PREFIX=${DATABASE}
+    TARGETS=""
+    for ddl in ${COMPARE_DDLS}; do
+        [[ -f ${ddl} ]] || ddl=${BASE}/${ddl}
+        [[ -f ${ddl} ]] || fatal_error "Invalid parameter value for --compare, DDL file ${ddl} isn't available"
+        DDL_SQL=${ddl}
+        DDL_NAME=$(basename ${ddl} .ddl)
+        DATABASE=${DATABASE_PREFIX}_${DDL_NAME}
+
+        log_info "Preparing database ${DATABASE} with ${DDL_SQL} ..."
+        prepare_schema
+        if [[ ${STREAM} -eq 1 ]]; then
+            stream_data
+        else
+            load_data
+        fi
+        TARGETS="${TARGETS},${DDL_NAME}=${DATABASE}"
+    done
+    DATABASE=${DATABASE_PREFIX}
+
+    run_queries ${TARGETS#,}
+}
+
 case "$1" in
     "generate")
         generate_data
@@ -438,6 +769,10 @@ case "$1" in
         set_mysql_cmd
         load_data
         ;;
+    "stream")
+        set_mysql_cmd
+        stream_data
+        ;;
     "verify")
         set_mysql_cmd
         verify
@@ -446,11 +781,29 @@ case "$1" in
         set_mysql_cmd
         exec_sql
         ;;
-    "all")
-        generate_data
+    "query")
+        [[ ! -z ${DATABASE} ]] || fatal_error "Missing parameter for --database"
         set_mysql_cmd
-        prepare_schema
-        load_data
+        run_queries ${DATABASE}
+        ;;
+    "compare")
+        set_mysql_cmd
+        compare_schemas
+        ;;
+    "cache")
+        list_cache
+        ;;
+    "all")
+        if [[ ${STREAM} -eq 1 ]]; then
+            set_mysql_cmd
+            prepare_schema
+            stream_data
+        else
+            generate_data
+            set_mysql_cmd
+            prepare_schema
+            load_data
+        fi
         verify
         ;;
     *)
@@ -0,0 +1,543 @@
+#!/usr/bin/python
+#coding:utf-8
+
+# TPC-H query runner: power and throughput tests of the 22 queries against one
+# or more databases loaded by data_kit.sh, e.g. with different DDLs side by side
+
+from __future__ import print_function
+
+from optparse import OptionParser
+import json
+import math
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+current_file_dir = os.path.dirname(os.path.abspath(__file__))
+
+parser = OptionParser()
+parser.add_option("-c", "--mysql_cmd",
+                  dest="mysql_cmd",
+                  help="Command line of mysql client with connection args, e.g. \"mysql -uroot -S /tmp/mysql.sock\"",
+                  default="mysql", type="string", action="store")
+parser.add_option("-d", "--databases",
+                  dest="databases",
+                  help="Databases to run queries against, comma separated [<label>=]<database>",
+                  default=None, type="string", action="store")
+parser.add_option("-s", "--scale_factor",
+                  dest="scale_factor",
+                  help="Scale factor of loaded data",
+                  default=1, type="float", action="store")
+parser.add_option("-n", "--streams",
+                  dest="streams",
+                  help="Num of concurrent query streams of throughput test, 0 to run power test only",
+                  default=2, type="int", action="store")
+parser.add_option("-r", "--repeats",
+                  dest="repeats",
+                  help="Num of warm runs of each query after the cold one in power test",
+                  default=2, type="int", action="store")
+parser.add_option("-q", "--queries",
+                  dest="queries",
+                  help="Run these queries only, comma separated numbers, all 22 by default",
+                  default=None, type="string", action="store")
+parser.add_option("-e", "--seed",
+                  dest="seed",
+                  help="Seed of substitution parameters and stream orders, to run the same queries again",
+                  default=0, type="int", action="store")
+parser.add_option("-i", "--init_sql",
+                  dest="init_sql",
+                  help="SQL run before each query, e.g. \"SET use_imci_engine = FORCED\"",
+                  default="", type="string", action="store")
+parser.add_option("-T", "--timeout",
+                  dest="timeout",
+                  help="Max seconds of a query (max_execution_time), 0 for no limit",
+                  default=0, type="int", action="store")
+parser.add_option("-D", "--dists",
+                  dest="dists",
+                  help="dists.dss of dbgen for values of substitution parameters",
+                  default=os.path.join(current_file_dir, "dists.dss"),
+                  type="string", action="store")
+parser.add_option("-o", "--output",
+                  dest="output",
+                  help="JSON file of results",
+                  default=None, type="string", action="store")
+(options, args) = parser.parse_args()
+
+#
+# Query templates and substitution parameters
+#
+QUERIES = {
+    1: """
+select l_returnflag, l_linestatus, sum(l_quantity) as sum_qty, sum(l_extendedprice) as sum_base_price,
+       sum(l_extendedprice * (1 - l_discount)) as sum_disc_price,
+       sum(l_extendedprice * (1 - l_discount) * (1 + l_tax)) as sum_charge,
+       avg(l_quantity) as avg_qty, avg(l_extendedprice) as avg_price, avg(l_discount) as avg_disc,
+       count(*) as count_order
+from lineitem
+where l_shipdate <= date '1998-12-01' - interval {DELTA} day
+group by l_returnflag, l_linestatus
+order by l_returnflag, l_linestatus;""",
+    2: """
+select s_acctbal, s_name, n_name, p_partkey, p_mfgr, s_address, s_phone, s_comment
+from part, supplier, partsupp, nation, region
+where p_partkey = ps_partkey and s_suppkey = ps_suppkey and p_size = {SIZE} and p_type like '%{TYPE}'
+  and s_nationkey = n_nationkey and n_regionkey = r_regionkey and r_name = '{REGION}'
+  and ps_supplycost = (select min(ps_supplycost) from partsupp, supplier, nation, region
+                       where p_partkey = ps_partkey and s_suppkey = ps_suppkey and s_nationkey = n_nationkey
+                         and n_regionkey = r_regionkey and r_name = '{REGION}')
+order by s_acctbal desc, n_name, s_name, p_partkey
+limit 100;""",
+    3: """
+select l_orderkey, sum(l_extendedprice * (1 - l_discount)) as revenue, o_orderdate, o_shippriority
+from customer, orders, lineitem
+where c_mktsegment = '{SEGMENT}' and c_custkey = o_custkey and l_orderkey = o_orderkey
+  and o_orderdate < date '{DATE}' and l_shipdate > date '{DATE}'
+group by l_orderkey, o_orderdate, o_shippriority
+order by revenue desc, o_orderdate
+limit 10;""",
+    4: """
+select o_orderpriority, count(*) as order_count
+from orders
+where o_orderdate >= date '{DATE}' and o_orderdate < date '{DATE}' + interval 3 month
+  and exists (select * from lineitem where l_orderkey = o_orderkey and l_commitdate < l_receiptdate)
+group by o_orderpriority
+order by o_orderpriority;""",
+    5: """
+select n_name, sum(l_extendedprice * (1 - l_discount)) as revenue
+from customer, orders, lineitem, supplier, nation, region
+where c_custkey = o_custkey and l_orderkey = o_orderkey and l_suppkey = s_suppkey
+  and c_nationkey = s_nationkey and s_nationkey = n_nationkey and n_regionkey = r_regionkey
+  and r_name = '{REGION}' and o_orderdate >= date '{DATE}' and o_orderdate < date '{DATE}' + interval 1 year
+group by n_name
+order by revenue desc;""",
+    6: """
+select sum(l_extendedprice * l_discount) as revenue
+from lineitem
+where l_shipdate >= date '{DATE}' and l_shipdate < date '{DATE}' + interval 1 year
+  and l_discount between {DISCOUNT} - 0.01 and {DISCOUNT} + 0.01 and l_quantity < {QUANTITY};""",
+    7: """
+select supp_nation, cust_nation, l_year, sum(volume) as revenue
+from (select n1.n_name as supp_nation, n2.n_name as cust_nation, extract(year from l_shipdate) as l_year,
+             l_extendedprice * (1 - l_discount) as volume
+      from supplier, lineitem, orders, customer, nation n1, nation n2
+      where s_suppkey = l_suppkey and o_orderkey = l_orderkey and c_custkey = o_custkey
+        and s_nationkey = n1.n_nationkey and c_nationkey = n2.n_nationkey
+        and ((n1.n_name = '{NATION1}' and n2.n_name = '{NATION2}')
+             or (n1.n_name = '{NATION2}' and n2.n_name = '{NATION1}'))
+        and l_shipdate between date '1995-01-01' and date '1996-12-31') as shipping
+group by supp_nation, cust_nation, l_year
+order by supp_nation, cust_nation, l_year;""",
+    8: """
+select o_year, sum(case when nation = '{NATION}' then volume else 0 end) / sum(volume) as mkt_share
+from (select extract(year from o_orderdate) as o_year, l_extendedprice * (1 - l_discount) as volume,
+             n2.n_name as nation
+      from part, supplier, lineitem, orders, customer, nation n1, nation n2, region
+      where p_partkey = l_partkey and s_suppkey = l_suppkey and l_orderkey = o_orderkey
+        and o_custkey = c_custkey and c_nationkey = n1.n_nationkey and n1.n_regionkey = r_regionkey
+        and r_name = '{REGION}' and s_nationkey = n2.n_nationkey
+        and o_orderdate between date '1995-01-01' and date '1996-12-31' and p_type = '{TYPE}') as all_nations
+group by o_year
+order by o_year;""",
+    9: """
+select nation, o_year, sum(amount) as sum_profit
+from (select n_name as nation, extract(year from o_orderdate) as o_year,
+             l_extendedprice * (1 - l_discount) - ps_supplycost * l_quantity as amount
+      from part, supplier, lineitem, partsupp, orders, nation
+      where s_suppkey = l_suppkey and ps_suppkey = l_suppkey and ps_partkey = l_partkey
+        and p_partkey = l_partkey and o_orderkey = l_orderkey and s_nationkey = n_nationkey
+        and p_name like '%{COLOR}%') as profit
+group by nation, o_year
+order by nation, o_year desc;""",
+    10: """
+select c_custkey, c_name, sum(l_extendedprice * (1 - l_discount)) as revenue, c_acctbal, n_name,
+       c_address, c_phone, c_comment
+from customer, orders, lineitem, nation
+where c_custkey = o_custkey and l_orderkey = o_orderkey
+  and o_orderdate >= date '{DATE}' and o_orderdate < date '{DATE}' + interval 3 month
+  and l_returnflag = 'R' and c_nationkey = n_nationkey
+group by c_custkey, c_name, c_acctbal, c_phone, n_name, c_address, c_comment
+order by revenue desc
+limit 20;""",
+    11: """
+select ps_partkey, sum(ps_supplycost * ps_availqty) as value
+from partsupp, supplier, nation
+where ps_suppkey = s_suppkey and s_nationkey = n_nationkey and n_name = '{NATION}'
+group by ps_partkey
+having sum(ps_supplycost * ps_availqty) > (select sum(ps_supplycost * ps_availqty) * {FRACTION}
+                                           from partsupp, supplier, nation
+                                           where ps_suppkey = s_suppkey and s_nationkey = n_nationkey
+                                             and n_name = '{NATION}')
+order by value desc;""",
+    12: """
+select l_shipmode,
+       sum(case when o_orderpriority = '1-URGENT' or o_orderpriority = '2-HIGH' then 1 else 0 end) as high_line_count,
+       sum(case when o_orderpriority <> '1-URGENT' and o_orderpriority <> '2-HIGH' then 1 else 0 end) as low_line_count
+from orders, lineitem
+where o_orderkey = l_orderkey and l_shipmode in ('{SHIPMODE1}', '{SHIPMODE2}')
+  and l_commitdate < l_receiptdate and l_shipdate < l_commitdate
+  and l_receiptdate >= date '{DATE}' and l_receiptdate < date '{DATE}' + interval 1 year
+group by l_shipmode
+order by l_shipmode;""",
+    13: """
+select c_count, count(*) as custdist
+from (select c_custkey, count(o_orderkey) as c_count
+      from customer left outer join orders on c_custkey = o_custkey and o_comment not like '%{WORD1}%{WORD2}%'
+      group by c_custkey) as c_orders
+group by c_count
+order by custdist desc, c_count desc;""",
+    14: """
+select 100.00 * sum(case when p_type like 'PROMO%' then l_extendedprice * (1 - l_discount) else 0 end)
+       / sum(l_extendedprice * (1 - l_discount)) as promo_revenue
+from lineitem, part
+where l_partkey = p_partkey and l_shipdate >= date '{DATE}' and l_shipdate < date '{DATE}' + interval 1 month;""",
+    # view of each stream, as streams of throughput test run at the same time
+    15: """
+create or replace view revenue{STREAM} (supplier_no, total_revenue) as
+select l_suppkey, sum(l_extendedprice * (1 - l_discount))
+from lineitem
+where l_shipdate >= date '{DATE}' and l_shipdate < date '{DATE}' + interval 3 month
+group by l_suppkey;
+select s_suppkey, s_name, s_address, s_phone, total_revenue
+from supplier, revenue{STREAM}
+where s_suppkey = supplier_no and total_revenue = (select max(total_revenue) from revenue{STREAM})
+order by s_suppkey;
+drop view revenue{STREAM};""",
+    16: """
+select p_brand, p_type, p_size, count(distinct ps_suppkey) as supplier_cnt
+from partsupp, part
+where p_partkey = ps_partkey and p_brand <> '{BRAND}' and p_type not like '{TYPE}%'
+  and p_size in ({SIZES})
+  and ps_suppkey not in (select s_suppkey from supplier where s_comment like '%Customer%Complaints%')
+group by p_brand, p_type, p_size
+order by supplier_cnt desc, p_brand, p_type, p_size;""",
+    17: """
+select sum(l_extendedprice) / 7.0 as avg_yearly
+from lineitem, part
+where p_partkey = l_partkey and p_brand = '{BRAND}' and p_container = '{CONTAINER}'
+  and l_quantity < (select 0.2 * avg(l_quantity) from lineitem where l_partkey = p_partkey);""",
+    18: """
+select c_name, c_custkey, o_orderkey, o_orderdate, o_totalprice, sum(l_quantity)
+from customer, orders, lineitem
+where o_orderkey in (select l_orderkey from lineitem group by l_orderkey having sum(l_quantity) > {QUANTITY})
+  and c_custkey = o_custkey and o_orderkey = l_orderkey
+group by c_name, c_custkey, o_orderkey, o_orderdate, o_totalprice
+order by o_totalprice desc, o_orderdate
+limit 100;""",
+    19: """
+select sum(l_extendedprice * (1 - l_discount)) as revenue
+from lineitem, part
+where (p_partkey = l_partkey and p_brand = '{BRAND1}'
+       and p_container in ('SM CASE', 'SM BOX', 'SM PACK', 'SM PKG')
+       and l_quantity >= {QUANTITY1} and l_quantity <= {QUANTITY1} + 10 and p_size between 1 and 5
+       and l_shipmode in ('AIR', 'AIR REG') and l_shipinstruct = 'DELIVER IN PERSON')
+   or (p_partkey = l_partkey and p_brand = '{BRAND2}'
+       and p_container in ('MED BAG', 'MED BOX', 'MED PKG', 'MED PACK')
+       and l_quantity >= {QUANTITY2} and l_quantity <= {QUANTITY2} + 10 and p_size between 1 and 10
+       and l_shipmode in ('AIR', 'AIR REG') and l_shipinstruct = 'DELIVER IN PERSON')
+   or (p_partkey = l_partkey and p_brand = '{BRAND3}'
+       and p_container in ('LG CASE', 'LG BOX', 'LG PACK', 'LG PKG')
+       and l_quantity >= {QUANTITY3} and l_quantity <= {QUANTITY3} + 10 and p_size between 1 and 15
+       and l_shipmode in ('AIR', 'AIR REG') and l_shipinstruct = 'DELIVER IN PERSON');""",
+    20: """
+select s_name, s_address
+from supplier, nation
+where s_suppkey in (select ps_suppkey from partsupp
+                    where ps_partkey in (select p_partkey from part where p_name like '{COLOR}%')
+                      and ps_availqty > (select 0.5 * sum(l_quantity) from lineitem
+                                         where l_partkey = ps_partkey and l_suppkey = ps_suppkey
+                                           and l_shipdate >= date '{DATE}'
+                                           and l_shipdate < date '{DATE}' + interval 1 year))
+  and s_nationkey = n_nationkey and n_name = '{NATION}'
+order by s_name;""",
+    21: """
+select s_name, count(*) as numwait
+from supplier, lineitem l1, orders, nation
+where s_suppkey = l1.l_suppkey and o_orderkey = l1.l_orderkey and o_orderstatus = 'F'
+  and l1.l_receiptdate > l1.l_commitdate
+  and exists (select * from lineitem l2 where l2.l_orderkey = l1.l_orderkey and l2.l_suppkey <> l1.l_suppkey)
+  and not exists (select * from lineitem l3
+                  where l3.l_orderkey = l1.l_orderkey and l3.l_suppkey <> l1.l_suppkey
+                    and l3.l_receiptdate > l3.l_commitdate)
+  and s_nationkey = n_nationkey and n_name = '{NATION}'
+group by s_name
+order by numwait desc, s_name
+limit 100;""",
+    22: """
+select cntrycode, count(*) as numcust, sum(c_acctbal) as totacctbal
+from (select substring(c_phone from 1 for 2) as cntrycode, c_acctbal
+      from customer
+      where substring(c_phone from 1 for 2) in ({CODES})
+        and c_acctbal > (select avg(c_acctbal) from customer
+                         where c_acctbal > 0.00 and substring(c_phone from 1 for 2) in ({CODES}))
+        and not exists (select * from orders where o_custkey = c_custkey)) as custsale
+group by cntrycode
+order by cntrycode;""",
+}
+
+# Query order of power test, as stream 00 of the specification
+POWER_ORDER = [14, 2, 9, 20, 6, 17, 18, 8, 21, 13, 3, 22, 16, 4, 11, 15, 1, 10, 19, 5, 7, 12]
+# Region key of each nation, in the order of nations in dists.dss
+NATION_REGIONS = [0, 1, 1, 1, 4, 0, 3, 3, 2, 2, 4, 4, 2, 4, 0, 0, 0, 1, 2, 3, 4, 2, 3, 3, 1]
+TYPE_SYLLABLES = [["STANDARD", "SMALL", "MEDIUM", "LARGE", "ECONOMY", "PROMO"],
+                  ["ANODIZED", "BURNISHED", "PLATED", "POLISHED", "BRUSHED"],
+                  ["TIN", "NICKEL", "BRASS", "STEEL", "COPPER"]]
+CONTAINER_SYLLABLES = [["SM", "LG", "MED", "JUMBO", "WRAP"],
+                       ["CASE", "BOX", "BAG", "JAR", "PKG", "PACK", "CAN", "DRUM"]]
+
+def read_dists(dists_file):
+    """ Values of each distribution of dists.dss, {name: [value]} """
+    dists = {}
+    values = None
+    with open(dists_file) as f_dists:
+        for line in f_dists:
+            line = line.strip()
+            if not len(line) or line.startswith('#'):
+                continue
+            words = line.split()
+            if words[0].lower() == 'begin':
+                values = dists.setdefault(words[1].lower(), [])
+            elif words[0].lower() == 'end':
+                values = None
+            elif values is not None and not line.lower().startswith('count|'):
+                values.append(line.split('|')[0])
+    return dists
+
+def month_start(first_year, first_month, months):
+    """ First day of months after first_month of first_year """
+    month = first_month - 1 + months
+    return "{}-{:02d}-01".format(first_year + month // 12, month % 12 + 1)
+
+def query_params(qid, rng, dists, stream):
+    """ Substitution parameters of a query, as clause 2.4 of the specification """
+    nations = dists['nations']
+    regions = dists['regions']
+    if qid == 1:
+        return {'DELTA': rng.randint(60, 120)}
+    if qid == 2:
+        return {'SIZE': rng.randint(1, 50), 'TYPE': rng.choice(TYPE_SYLLABLES[2]), 'REGION': rng.choice(regions)}
+    if qid == 3:
+        return {'SEGMENT': rng.choice(dists['msegmnt']), 'DATE': "1995-03-{:02d}".format(rng.randint(1, 31))}
+    if qid == 4:
+        return {'DATE': month_start(1993, 1, rng.randint(0, 57))}
+    if qid == 5:
+        return {'REGION': rng.choice(regions), 'DATE': "{}-01-01".format(rng.randint(1993, 1997))}
+    if qid == 6:
+        return {'DATE': "{}-01-01".format(rng.randint(1993, 1997)),
+                'DISCOUNT': "0.0{}".format(rng.randint(2, 9)), 'QUANTITY': rng.randint(24, 25)}
+    if qid == 7:
+        nation1, nation2 = rng.sample(nations, 2)
+        return {'NATION1': nation1, 'NATION2': nation2}
+    if qid == 8:
+        nation_idx = rng.randint(0, len(nations) - 1)
+        return {'NATION': nations[nation_idx], 'REGION': regions[NATION_REGIONS[nation_idx]],
+                'TYPE': " ".join([rng.choice(syllables) for syllables in TYPE_SYLLABLES])}
+    if qid == 9:
+        return {'COLOR': rng.choice(dists['colors'])}
+    if qid == 10:
+        return {'DATE': month_start(1993, 2, rng.randint(0, 23))}
+    if qid == 11:
+        return {'NATION': rng.choice(nations), 'FRACTION': "{:.10f}".format(0.0001 / options.scale_factor)}
+    if qid == 12:
+        shipmode1, shipmode2 = rng.sample(dists['smode'], 2)
+        return {'SHIPMODE1': shipmode1, 'SHIPMODE2': shipmode2, 'DATE': "{}-01-01".format(rng.randint(1993, 1997))}
+    if qid == 13:
+        return {'WORD1': rng.choice(["special", "pending", "unusual", "express"]),
+                'WORD2': rng.choice(["packages", "requests", "accounts", "deposits"])}
+    if qid == 14:
+        return {'DATE': month_start(1993, 1, rng.randint(0, 59))}
+    if qid == 15:
+        return {'DATE': month_start(1993, 1, rng.randint(0, 57)), 'STREAM': stream}
+    if qid == 16:
+        return {'BRAND': "Brand#{}{}".format(rng.randint(1, 5), rng.randint(1, 5)),
+                'TYPE': " ".join([rng.choice(syllables) for syllables in TYPE_SYLLABLES[:2]]),
+                'SIZES': ", ".join([str(size) for size in rng.sample(range(1, 51), 8)])}
+    if qid == 17:
+        return {'BRAND': "Brand#{}{}".format(rng.randint(1, 5), rng.randint(1, 5)),
+                'CONTAINER': " ".join([rng.choice(syllables) for syllables in CONTAINER_SYLLABLES])}
+    if qid == 18:
+        return {'QUANTITY': rng.randint(312, 315)}
+    if qid == 19:
+        params = {}
+        for idx, (low, high) in enumerate([(1, 10), (10, 20), (20, 30)]):
+            params['BRAND{}'.format(idx + 1)] = "Brand#{}{}".format(rng.randint(1, 5), rng.randint(1, 5))
+            params['QUANTITY{}'.format(idx + 1)] = rng.randint(low, high)
+        return params
+    if qid == 20:
+        return {'COLOR': rng.choice(dists['colors']), 'DATE': "{}-01-01".format(rng.randint(1993, 1997)),
+                'NATION': rng.choice(nations)}
+    if qid == 21:
+        return {'NATION': rng.choice(nations)}
+    if qid == 22:
+        return {'CODES': ", ".join(["'{}'".format(code) for code in rng.sample(range(10, 35), 7)])}
+    raise Exception("Unknown query: Q{}".format(qid))
+
+def stream_queries(stream, query_ids, dists):
+    """
+        [(query id, SQL)] of a stream in its order. Stream 0 is the power test
+        in the order of the specification, each stream of throughput test runs
+        a shuffled order. Parameters of each stream are drawn from its own seed.
+    """
+    rng = random.Random(options.seed * 1000 + stream)
+    order = [qid for qid in POWER_ORDER if qid in query_ids]
+    if stream > 0:
+        rng.shuffle(order)
+    return [(qid, QUERIES[qid].strip().format(**query_params(qid, rng, dists, stream))) for qid in order]
+
+#
+# Execution
+#
+class Target:
+    """ A database to run queries against, labeled e.g. by its DDL """
+    def __init__(self, spec):
+        if '=' in spec:
+            self.label, self.database = spec.split('=', 1)
+        else:
+            self.label = self.database = spec
+        self.results = {}
+
+def run_query(database, sql):
+    """ Run SQL by mysql client, return (seconds, rows, error) """
+    init_sql = options.init_sql.strip().rstrip(';')
+    if options.timeout > 0:
+        init_sql = "SET SESSION max_execution_time = {}{}".format(
+            options.timeout * 1000, "; " + init_sql if len(init_sql) else "")
+    if len(init_sql):
+        sql = "{};\n{}".format(init_sql, sql)
+    cmd = shlex.split(options.mysql_cmd) + ["-N", "-B", "-D", database, "-e", sql]
+    start = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    seconds = time.time() - start
+    if proc.returncode != 0:
+        lines = err.decode('utf-8', 'replace').strip().splitlines()
+        return seconds, 0, lines[-1] if len(lines) else "exit code {}".format(proc.returncode)
+    return seconds, len(out.splitlines()), None
+
+def run_stream(target, stream, queries, repeats, results):
+    """ Run queries of a stream one by one, results of each query into results """
+    for qid, sql in queries:
+        runs = []
+        for _ in range(repeats + 1):
+            seconds, rows, error = run_query(target.database, sql)
+            runs.append(seconds)
+            if error is not None:
+                print("{} stream {} Q{} failed: {}".format(target.label, stream, qid, error), file=sys.stderr)
+                break
+        result = {'cold': round(runs[0], 3), 'rows': rows, 'error': error}
+        if error is None and len(runs) > 1:
+            warm = sorted(runs[1:])
+            result['warm'] = [round(seconds, 3) for seconds in runs[1:]]
+            result['warm_median'] = round(warm[len(warm) // 2], 3)
+        results["Q{}".format(qid)] = result
+        print("{} stream {} Q{}: {:.3f}s, {} rows".format(target.label, stream, qid, runs[0], rows), file=sys.stderr)
+
+def geo_mean(values):
+    return math.exp(sum([math.log(max(value, 0.001)) for value in values]) / len(values))
+
+def power_test(target, query_ids, dists):
+    results = {}
+    start = time.time()
+    run_stream(target, 0, stream_queries(0, query_ids, dists), options.repeats, results)
+    target.results['power'] = {'seconds': round(time.time() - start, 3), 'queries': results}
+    if all([result['error'] is None for result in results.values()]):
+        cold = [result['cold'] for result in results.values()]
+        target.results['power_at_size'] = round(3600 * options.scale_factor / geo_mean(cold), 2)
+        if options.repeats > 0:
+            warm = [result['warm_median'] for result in results.values()]
+            target.results['power_warm_at_size'] = round(3600 * options.scale_factor / geo_mean(warm), 2)
+
+def throughput_test(target, query_ids, dists):
+    streams = []
+    threads = []
+    for stream in range(1, options.streams + 1):
+        queries = stream_queries(stream, query_ids, dists)
+        results = {}
+        streams.append({'stream': stream, 'order': ["Q{}".format(qid) for qid, _ in queries], 'queries': results})
+        threads.append(threading.Thread(target=run_stream, args=(target, stream, queries, 0, results)))
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.time() - start
+    target.results['throughput'] = {'seconds': round(seconds, 3), 'streams': streams}
+    if all([result['error'] is None for stream in streams for result in stream['queries'].values()]):
+        target.results['throughput_at_size'] = round(
+            options.streams * len(query_ids) * 3600 / seconds * options.scale_factor, 2)
+
+#
+# Report
+#
+def print_report(targets, query_ids):
+    """ Latency of each query and metrics of all targets side by side, as a markdown table """
+    header = ["query"]
+    for target in targets:
+        header.extend(["{} cold".format(target.label), "{} warm".format(target.label)])
+    rows = [header, ["---"] * len(header)]
+    for qid in sorted(query_ids):
+        row = ["Q{}".format(qid)]
+        for target in targets:
+            result = target.results['power']['queries']["Q{}".format(qid)]
+            if result['error'] is not None:
+                row.extend(["failed", "-"])
+            else:
+                row.extend([str(result['cold']), str(result.get('warm_median', '-'))])
+        rows.append(row)
+    for metric in ['power_at_size', 'power_warm_at_size', 'throughput_at_size', 'qphh_at_size']:
+        row = [metric]
+        for target in targets:
+            row.extend([str(target.results.get(metric, '-')), ""])
+        rows.append(row)
+    for row in rows:
+        print("| {} |".format(" | ".join(row)))
+
+def run_all():
+    if options.databases is None:
+        raise Exception("Missing databases to run queries against")
+    if options.queries is None:
+        query_ids = sorted(QUERIES.keys())
+    else:
+        query_ids = sorted(set([int(qid.strip().lstrip('Qq')) for qid in options.queries.split(',')]))
+        for qid in query_ids:
+            if qid not in QUERIES:
+                raise Exception("Unknown query: Q{}".format(qid))
+    dists = read_dists(options.dists)
+    targets = [Target(spec.strip()) for spec in options.databases.split(',') if len(spec.strip())]
+
+    for target in targets:
+        print("Power test of {} (database {}) ...".format(target.label, target.database), file=sys.stderr)
+        power_test(target, query_ids, dists)
+        if options.streams > 0:
+            print("Throughput test of {} with {} streams ...".format(target.label, options.streams), file=sys.stderr)
+            throughput_test(target, query_ids, dists)
+        if 'power_at_size' in target.results and 'throughput_at_size' in target.results:
+            target.results['qphh_at_size'] = round(
+                math.sqrt(target.results['power_at_size'] * target.results['throughput_at_size']), 2)
+
+    print_report(targets, query_ids)
+    report = {
+        'scale_factor': options.scale_factor,
+        'streams': options.streams,
+        'repeats': options.repeats,
+        'seed': options.seed,
+        'init_sql': options.init_sql,
+        'queries': ["Q{}".format(qid) for qid in query_ids],
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'targets': [dict([('label', target.label), ('database', target.database)] + list(target.results.items()))
+                    for target in targets],
+    }
+    if options.output is not None:
+        with open(options.output, "w") as f_out:
+            json.dump(report, f_out, indent=2, sort_keys=True)
+        print("Results are written to {}".format(options.output), file=sys.stderr)
+    failed = [target.label for target in targets
+              if 'power_at_size' not in target.results
+              or (options.streams > 0 and 'throughput_at_size' not in target.results)]
+    return len(failed) == 0
+
+if __name__ == '__main__':
+    sys.exit(0 if run_all() else 1)
@@ -7,19 +7,32 @@ from __future__ import print_function
 
 from datetime import datetime
 from decimal import Decimal
-from multiprocessing import Process, Value
+from multiprocessing import Array, Lock, Process, Queue, Value
 from optparse import OptionParser
+import atexit
+import binascii
 import ctypes
+import mmap
 import os
 import shlex
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 import traceback
 import errno
+import fnmatch
+import hashlib
+import json
 import re
 import random
+import zlib
+try:
+    from Queue import Empty, Full
+except ImportError:
+    from queue import Empty, Full
 
 current_file_path = os.path.abspath(__file__)
 current_file_dir = os.path.dirname(os.path.abspath(__file__))
@@ -44,12 +57,12 @@ parser.add_option("-m", "--mysql", dest="mysql_path",
                   default="/usr/local/bin/mysql",
                   type="string", action="store")
 parser.add_option("-f", "--mysql_dump_file", dest="mysql_dump_file",
-                  help="output file of mysqldump",
+                  help="output file of mysqldump, may be compressed by gzip, zstd or xz",
                   default="{}/out.sql".format(current_file_dir),
                   type="string", action="store")
 parser.add_option("-d", "--database",
                   dest="database",
-                  help="use this database after connected",
+                  help="use this database after connected; with multi-database dumps (--databases / --all-databases) data follows the USE statements of the dump",
                   default=None, type="string", action="store")
 parser.add_option("-s", "--socket",
                   dest="socket",
@@ -74,14 +87,85 @@ parser.add_option("-P", "--port",
                   dest="port",
                   help="db listening port",
                   default=8250, type="int", action="store")
+parser.add_option("-D", "--targets",
+                  dest="targets",
+                  help="Comma separated servers to load into, each host:port or a socket path; the input is split once and loaded into all of them (default: the server of --socket / --host / --port)",
+                  default=None, type="string", action="store")
+parser.add_option("-M", "--fanout",
+                  dest="fanout",
+                  help="With several --targets: `replicate` loads every table into all targets, `route` loads each table into one target by --routes",
+                  default="replicate", type="choice", choices=["replicate", "route"], action="store")
+parser.add_option("-U", "--routes",
+                  dest="routes",
+                  help="File of `<table pattern> <target>` lines for --fanout route: pattern is a glob of db.table or table, target an index in --targets or one of them; tables matching no pattern are spread by hash",
+                  default=None, type="string", action="store")
+parser.add_option("-A", "--tables",
+                  dest="tables",
+                  help="Comma separated globs of db.table or table to load, other tables are neither created nor loaded",
+                  default=None, type="string", action="store")
+parser.add_option("-X", "--exclude_tables",
+                  dest="exclude_tables",
+                  help="Comma separated globs of db.table or table not to create nor load",
+                  default=None, type="string", action="store")
+parser.add_option("-N", "--build_index",
+                  dest="build_index",
+                  help="Only scan the input file into a dump index of byte ranges of schema and INSERT statements with row counts, without connecting to server; later loads of the same input take data chunks from it by the index, without split phase and data files",
+                  default=False,
+                  action="store_true")
+parser.add_option("-O", "--index_file",
+                  dest="index_file",
+                  help="Dump index of the input file, used if it is of the current input (default: <input file>.pidx)",
+                  default=None, type="string", action="store")
+parser.add_option("-F", "--export_dir",
+                  dest="export_dir",
+                  help="Export --database from the server into this dir by --parallel sessions of one consistent snapshot instead of loading: tables with an integer primary key are cut into key ranges of --chunk_size (64M by default), and chunk files with a manifest are written, which `-f <dir>` loads without split; the schema is dumped by mysqldump next to --mysql binary",
+                  default=None, type="string", action="store")
 parser.add_option("-l", "--line_per_file",
                   dest="line_per_file",
                   help="Num of INSERT per file",
                   default=16, type="int", action="store")
+parser.add_option("-z", "--chunk_size",
+                  dest="chunk_size",
+                  help="Target size of data file, e.g. 64M; large INSERTs are cut into several statements to fit (0 to split by --line_per_file)",
+                  default="0", type="string", action="store")
+parser.add_option("-r", "--rows_per_chunk",
+                  dest="rows_per_chunk",
+                  help="Max num of rows per data file; large INSERTs are cut into several statements to fit (0 for no limit)",
+                  default=0, type="int", action="store")
+parser.add_option("-g", "--statement_size",
+                  dest="statement_size",
+                  help="Merge consecutive INSERTs into the same table and columns into statements up to this size, e.g. 4M; capped below max_allowed_packet (0 to keep statements as in dump)",
+                  default="0", type="string", action="store")
+parser.add_option("-w", "--split_parallel",
+                  dest="split_parallel",
+                  help="Num of processes splitting the input file by byte ranges (not used in streaming mode)",
+                  default=1, type="int", action="store")
 parser.add_option("-x", "--parallel",
                   dest="parallel",
-                  help="Num of parallel running tasks (range between [1,1024])",
+                  help="Num of parallel running tasks (range between [1,1024]); max num with --auto_parallel",
                   default=8, type="int", action="store")
+parser.add_option("-E", "--engine",
+                  dest="engine",
+                  help="Loading engine: process (a process and mysql client per task) or async (all connections in one event loop, needs Python 3 and aiomysql; not in streaming mode)",
+                  default="process", type="choice", choices=["process", "async"], action="store")
+parser.add_option("-a", "--auto_parallel",
+                  dest="auto_parallel",
+                  help="Adjust num of active loading tasks between --min_parallel and --parallel to hold throughput near its peak",
+                  default=False,
+                  action="store_true")
+parser.add_option("-n", "--min_parallel",
+                  dest="min_parallel",
+                  help="Min num of active loading tasks with --auto_parallel",
+                  default=1, type="int", action="store")
+parser.add_option("-W", "--watch_server",
+                  dest="watch_server",
+                  help="With --auto_parallel, also reduce loading tasks on row lock waits or high checkpoint age of the server",
+                  default=False,
+                  action="store_true")
+parser.add_option("-T", "--table_parallel",
+                  dest="table_parallel",
+                  help="Max num of tasks loading the same table at a time (0 for no limit)",
+                  default=0, type="int", action="store")
 parser.add_option("-t", "--tmp_dir",
                   dest="tmp_dir",
                   type="string",
@@ -98,6 +182,67 @@ parser.add_option("-b", "--fast_mode",
                   help="Disable innodb_flush_log_at_trx_commit, unique_checks, etc",
                   default=True,
                   action="store_true")
+parser.add_option("-q", "--streaming",
+                  dest="streaming",
+                  help="Start loading data files while the input file is still being split",
+                  default=False,
+                  action="store_true")
+parser.add_option("-k", "--max_pending_chunks",
+                  dest="max_pending_chunks",
+                  help="Max num of split but not yet loaded data files in streaming mode (2 * parallel by default)",
+                  default=0, type="int", action="store")
+parser.add_option("-i", "--defer_indexes",
+                  dest="defer_indexes",
+                  help="Create tables with primary key only, and build secondary indexes after loading data",
+                  default=False,
+                  action="store_true")
+parser.add_option("-I", "--index_parallel",
+                  dest="index_parallel",
+                  help="Num of tables building secondary indexes at the same time",
+                  default=4, type="int", action="store")
+parser.add_option("-C", "--schema_parallel",
+                  dest="schema_parallel",
+                  help="Split the schema into per-object DDL units and create tables by this num of sessions, loading data of a table once it exists; views, triggers and routines are created after data (0 to source the schema file by one session)",
+                  default=0, type="int", action="store")
+parser.add_option("-L", "--load_data",
+                  dest="load_data",
+                  help="Convert INSERT rows into LOAD DATA LOCAL INFILE files (needs local_infile ON); rows which can not be converted are kept as INSERT",
+                  default=False,
+                  action="store_true")
+parser.add_option("-R", "--resume",
+                  dest="resume",
+                  help="Resume a failed or interrupted load from the manifest in tmp dir: skip splitting and loaded chunks",
+                  default=False,
+                  action="store_true")
+parser.add_option("-y", "--max_retries",
+                  dest="max_retries",
+                  help="Num of retries of a failed data chunk before giving it up",
+                  default=2, type="int", action="store")
+parser.add_option("-S", "--split_only",
+                  dest="split_only",
+                  help="Only split the input file into chunks under tmp dir and report split throughput, without connecting to server",
+                  default=False,
+                  action="store_true")
+parser.add_option("-V", "--verify",
+                  dest="verify",
+                  help="After loading, compare rows per table counted while splitting with COUNT(*) on server (count), and also a checksum of row values with the same checksum computed by server (checksum); mismatches fail the load (none, count or checksum)",
+                  default="none", type="choice", choices=["none", "count", "checksum"], action="store")
+parser.add_option("-K", "--verify_parallel",
+                  dest="verify_parallel",
+                  help="Num of tables verified at the same time",
+                  default=4, type="int", action="store")
+parser.add_option("-e", "--progress_interval",
+                  dest="progress_interval",
+                  help="Seconds between progress lines with throughput and ETA (0 to disable)",
+                  default=10, type="int", action="store")
+parser.add_option("-j", "--report_file",
+                  dest="report_file",
+                  help="JSON file to write run report with throughput and per table / per worker metrics to (default: pload_report.json under --tmp_dir)",
+                  default=None, type="string", action="store")
+parser.add_option("-o", "--prometheus_file",
+                  dest="prometheus_file",
+                  help="File to write metrics to in Prometheus text format, e.g. for node_exporter textfile collector",
+                  default=None, type="string", action="store")
 parser.add_option("-v", "--verbose",
                   dest="verbose",
                   help="Show debug info", action="store_true")
@@ -105,88 +250,118 @@ parser.add_option("-v", "--verbose",
 
 new_tmp_dir = "this_is_temp_dir_for_chunks"
 tmp_dir = os.path.join(options.tmp_dir, new_tmp_dir)
+# Kept after tmp_dir is removed
+if options.report_file is None:
+    options.report_file = os.path.join(options.tmp_dir, "pload_report.json")
+
+# Servers to load into, see use_target()
+targets = []
+cur_target = None
+routes = []
 
 input_file = os.path.abspath(options.mysql_dump_file)
-cur_file_idx = 0
 schema_file = os.path.join(tmp_dir, "f_schema.sql")
-all_data_files = []
+session_preamble_file = os.path.join(tmp_dir, "f_session_preamble.sql")
+all_chunks = []
+# Charset of LOAD DATA files, from SET NAMES in the dump header
+load_data_charset = b'binary'
 
 index_recover_ddl_stmts_file = os.path.join(tmp_dir, "f_index_recover_ddl_stmts.sql")
 index_recover_ddl_stmts = []
 
-"""
-Util file lock. Example usage:
+# Per-object DDL units of the schema file with --schema_parallel
+schema_units = []
 
-    with FileLock("/tmp/ddd.txt") as flk:
-        do_something()
+# Chunks loaded in streaming mode, kept for --verify only
+streamed_chunks = []
+# Table -> column names of CREATE TABLE for --verify checksum
+table_columns = {}
+# Verified and mismatched tables of --verify, for the run report
+verify_summary = {}
+
+# Chunk list of a load, and journal of chunk status changes
+manifest_file = os.path.join(tmp_dir, "f_manifest.json")
+status_file = os.path.join(tmp_dir, "f_status.log")
+STATUS_PENDING = "pending"
+STATUS_LOADING = "loading"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
 
-This file lock is typically useful for coordinating between multi-process.
-Not suitable for use in multi-thread environment.
 """
-class FileLock:
-    def __init__(self, file_path, timeout=60 * 5):
-        """
-            Default timeout as 5 minute to prevent disaster.
-            Setting timeout to 0 means no timeout.
-        """
-        self.file_path = file_path
-        if not os.path.isabs(file_path):
-            fp = os.path.join(os.path.curdir, file_path)
-            self.file_path = fp
-        self.timeout = timeout
-        self.is_locked = False
-        self.hard_timeout = 60 * 120
-        self.fd = 0
-        if self.timeout > self.hard_timeout:
-            self.timeout = self.hard_timeout
-
-    def acquire(self):
-        start_time = time.time()
-        while True:
-            try:
-                self.fd = os.open(self.file_path, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-                self.is_locked = True
-                break
-            except OSError as e:
-                if e.errno != errno.EEXIST:
-                    raise
-                period = time.time() - start_time
-                timeout_msg = "File lock timeout after {} seconds at \
-                               file " + self.file_path
-                if (self.timeout is None or self.timeout <= 0):
-                    if period < self.hard_timeout:
-                        continue
-                    else:
-                        raise Exception(timeout_msg.format(self.hard_timeout))
-                if period >= self.timeout:
-                    raise Exception(timeout_msg.format(period))
+Output of all processes goes through log_queue to a single LogAggregator
+process, which writes it to stdout. Putting into the (unbounded) queue never
+blocks, so that logging never stalls a loading worker, however many workers
+there are. Before the aggregator is started messages are printed directly.
+"""
+log_queue = None
+log_aggregator = None
 
-                time.sleep(0.5)
-                continue
+class LogAggregator(Process):
+    """
+        Write messages from log_queue to stdout in batches, at most once per
+        flush_interval. In-place progress lines (starting with '\\r' and not
+        ending the line) queued in the same batch are coalesced to the last.
+    """
+    flush_interval = 0.1
 
-    def release(self):
-        if self.is_locked:
-            os.close(self.fd)
-            #os.unlink(self.file_path)
-            self.is_locked = False
+    def __init__(self, queue):
+        super(LogAggregator, self).__init__()
+        self.queue = queue
+        self.daemon = True
 
-    def __enter__(self):
-        if not self.is_locked:
-            self.acquire()
+    def run(self):
+        done = False
+        while not done:
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            out = []
+            progress = None
+            for item in items:
+                if item is None:
+                    done = True
+                    break
+                text, end = item
+                if text.startswith('\r') and end == '':
+                    progress = text
+                    continue
+                if progress is not None:
+                    out.append(progress)
+                    progress = None
+                out.append(text + end)
+            if progress is not None:
+                out.append(progress)
+            sys.stdout.write(''.join(out))
+            sys.stdout.flush()
+            if not done:
+                time.sleep(self.flush_interval)
 
-    def __exit__(self, type, value, traceback):
-        if self.is_locked:
-            self.release()
+def start_log_aggregator():
+    global log_queue, log_aggregator
+    log_queue = Queue()
+    log_aggregator = LogAggregator(log_queue)
+    log_aggregator.start()
+    # Flush the rest of output when the main process exits
+    atexit.register(stop_log_aggregator)
 
-    def __del__(self):
-        self.release()
-        if os.path.exists(self.file_path):
-            os.unlink(self.file_path)
+def stop_log_aggregator():
+    global log_queue, log_aggregator
+    if log_queue is None:
+        return
+    log_queue.put(None)
+    log_aggregator.join()
+    log_queue = None
+    log_aggregator = None
 
 def print_msg(*args, **kwargs):
-    fp = os.path.join(current_file_dir, "SuiteAllPyFileLock_print.lock")
-    with FileLock(fp):
-        print(*args, **kwargs)
+    end = kwargs.get('end', '\n')
+    if log_queue is None:
+        print(*args, end=end)
+        return
+    log_queue.put((kwargs.get('sep', ' ').join([str(arg) for arg in args]), end))
 
 def print_if_verbose(msg):
     if not options.verbose:
@@ -202,7 +377,7 @@ def print_info(msg):
 def check_output(command):
     process = subprocess.Popen(shlex.split(command), shell=False,
                                stdin=subprocess.PIPE, stderr=subprocess.PIPE,
-                               stdout=subprocess.PIPE)
+                               stdout=subprocess.PIPE, universal_newlines=True)
     output, err = process.communicate()
     retcode = process.poll()
     if retcode:
@@ -211,29 +386,212 @@ def check_output(command):
         raise Exception(err_msg)
     return output
 
+#
+# Target servers
+#
+class Target:
+    """ A server to load into, by socket path or host:port """
+    def __init__(self, idx, socket='', host=None, port=None):
+        self.idx = idx
+        self.socket = socket
+        self.host = host
+        self.port = port
+        if len(socket):
+            self.name = socket
+        else:
+            self.name = "{}:{}".format(host, port)
+
+def parse_targets(targets_str):
+    result = []
+    for item in [t.strip() for t in targets_str.split(',')]:
+        if not len(item):
+            continue
+        if item.startswith('/'):
+            result.append(Target(len(result), item))
+            continue
+        host, sep, port = item.rpartition(':')
+        if not sep or not len(host) or not port.isdigit():
+            raise Exception("Invalid target `{}`, expect host:port or a socket path".format(item))
+        result.append(Target(len(result), '', host, int(port)))
+    return result
+
+def is_fanout():
+    return len(targets) > 1
+
+def use_target(target):
+    """ Connect to target from now on in this process """
+    global cur_target
+    cur_target = target
+    options.socket = target.socket
+    if not len(target.socket):
+        options.host = target.host
+        options.port = target.port
+
+def target_key(key):
+    """ Status key of a loading step on the current target """
+    if is_fanout():
+        return "{} on {}".format(key, cur_target.name)
+    return key
+
+def load_routes():
+    """ Returns [(table pattern, target)] of options.routes """
+    routes = []
+    if options.routes is None:
+        return routes
+    targets_by_name = dict((target.name, target) for target in targets)
+    with open(options.routes, "r") as f_routes:
+        for line in f_routes:
+            line = line.split('#', 1)[0].strip()
+            if not len(line):
+                continue
+            pattern, target_str = line.rsplit(None, 1)
+            if target_str in targets_by_name:
+                routes.append((pattern, targets_by_name[target_str]))
+            elif target_str.isdigit() and int(target_str) < len(targets):
+                routes.append((pattern, targets[int(target_str)]))
+            else:
+                raise Exception("Unknown target `{}` in routes file `{}`".format(target_str, options.routes))
+    return routes
+
+def route_table(table):
+    """ Target to load table into with --fanout route """
+    name = table.replace('`', '')
+    for pattern, target in routes:
+        if match_table(table, pattern):
+            return target
+    return targets[int(hashlib.md5(name.encode('utf-8')).hexdigest(), 16) % len(targets)]
+
+def get_target_chunks(chunks, target):
+    """ Chunks of chunks to load into target """
+    if not is_fanout() or options.fanout == "replicate":
+        return chunks
+    return [chunk for chunk in chunks if route_table(chunk.table) is target]
+
 # Prefer socket connection if available
-def get_mysql_exe_cmd():
+def get_mysql_exe_cmd(exe_path=None):
+    if exe_path is None:
+        exe_path = options.mysql_path
     mysql_exe_cmd = ""
     if len(options.socket):
         mysql_exe_cmd = "{mysql_arg} -u{user_arg} --socket {socket_arg} ".format(
-                mysql_arg=options.mysql_path,
+                mysql_arg=exe_path,
                 user_arg=options.user,
                 socket_arg=options.socket)
     elif len(options.password):
         mysql_exe_cmd = "{mysql_arg} -u{user_arg} -p{password} --host {host_arg} --port {port_arg} ".format(
-                mysql_arg=options.mysql_path,
+                mysql_arg=exe_path,
                 user_arg=options.user,
                 password=options.password,
                 host_arg=options.host,
                 port_arg=options.port)
     else:
         mysql_exe_cmd = "{mysql_arg} -u{user_arg} --host {host_arg} --port {port_arg} ".format(
-                mysql_arg=options.mysql_path,
+                mysql_arg=exe_path,
                 user_arg=options.user,
                 host_arg=options.host,
                 port_arg=options.port)
     return mysql_exe_cmd
 
+# (format, magic bytes, decompressor commands in order of preference)
+compress_formats = [
+    ('gzip', b'\x1f\x8b', [['pigz', '-dc'], ['gzip', '-dc']]),
+    ('zstd', b'\x28\xb5\x2f\xfd', [['zstd', '-dc', '-T0']]),
+    ('xz', b'\xfd7zXZ\x00', [['xz', '-dc', '-T0']]),
+]
+
+def get_compress_format(path):
+    with open(path, "rb") as f:
+        magic = f.read(8)
+    for fmt, fmt_magic, cmds in compress_formats:
+        if magic.startswith(fmt_magic):
+            return fmt, cmds
+    return None, None
+
+def find_executable(name):
+    for path_dir in os.environ.get("PATH", "").split(os.pathsep):
+        exe = os.path.join(path_dir, name)
+        if os.path.isfile(exe) and os.access(exe, os.X_OK):
+            return exe
+    return None
+
+class DecompressInput:
+    """
+        Compressed input file read from the stdout of a decompressor process,
+        so that decompression (multi-threaded for pigz/xz/zstd) runs beside
+        the splitter instead of inside it.
+    """
+    def __init__(self, cmd, path):
+        self.cmd = " ".join(cmd + [path])
+        self.err_file = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(cmd + [path], shell=False,
+                                        stdout=subprocess.PIPE, stderr=self.err_file,
+                                        bufsize=4 * 1024 * 1024)
+        self.eof = False
+
+    def readline(self, limit=-1):
+        line = self.process.stdout.readline(limit)
+        if not line:
+            self.eof = True
+        return line
+
+    def close(self):
+        self.process.stdout.close()
+        retcode = self.process.wait()
+        self.err_file.seek(0)
+        err = self.err_file.read().decode('utf-8', 'replace').strip()
+        self.err_file.close()
+        # Non-zero exit code is expected if we stopped reading early
+        if retcode and self.eof:
+            raise Exception("Decompress command failed. Error code {}. Command: {}, err: {}".format(
+                retcode, self.cmd, err))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.process.kill()
+            self.process.wait()
+
+def open_input_file():
+    """
+        Open input file for reading in binary mode. Compressed files are
+        detected by magic bytes and decompressed on the fly, by an external
+        decompressor if available, otherwise by python modules.
+    """
+    fmt, cmds = get_compress_format(input_file)
+    if fmt is None:
+        return open(input_file, "rb")
+    for cmd in cmds:
+        if find_executable(cmd[0]) is not None:
+            print_if_verbose("Decompress {} input file by `{}`".format(fmt, " ".join(cmd)))
+            return DecompressInput(cmd, input_file)
+    print_if_verbose("No decompressor command for {} input file, use python module".format(fmt))
+    if fmt == 'gzip':
+        import gzip
+        return gzip.open(input_file, "rb")
+    if fmt == 'xz':
+        import lzma
+        return lzma.open(input_file, "rb")
+    if fmt == 'zstd':
+        import io
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(input_file, "rb")))
+    raise Exception("Unsupported compressed input file: {}".format(input_file))
+
+def is_compressed_input():
+    return get_compress_format(input_file)[0] is not None
+
+# Parse size string like 512K, 64M or 1G into num of bytes
+def parse_size(size_str):
+    units = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+    size_str = str(size_str).strip().upper()
+    if size_str[-1:] in units:
+        return int(float(size_str[:-1]) * units[size_str[-1]])
+    return int(size_str)
+
 # Because we write to /tmp by default, it is required that the tmpdir should
 # have at least 2GB available to prevent disaste.
 def check_tmp_dir_space():
@@ -243,13 +601,761 @@ def check_tmp_dir_space():
         print_msg("Less than 2GB available under {}; please specify another tmp dir".format(tmp_dir))
         exit(1)
 
-def split_file():
-    if not os.path.exists(input_file):
-        raise Exception("input file not exists: {}".format(input_file))
+def is_session_setting(line):
+    return re.match(br'^(/\*!\d+ )?SET ', line) is not None
 
-    print_msg("Splitting input file `{}` into chunks ...".format(
-        input_file, options.line_per_file))
+insert_table_re = re.compile(br'^(?:INSERT|REPLACE)(?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*\s+(?:INTO\s+)?((?:`(?:[^`]|``)+`|[\w$]+)(?:\.(?:`(?:[^`]|``)+`|[\w$]+))?)')
+
+# Table name of an INSERT statement as written in the dump, e.g. `t1`
+def get_insert_table(stmt):
+    m = insert_table_re.match(stmt)
+    if m is None:
+        return ''
+    return m.group(1).decode('utf-8', 'replace')
+
+use_database_re = re.compile(br'^USE\s+(`(?:[^`]|``)+`|[\w$]+)\s*;')
+qualified_table_re = re.compile(r'^(?:`(?:[^`]|``)+`|[\w$]+)\.')
+
+# Database of a `USE db;` line of the dump, None for other lines
+def get_use_database(line):
+    m = use_database_re.match(line)
+    if m is None:
+        return None
+    name = m.group(1).decode('utf-8', 'replace')
+    if name.startswith('`'):
+        name = name[1:-1].replace('``', '`')
+    return name
+
+def quote_name(name):
+    return "`{}`".format(name.replace('`', '``'))
+
+def get_use_stmt(database):
+    return "USE {};\n".format(quote_name(database)).encode('utf-8')
+
+# Table name qualified by its database in multi-database dumps, e.g. `db1`.`t1`
+def qualify_table(database, table):
+    if database is None or qualified_table_re.match(table):
+        return table
+    return "{}.{}".format(quote_name(database), table)
+
+def match_table(table, pattern):
+    """ Whether glob pattern matches table as db.table or as table """
+    name = table.replace('`', '')
+    return fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(name.split('.')[-1], pattern)
+
+# Table -> whether it is selected by --tables / --exclude_tables
+table_selection = {}
+
+def is_table_selected(table):
+    if table not in table_selection:
+        selected = True
+        if options.tables:
+            selected = any([match_table(table, p.strip()) for p in options.tables.split(',') if p.strip()])
+        if selected and options.exclude_tables:
+            selected = not any([match_table(table, p.strip()) for p in options.exclude_tables.split(',') if p.strip()])
+        table_selection[table] = selected
+    return table_selection[table]
+
+def is_table_filtered():
+    return bool(options.tables or options.exclude_tables)
+
+class ChunkInfo:
+    """
+        Data chunk produced by DumpSplitter: table it belongs to, size in
+        bytes, num of rows (estimated if INSERTs are not tokenized) and
+        statements, the file of rows for LOAD DATA chunks, and byte range
+        [input_start, input_end) of the (decompressed) input file it is cut
+        from. path is None for chunks kept in memory in streaming mode.
+        database is the one of the last USE statement before the chunk in
+        multi-database dumps, and None if the dump has no USE statement.
+        checksum is the sum of row_checksum() of its rows with --verify
+        checksum, None if not computed or any row has none. Chunks taken
+        from the dump index are in_input: their data is the byte range of
+        the input file itself, and they have no data file.
+    """
+    def __init__(self, idx, path, table, size, rows, infile=None, input_start=0, input_end=0, stmts=0,
+                 database=None, checksum=None, in_input=False):
+        self.idx = idx
+        self.path = path
+        self.table = table
+        self.size = size
+        self.rows = rows
+        self.infile = infile
+        self.input_start = input_start
+        self.input_end = input_end
+        self.stmts = stmts
+        self.database = database
+        self.checksum = checksum
+        self.in_input = in_input
+
+    def to_dict(self):
+        return {'idx': self.idx, 'path': self.path, 'table': self.table,
+                'size': self.size, 'rows': self.rows, 'infile': self.infile,
+                'input_start': self.input_start, 'input_end': self.input_end,
+                'stmts': self.stmts, 'database': self.database, 'checksum': self.checksum,
+                'in_input': self.in_input}
+
+    @staticmethod
+    def from_dict(d):
+        return ChunkInfo(d['idx'], d['path'], d['table'], d['size'], d['rows'], d.get('infile'),
+                         d.get('input_start', 0), d.get('input_end', 0), d.get('stmts', 0),
+                         d.get('database'), d.get('checksum'), d.get('in_input', False))
+
+class DataChunk:
+    """
+        One data chunk produced by split_file(). It is written to a data file
+        under tmp dir, or kept in memory in streaming mode and handed to the
+        loading workers through chunk_queue without touching the disk.
+    """
+    def __init__(self, idx, table, path=None):
+        self.idx = idx
+        self.table = table
+        self.path = path
+        self.infile = None
+        self.lines = []
+        self.fd = None
+        if path is not None:
+            self.fd = open(self.path, "wb+")
+
+    def write(self, line):
+        if self.fd is not None:
+            self.fd.write(line)
+        else:
+            self.lines.append(line)
+
+    def finish(self, chunk_queue, chunk_info):
+        data = None
+        if self.fd is not None:
+            self.fd.flush()
+            self.fd.close()
+        else:
+            data = b''.join(self.lines)
+            self.lines = []
+        if chunk_queue is not None:
+            put_chunk(chunk_queue, (chunk_info, data))
+
+class LoadDataChunk(DataChunk):
+    """
+        Data chunk of a table with --load_data. Rows converted to LOAD DATA
+        format are always written to infile under tmp dir, read by the LOAD
+        DATA LOCAL INFILE statement written into the chunk with the first of
+        them; rows which can not be converted are written into the chunk
+        as INSERT statements by write(). infile is None until the first
+        converted row.
+    """
+    def __init__(self, idx, table, path, infile_path, charset):
+        DataChunk.__init__(self, idx, table, path)
+        self.infile_path = infile_path
+        self.charset = charset
+        self.prefix = None
+        self.infile_fd = None
+
+    def write_line(self, prefix, line):
+        if self.infile_fd is None:
+            self.prefix = prefix
+            self.infile = self.infile_path
+            self.infile_fd = open(self.infile, "wb+")
+            self.write(get_load_data_stmt(prefix, self.infile, self.charset))
+        self.infile_fd.write(line)
+
+    def finish(self, chunk_queue, chunk_info):
+        if self.infile_fd is not None:
+            self.infile_fd.flush()
+            self.infile_fd.close()
+        DataChunk.finish(self, chunk_queue, chunk_info)
+
+load_data_prefix_re = re.compile(br'^(INSERT|REPLACE)((?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*)\s+(?:INTO\s+)?(\S+)\s*(\(.*\))?\s*VALUES\s*$', re.S)
+
+def get_load_data_stmt(prefix, infile, charset):
+    m = load_data_prefix_re.match(prefix)
+    if m is None:
+        raise Exception("Unsupported INSERT for LOAD DATA: `{}`".format(prefix.decode('utf-8', 'replace')))
+    # Duplicate keys are ignored by LOAD DATA LOCAL unless REPLACE is given
+    mode = b''
+    if m.group(1) == b'REPLACE':
+        mode = b' REPLACE'
+    elif b'IGNORE' in m.group(2):
+        mode = b' IGNORE'
+    infile_arg = infile.replace('\\', '\\\\').replace("'", "\\'").encode('utf-8')
+    return b"LOAD DATA LOCAL INFILE '" + infile_arg + b"'" + mode + b" INTO TABLE " + m.group(3) + \
+           b" CHARACTER SET " + charset + \
+           b" FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' " + \
+           (m.group(4) or b'') + b";\n"
+
+load_data_value_re = re.compile(br"\s*(_binary\s*)?('(?:[^'\\]|\\.|'')*'|[^,'()]*?)\s*(?:,|\Z)", re.S)
+load_data_number_re = re.compile(br'^[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$')
+load_data_escape_re = re.compile(br"\\(.)|''|\t|\n|\r", re.S)
+load_data_raw_escapes = {b"''": b"'", b'\t': b'\\t', b'\n': b'\\n', b'\r': b'\\r'}
+load_data_byte_escape_re = re.compile(br'[\\\t\n\r\0]')
+load_data_byte_escapes = {b'\\': b'\\\\', b'\t': b'\\t', b'\n': b'\\n', b'\r': b'\\r', b'\0': b'\\0'}
+
+class UnsafeValue(Exception):
+    pass
+
+def convert_load_data_escape(m):
+    c = m.group(1)
+    if c is None:
+        return load_data_raw_escapes[m.group(0)]
+    # \% and \_ keep their backslash in a string literal, but not in LOAD DATA
+    if c == b'%' or c == b'_':
+        raise UnsafeValue()
+    # Same meaning in LOAD DATA as in a string literal
+    if c in (b'0', b'b', b'n', b'r', b't', b'Z', b'\\'):
+        return b'\\' + c
+    # \' \" and unknown escapes are the char itself
+    return c
+
+def escape_load_data_bytes(m):
+    return load_data_byte_escapes[m.group(0)]
+
+def row_to_load_data_line(row):
+    """
+        Convert row tuple of INSERT, e.g. `(1,'a\'b',NULL,0x00ff)`, into a
+        tab separated LOAD DATA line. NULL, numbers, quoted strings with or
+        without _binary introducer and hex literals of --hex-blob dumps are
+        converted, the bytes of hex literals being escaped; None is returned
+        for other values (b'01', other introducers, expressions, ...) so the
+        row falls back to INSERT.
+    """
+    body = row[1:-1]
+    fields = []
+    pos = 0
+    while pos < len(body):
+        m = load_data_value_re.match(body, pos)
+        if m is None or m.end() == pos:
+            return None
+        pos = m.end()
+        value = m.group(2)
+        if value.startswith(b"'"):
+            try:
+                fields.append(load_data_escape_re.sub(convert_load_data_escape, value[1:-1]))
+            except UnsafeValue:
+                return None
+        elif m.group(1) is not None:
+            return None
+        elif value == b'NULL':
+            fields.append(b'\\N')
+        elif load_data_number_re.match(value):
+            fields.append(value)
+        else:
+            hex_m = hex_value_re.match(value)
+            if hex_m is None:
+                return None
+            digits = hex_m.group(1)
+            # Odd num of digits is padded on the left like the server does
+            if len(digits) % 2:
+                digits = b'0' + digits
+            fields.append(load_data_byte_escape_re.sub(escape_load_data_bytes, binascii.unhexlify(digits)))
+    return b'\t'.join(fields) + b'\n'
+
+checksum_value_re = re.compile(br"\s*(?:_\w+\s*)?('(?:[^'\\]|\\.|'')*'|[^,'()]*?)\s*(?:,|\Z)", re.S)
+hex_value_re = re.compile(br'^0x([0-9A-Fa-f]*)$')
+string_escape_re = re.compile(br"\\(.)|''", re.S)
+# \% and \_ keep their backslash in a string literal
+string_escapes = {b'0': b'\0', b'b': b'\b', b'n': b'\n', b'r': b'\r', b't': b'\t', b'Z': b'\x1a',
+                  b'%': b'\\%', b'_': b'\\_'}
+insert_columns_re = re.compile(br'\)\s*VALUES\s*$')
+
+def unescape_string(m):
+    c = m.group(1)
+    if c is None:
+        return b"'"
+    return string_escapes.get(c, c)
+
+def row_checksum(row):
+    """
+        CRC32 of values of row tuple of INSERT as the server renders them,
+        joined by 0x1f with 0x1e for NULL, the same as get_checksum_expr().
+        None for values which can't be rendered, e.g. b'01' or expressions.
+    """
+    body = row[1:-1]
+    values = []
+    pos = 0
+    while pos < len(body):
+        m = checksum_value_re.match(body, pos)
+        if m is None or m.end() == pos:
+            return None
+        pos = m.end()
+        value = m.group(1)
+        if value == b'NULL':
+            values.append(b'\x1e')
+        elif value.startswith(b"'"):
+            values.append(string_escape_re.sub(unescape_string, value[1:-1]))
+        elif load_data_number_re.match(value):
+            values.append(value)
+        else:
+            m = hex_value_re.match(value)
+            if m is None:
+                return None
+            values.append(binascii.unhexlify(m.group(1)))
+    return zlib.crc32(b'\x1f'.join(values)) & 0xffffffff
+
+class MmapRangeReader:
+    """
+        File-like readline() over byte range [start, end) of a memory-mapped
+        file, used by SplitWorker.
+    """
+    def __init__(self, mm, start, end):
+        self.mm = mm
+        self.pos = start
+        self.end = end
+
+    def readline(self, limit=-1):
+        if self.pos >= self.end:
+            return b''
+        stop = self.end
+        if limit is not None and limit > 0:
+            stop = min(self.end, self.pos + limit)
+        eol = self.mm.find(b'\n', self.pos, stop)
+        new_pos = stop if eol < 0 else eol + 1
+        line = self.mm[self.pos:new_pos]
+        self.pos = new_pos
+        return line
+
+def write_schema_segment(segment_lines, segment_idx):
+    segment_file = os.path.join(tmp_dir, "f_schema_{}.sql".format(segment_idx))
+    with open(segment_file, "wb+") as f_segment:
+        f_segment.writelines(segment_lines)
+    return segment_file
+
+def source_schema_segment(segment_lines, segment_idx):
+    if options.defer_indexes:
+        segment_lines = remove_secondary_indexes(segment_lines)
+    segment_file = write_schema_segment(segment_lines, segment_idx)
+    print_if_verbose("\nLoad schema segment `{}` before its data".format(segment_file))
+    source_single_file(options.database, segment_file)
+    return segment_file
+
+class InsertTokenizer:
+    """
+        Streaming tokenizer of `INSERT ... VALUES (...),(...);` statements.
+
+        The statement is fed in pieces of bounded size. Every complete row
+        tuple is passed to on_row(prefix, row), and on_end() is called at the
+        end of statement. Quoted strings and backslash escapes are tracked
+        across pieces, so at most one row is held in memory.
+    """
+    prefix_re = re.compile(br'^((?:INSERT|REPLACE)\b[^(;]*?(?:\([^;]*?\)\s*)?VALUES)\s*\(')
+    between_re = re.compile(br'[^\s,]')
+    tuple_re = re.compile(br'[()\'"]')
+    quote_re = {b"'": re.compile(br"[\\']"), b'"': re.compile(br'[\\"]')}
+
+    def __init__(self, on_row, on_end):
+        self.on_row = on_row
+        self.on_end = on_end
+        self.active = False
+
+    def start(self, piece):
+        """
+            Start a new statement with its first piece. Returns position of
+            the first row in piece to feed() from, or -1 if the statement is
+            not a plain INSERT/REPLACE ... VALUES.
+        """
+        m = self.prefix_re.match(piece)
+        if m is None:
+            return -1
+        self.prefix = m.group(1) + b' '
+        self.depth = 0
+        self.quote = None
+        self.escape = False
+        self.row = []
+        self.active = True
+        return m.end(1)
+
+    def feed(self, piece, pos=0):
+        """
+            Returns the rest of piece after the end of statement, or None if
+            the statement continues in the next piece.
+        """
+        n = len(piece)
+        row_start = pos if self.depth > 0 else None
+        while pos < n:
+            if self.escape:
+                self.escape = False
+                pos += 1
+            elif self.quote is not None:
+                m = self.quote_re[self.quote].search(piece, pos)
+                if m is None:
+                    pos = n
+                elif m.group() == b'\\':
+                    self.escape = True
+                    pos = m.end()
+                else:
+                    self.quote = None
+                    pos = m.end()
+            elif self.depth > 0:
+                m = self.tuple_re.search(piece, pos)
+                if m is None:
+                    pos = n
+                    break
+                pos = m.end()
+                c = m.group()
+                if c == b'(':
+                    self.depth += 1
+                elif c == b')':
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.row.append(piece[row_start:pos])
+                        row = b''.join(self.row)
+                        self.row = []
+                        row_start = None
+                        self.on_row(self.prefix, row)
+                else:
+                    self.quote = c
+            else:
+                m = self.between_re.search(piece, pos)
+                if m is None:
+                    pos = n
+                    break
+                c = m.group()
+                if c == b'(':
+                    self.depth = 1
+                    row_start = m.start()
+                    pos = m.end()
+                elif c == b';':
+                    self.active = False
+                    self.on_end()
+                    return piece[m.end():]
+                else:
+                    raise Exception("Unsupported INSERT syntax near `{}`".format(
+                        piece[m.start():m.start() + 64].decode('utf-8', 'replace')))
+        if row_start is not None:
+            self.row.append(piece[row_start:])
+        return None
+
+class DumpSplitter:
+    """
+        Split mysqldump output into a schema file and data chunks.
+
+        By default each chunk holds line_per_file INSERT lines. With
+        chunk_size or rows_per_chunk the INSERTs are tokenized into rows, and
+        chunks are cut by size / row count, so that an oversized extended
+        INSERT is cut into several INSERTs in different chunks.
+
+        With statement_size consecutive INSERTs sharing the same prefix (same
+        table and column list) are merged into multi-row INSERTs of at most
+        statement_size bytes, e.g. for dumps with one row per INSERT. Chunks
+        then hold line_per_file merged INSERTs unless cut by size / rows.
+
+        With load_data rows are converted into LOAD DATA files, one per
+        chunk, and only rows which can not be converted are kept as INSERT
+        statements in the same chunk.
+
+        In streaming mode (chunk_queue is given) every data chunk is put into
+        chunk_queue in memory as soon as it is complete, and the schema
+        statements preceding an INSERT are sourced before the chunk holding
+        that INSERT is handed out.
+
+        In multi-database dumps the database of the last USE statement is
+        tracked: CREATE DATABASE / USE statements stay in the schema file,
+        and every chunk records its database and holds rows of one database
+        only, its table being qualified by the database.
+
+        Rows of tables not selected by --tables / --exclude_tables are
+        skipped.
+    """
+    read_block_size = 1024 * 1024
+
+    def __init__(self, chunk_queue=None, range_id=None, database=None):
+        self.chunk_queue = chunk_queue
+        # Database of the last USE statement, of the range start for range_id
+        self.database = database
+        self.segment_database = None
+        # Only the first byte range holds the dump header
+        self.range_id = range_id
+        self.preamble_file = session_preamble_file if not range_id else None
+        self.chunk_idx = 0
+        self.chunks = []
+        self.line_per_file = max(options.line_per_file, 1)
+        self.chunk_size = parse_size(options.chunk_size)
+        self.rows_per_chunk = max(options.rows_per_chunk, 0)
+        self.statement_size = parse_size(options.statement_size)
+        self.size_aware = self.chunk_size > 0 or self.rows_per_chunk > 0
+        self.load_data = options.load_data
+        # Rows are counted for --verify
+        self.tokenize = self.size_aware or self.statement_size > 0 or self.load_data or options.verify != "none"
+        self.checksum = options.verify == "checksum"
+        self.row_checksum = None
+        self.streamed_chunks = []
+        self.insert_rows = 0
+        self.tokenizer = InsertTokenizer(self.add_row, self.end_statement)
+        self.cur_chunk = None
+        self.cur_chunk_lines = 0
+        self.cur_chunk_rows = 0
+        self.cur_chunk_bytes = 0
+        self.cur_chunk_checksum = 0
+        self.stmt_prefix = None
+        self.stmt_bytes = 0
+        self.schema_segment = []
+        self.schema_preamble = []
+        self.schema_segment_idx = 0
+        self.seen_insert = False
+        self.total_lines = 0
+        self.input_pos = 0
+        self.piece_start = 0
+        self.cur_chunk_input_start = 0
+        self.cur_chunk_input_end = 0
+        self.cur_chunk_database = None
+
+    def split(self, ifile, f_schema, input_pos=0):
+        self.f_schema = f_schema
+        self.input_pos = input_pos
+        at_line_start = True
+        while True:
+            if self.tokenize:
+                piece = ifile.readline(self.read_block_size)
+            else:
+                piece = ifile.readline()
+            if not piece:
+                break
+            self.piece_start = self.input_pos
+            self.input_pos += len(piece)
+            if self.tokenizer.active:
+                rest = self.tokenizer.feed(piece)
+            elif at_line_start and piece.startswith(b'INSERT'):
+                self.before_data()
+                rest = None
+                if not self.tokenize:
+                    self.on_insert_line(piece)
+                else:
+                    pos = self.tokenizer.start(piece)
+                    if pos < 0:
+                        raise Exception("Unsupported INSERT statement at line {}: `{}`".format(
+                            self.total_lines + 1, piece[:64].decode('utf-8', 'replace')))
+                    rest = self.tokenizer.feed(piece, pos)
+            else:
+                rest = None
+                self.on_schema_line(piece, at_line_start)
+            if rest is not None and rest.strip():
+                raise Exception("Unexpected content after INSERT at line {}: `{}`".format(
+                    self.total_lines + 1, rest[:64].decode('utf-8', 'replace')))
+            at_line_start = piece.endswith(b'\n')
+            if at_line_start:
+                self.total_lines += 1
+
+        if self.tokenizer.active:
+            raise Exception("Input file ends inside an INSERT statement")
+        if self.cur_chunk is not None:
+            self.finish_chunk()
+        if not self.seen_insert:
+            self.write_preamble()
+
+    def write_preamble(self):
+        if self.preamble_file is not None:
+            with open(self.preamble_file, "wb+") as f_preamble:
+                f_preamble.writelines(self.schema_preamble)
+
+    def on_schema_line(self, line, at_line_start):
+        # Only consecutive INSERTs are merged
+        self.close_statement()
+        if not len(self.schema_segment):
+            self.segment_database = self.database
+        if at_line_start:
+            database = get_use_database(line)
+            if database is not None:
+                self.database = database
+            if line.startswith(b'SET') and (b'GTID_PURGED' in line):
+                print_msg('Skip loading GTID_PURGED setting: {}'.format(line.decode('utf-8', 'replace')))
+                return
+        self.f_schema.write(line)
+        # Session settings in the dump header are replayed by every
+        # session loading data, and before every later schema segment
+        if not self.seen_insert and at_line_start and is_session_setting(line):
+            self.schema_preamble.append(line)
+        if self.chunk_queue is not None and (len(self.schema_segment) or line.strip()):
+            self.schema_segment.append(line)
+
+    def before_data(self):
+        if not self.seen_insert:
+            self.seen_insert = True
+            self.write_preamble()
+
+        if len(self.schema_segment):
+            # Data chunks never span a schema segment in streaming mode
+            if self.cur_chunk is not None:
+                self.finish_chunk()
+            source_schema_segment(self.pop_schema_segment(), self.schema_segment_idx)
+            self.schema_segment_idx += 1
+
+    def pop_schema_segment(self):
+        segment = self.schema_segment
+        if self.schema_segment_idx > 0:
+            segment = self.schema_preamble + segment
+        # Sourced in the database the segment starts in
+        if self.segment_database is not None:
+            segment = [get_use_stmt(self.segment_database)] + segment
+        self.schema_segment = []
+        return segment
+
+    def get_table(self, stmt):
+        return qualify_table(self.database, get_insert_table(stmt))
+
+    def on_insert_line(self, line):
+        table = self.get_table(line)
+        if not is_table_selected(table):
+            return
+        # Chunks never span tables, so that they can be scheduled by table
+        if self.cur_chunk is not None and \
+           (self.cur_chunk_lines >= self.line_per_file or self.cur_chunk.table != table):
+            self.finish_chunk()
+        if self.cur_chunk is None:
+            self.new_chunk(table)
+        self.cur_chunk.write(line)
+        self.cur_chunk_lines += 1
+        self.cur_chunk_bytes += len(line)
+        # Rows are not tokenized, they are counted by the separators of rows
+        # of the extended INSERT, which miscounts strings holding `),(`
+        self.cur_chunk_rows += line.count(b'),(') + 1
+        self.cur_chunk_input_end = self.input_pos
+
+    def add_row(self, prefix, row):
+        table = self.get_table(prefix)
+        if not is_table_selected(table):
+            return
+        if self.checksum:
+            # Values of INSERTs with a column list are not in table order
+            self.row_checksum = None if insert_columns_re.search(prefix) else row_checksum(row)
+        if self.load_data:
+            line = row_to_load_data_line(row)
+            if line is not None:
+                self.add_load_data_row(prefix, line)
+                return
+            # Rows which can not be converted are kept as INSERT statements
+            # in the chunk holding the LOAD DATA of the other rows
+            self.insert_rows += 1
+        if self.stmt_prefix is not None and self.stmt_prefix != prefix:
+            self.close_statement()
+        # Chunks never span tables
+        if self.cur_chunk is not None and self.cur_chunk.table != table:
+            self.finish_chunk()
+        if self.stmt_prefix is not None and self.statement_size > 0 and \
+           self.stmt_bytes + len(row) + 3 > self.statement_size:
+            self.close_statement()
+        if self.cur_chunk is not None:
+            if self.size_aware:
+                if self.cur_chunk_rows > 0 and \
+                   ((self.chunk_size > 0 and self.cur_chunk_bytes + len(row) + 3 > self.chunk_size) or \
+                    (self.rows_per_chunk > 0 and self.cur_chunk_rows >= self.rows_per_chunk)):
+                    self.finish_chunk()
+            elif self.stmt_prefix is None and self.cur_chunk_lines >= self.line_per_file:
+                self.finish_chunk()
+        if self.cur_chunk is None:
+            self.new_chunk(table)
+        if self.stmt_prefix is None:
+            self.stmt_prefix = prefix
+            self.stmt_bytes = len(prefix)
+            self.cur_chunk.write(prefix)
+            self.cur_chunk_bytes += len(prefix)
+        else:
+            self.cur_chunk.write(b',')
+            self.stmt_bytes += 1
+            self.cur_chunk_bytes += 1
+        self.cur_chunk.write(row)
+        self.stmt_bytes += len(row)
+        self.cur_chunk_bytes += len(row)
+        self.count_row()
+        self.cur_chunk_input_end = self.input_pos
+
+    def add_load_data_row(self, prefix, line):
+        table = self.get_table(prefix)
+        # A chunk holds a single LOAD DATA statement, of one column list
+        if self.cur_chunk is not None and \
+           (self.cur_chunk.table != table or self.cur_chunk.prefix not in (None, prefix)):
+            self.finish_chunk()
+        if self.cur_chunk is not None and self.cur_chunk_rows > 0 and \
+           ((self.chunk_size > 0 and self.cur_chunk_bytes + len(line) > self.chunk_size) or \
+            (self.rows_per_chunk > 0 and self.cur_chunk_rows >= self.rows_per_chunk)):
+            self.finish_chunk()
+        if self.cur_chunk is None:
+            self.new_chunk(table)
+        self.cur_chunk.write_line(prefix, line)
+        self.cur_chunk_bytes += len(line)
+        self.count_row()
+        self.cur_chunk_input_end = self.input_pos
+
+    def count_row(self):
+        self.cur_chunk_rows += 1
+        if not self.checksum:
+            return
+        if self.row_checksum is None or self.cur_chunk_checksum is None:
+            self.cur_chunk_checksum = None
+        else:
+            self.cur_chunk_checksum += self.row_checksum
+
+    def end_statement(self):
+        # Keep the statement open so that following INSERTs can be merged
+        if self.statement_size <= 0:
+            self.close_statement()
+
+    def close_statement(self):
+        if self.stmt_prefix is None:
+            return
+        self.cur_chunk.write(b';\n')
+        self.cur_chunk_bytes += 2
+        self.cur_chunk_lines += 1
+        self.stmt_prefix = None
+
+    def new_chunk(self, table):
+        path = None
+        name = self.chunk_idx
+        if self.range_id is not None:
+            name = "{}_{}".format(self.range_id, self.chunk_idx)
+        if self.chunk_queue is None:
+            path = os.path.join(tmp_dir, "f_data_{}.sql".format(name))
+        if self.load_data:
+            infile = os.path.join(tmp_dir, "f_data_{}.tsv".format(name))
+            self.cur_chunk = LoadDataChunk(self.chunk_idx, table, path, infile, load_data_charset)
+        else:
+            self.cur_chunk = DataChunk(self.chunk_idx, table, path)
+        if path is not None:
+            print_msg("\rCreating data file {}...".format(self.cur_chunk.path), end='')
+        self.cur_chunk_lines = 0
+        self.cur_chunk_rows = 0
+        self.cur_chunk_bytes = 0
+        self.cur_chunk_checksum = 0
+        # A chunk may be finished after the next USE statement
+        self.cur_chunk_database = self.database
+        # Byte range is tracked by the block of input being split
+        self.cur_chunk_input_start = self.piece_start
+        self.cur_chunk_input_end = self.input_pos
 
+    def finish_chunk(self):
+        self.close_statement()
+        # The LOAD DATA statement is not counted in lines
+        stmts = self.cur_chunk_lines + (1 if self.cur_chunk.infile is not None else 0)
+        chunk = ChunkInfo(self.chunk_idx, self.cur_chunk.path, self.cur_chunk.table,
+                          self.cur_chunk_bytes, self.cur_chunk_rows,
+                          self.cur_chunk.infile, self.cur_chunk_input_start,
+                          self.cur_chunk_input_end, stmts, self.cur_chunk_database,
+                          self.cur_chunk_checksum if self.checksum else None)
+        self.cur_chunk.finish(self.chunk_queue, chunk)
+        if self.cur_chunk.path is not None:
+            self.chunks.append(chunk)
+        elif options.verify != "none":
+            self.streamed_chunks.append(chunk)
+        self.cur_chunk = None
+        self.chunk_idx += 1
+
+def get_dump_charset():
+    """
+        Charset of SET NAMES in the dump header, or binary if not found.
+    """
+    with open_input_file() as ifile:
+        while True:
+            line = ifile.readline(64 * 1024)
+            if not line or line.startswith(b'INSERT'):
+                break
+            m = re.search(br'SET NAMES\s+(\w+)', line)
+            if m is not None:
+                return m.group(1)
+    return b'binary'
+
+def print_load_data_fallback(insert_rows):
+    if options.load_data and insert_rows > 0:
+        print_warn("{} rows can not be converted to LOAD DATA and are loaded by INSERT".format(insert_rows))
+
+def create_tmp_dir():
+    """ Create an empty tmp dir, an existing one is moved aside """
     if os.path.exists(tmp_dir):
         opath = tmp_dir
         npath = '{}-back'.format(tmp_dir.rstrip('/'))
@@ -260,57 +1366,939 @@ def split_file():
         shutil.move(opath, npath)
 
     check_output("mkdir -p {}".format(tmp_dir))
-    check_tmp_dir_space()
 
-    f_schema = open(schema_file, "w+")
-    f_cur_data_file = None
-    total_lines = 0
+def split_file(chunk_queue=None):
+    """
+        Split input file into schema file and data files, see DumpSplitter.
+
+        Schema statements after the last INSERT (views, triggers, etc.) are
+        returned as a file to be sourced after loading in streaming mode.
+    """
+    if not os.path.exists(input_file):
+        raise Exception("input file not exists: {}".format(input_file))
+
+    print_msg("Splitting input file `{}` into chunks ...".format(
+        input_file, options.line_per_file))
+
+    create_tmp_dir()
+    # In streaming mode data chunks never reach tmp dir
+    if chunk_queue is None:
+        check_tmp_dir_space()
+
+    if options.split_parallel > 1 and chunk_queue is None and is_compressed_input():
+        print_msg("Compressed input file can not be split in parallel, split by single process")
+    elif options.split_parallel > 1 and chunk_queue is None and os.path.getsize(input_file) > 0:
+        chunks, total_lines, insert_rows = split_file_parallel()
+        all_chunks.extend(chunks)
+        print_msg("Done ({} line processed in total)".format(total_lines))
+        print_load_data_fallback(insert_rows)
+        return None
+
+    splitter = DumpSplitter(chunk_queue)
+    with open(schema_file, "wb+") as f_schema:
+        with open_input_file() as ifile:
+            splitter.split(ifile, f_schema)
+    all_chunks.extend(splitter.chunks)
+    streamed_chunks.extend(splitter.streamed_chunks)
+
+    print_msg("Done ({} line processed in total)".format(splitter.total_lines))
+    print_load_data_fallback(splitter.insert_rows)
+
+    schema_tail_file = None
+    if len(splitter.schema_segment):
+        schema_tail_file = write_schema_segment(splitter.pop_schema_segment(), splitter.schema_segment_idx)
+    return schema_tail_file
+
+#
+# Dump index for loading without split
+#
+dump_index_version = 1
+# Ranges of INSERT statements are cut at statement ends past this size
+index_range_size = 1024 * 1024
+# Input file mapped by read_input_range(), once per process
+input_mmap = None
+
+def get_index_file():
+    if options.index_file is not None:
+        return os.path.abspath(options.index_file)
+    return input_file + ".pidx"
+
+class DumpIndexer:
+    """
+        Scan mysqldump output into a dump index: byte ranges of the schema
+        (all statements but INSERT) and of the session settings of the dump
+        header, and ranges of whole INSERT statements, each range of one
+        table and database, cut about every index_range_size bytes. Every
+        range records its num of statements and rows, and the sum of
+        row_checksum() of its rows (None if any row has none).
+
+        The schema ranges hold the same lines as the schema file written by
+        DumpSplitter, so a load by the index needs no pass over the data.
+    """
+    def __init__(self):
+        self.tokenizer = InsertTokenizer(self.add_row, self.end_statement)
+        self.database = None
+        self.schema = []
+        self.preamble = []
+        self.ranges = []
+        self.seen_insert = False
+        self.total_lines = 0
+        self.input_pos = 0
+        self.stmt_start = 0
+        self.stmt_table = None
+        self.stmt_columns = False
+        self.stmt_rows = 0
+        self.stmt_checksum = 0
+
+    def index(self, ifile):
+        at_line_start = True
+        while True:
+            piece = ifile.readline(DumpSplitter.read_block_size)
+            if not piece:
+                break
+            piece_start = self.input_pos
+            self.input_pos += len(piece)
+            if self.tokenizer.active:
+                rest = self.tokenizer.feed(piece)
+            elif at_line_start and piece.startswith(b'INSERT'):
+                self.seen_insert = True
+                pos = self.tokenizer.start(piece)
+                if pos < 0:
+                    raise Exception("Unsupported INSERT statement at line {}: `{}`".format(
+                        self.total_lines + 1, piece[:64].decode('utf-8', 'replace')))
+                self.start_statement(piece_start, self.tokenizer.prefix)
+                rest = self.tokenizer.feed(piece, pos)
+            else:
+                rest = None
+                self.on_schema_line(piece, piece_start, at_line_start)
+            if rest is not None and rest.strip():
+                raise Exception("Unexpected content after INSERT at line {}: `{}`".format(
+                    self.total_lines + 1, rest[:64].decode('utf-8', 'replace')))
+            at_line_start = piece.endswith(b'\n')
+            if at_line_start:
+                self.total_lines += 1
+
+        if self.tokenizer.active:
+            raise Exception("Input file ends inside an INSERT statement")
+
+    def add_byte_range(self, byte_ranges, start, end):
+        if len(byte_ranges) and byte_ranges[-1][1] == start:
+            byte_ranges[-1][1] = end
+        else:
+            byte_ranges.append([start, end])
+
+    def on_schema_line(self, line, start, at_line_start):
+        if at_line_start:
+            database = get_use_database(line)
+            if database is not None:
+                self.database = database
+            if line.startswith(b'SET') and (b'GTID_PURGED' in line):
+                print_msg('Skip loading GTID_PURGED setting: {}'.format(line.decode('utf-8', 'replace')))
+                return
+        self.add_byte_range(self.schema, start, self.input_pos)
+        if not self.seen_insert and at_line_start and is_session_setting(line):
+            self.add_byte_range(self.preamble, start, self.input_pos)
+
+    def start_statement(self, start, prefix):
+        self.stmt_start = start
+        self.stmt_table = qualify_table(self.database, get_insert_table(prefix))
+        # Values of INSERTs with a column list are not in table order
+        self.stmt_columns = insert_columns_re.search(prefix) is not None
+        self.stmt_rows = 0
+        self.stmt_checksum = None if self.stmt_columns else 0
+
+    def add_row(self, prefix, row):
+        self.stmt_rows += 1
+        if self.stmt_checksum is not None:
+            checksum = row_checksum(row)
+            self.stmt_checksum = None if checksum is None else self.stmt_checksum + checksum
+
+    def end_statement(self):
+        # The statement ends with its line, the rest is checked to be blank
+        end = self.input_pos
+        last = self.ranges[-1] if len(self.ranges) else None
+        if last is None or last['table'] != self.stmt_table or last['database'] != self.database or \
+           last['end'] != self.stmt_start or last['end'] - last['start'] >= index_range_size:
+            self.ranges.append({'table': self.stmt_table, 'database': self.database,
+                                'start': self.stmt_start, 'end': end, 'stmts': 1,
+                                'rows': self.stmt_rows, 'checksum': self.stmt_checksum})
+            return
+        last['end'] = end
+        last['stmts'] += 1
+        last['rows'] += self.stmt_rows
+        if last['checksum'] is None or self.stmt_checksum is None:
+            last['checksum'] = None
+        else:
+            last['checksum'] += self.stmt_checksum
+
+def build_dump_index():
+    """
+        Write the dump index of the input file to get_index_file(), see
+        DumpIndexer. The file is replaced by rename, so that it is either
+        complete or absent.
+    """
+    if not os.path.exists(input_file):
+        raise Exception("input file not exists: {}".format(input_file))
+    if is_compressed_input():
+        raise Exception("Compressed input file can not be indexed, as its data is read by byte ranges")
+    index_file = get_index_file()
+    print_msg("Indexing input file `{}` into `{}` ...".format(input_file, index_file))
+    stat = os.stat(input_file)
+    indexer = DumpIndexer()
+    with open(input_file, "rb") as ifile:
+        indexer.index(ifile)
+    index = {'version': dump_index_version,
+             'input_size': stat.st_size,
+             'input_mtime': stat.st_mtime,
+             'schema': indexer.schema,
+             'preamble': indexer.preamble,
+             'ranges': indexer.ranges}
+    tmp_index_file = index_file + ".tmp"
+    with open(tmp_index_file, "w+") as f_index:
+        json.dump(index, f_index)
+    os.rename(tmp_index_file, index_file)
+    print_msg("Done ({} line processed in total, {} rows of {} tables in {} ranges)".format(
+        indexer.total_lines, sum([r['rows'] for r in indexer.ranges]),
+        len(set([r['table'] for r in indexer.ranges])), len(indexer.ranges)))
+
+def get_dump_index():
+    """
+        Dump index to take data chunks from, or None to split the input file
+        if there is no index of the current input file, or INSERTs are to be
+        rewritten.
+    """
+    index_file = get_index_file()
+    if not os.path.exists(index_file):
+        return None
+    if options.load_data or parse_size(options.statement_size) > 0 or options.rows_per_chunk > 0:
+        print_info("Dump index `{}` is not used, as INSERTs are rewritten by --load_data, --statement_size or --rows_per_chunk".format(index_file))
+        return None
+    with open(index_file, "r") as f_index:
+        index = json.load(f_index)
+    stat = os.stat(input_file)
+    if index.get('version') != dump_index_version or index['input_size'] != stat.st_size or \
+       index['input_mtime'] != stat.st_mtime:
+        print_warn("Dump index `{}` is not of the current input file, split it instead. Rebuild it by --build_index.".format(index_file))
+        return None
+    return index
+
+def get_index_chunks(index):
+    """
+        Data chunks of the ranges of selected tables of index. Consecutive
+        ranges of a table are merged up to chunk_size, or up to line_per_file
+        statements without chunk_size; a range is never cut.
+    """
+    chunk_size = parse_size(options.chunk_size)
     line_per_file = max(options.line_per_file, 1)
-    cur_file_lines = 0
-    global cur_file_idx
-    global all_data_files
-    with open(options.mysql_dump_file, "r") as ifile:
-        for line in ifile:
-            total_lines += 1
-            if not line.startswith('INSERT'):
-                # A better way. FUTURE WORK.
-                # If there is already CREATE DB / USE DB in the sql file, we use that DB.
-                # If there is more than 1 CREATE DB / USE DB in the sql, we abort execution,
-                # and save the leftover content to another file.
-                if line.startswith('CREATE DATABASE') or line.startswith('USE '):
-                    print_msg('Not implemented creating db or switch db inside source file.')
-                    print_msg('Please guarantee that the whole source file belongs to a single database/schema and retry.')
-                    exit(1)
-                if line.startswith('SET') and ('GTID_PURGED' in line):
-                    print_msg('Skip loading GTID_PURGED setting: {}'.format(line))
-                    continue
-                f_schema.write(line)
+    chunks = []
+    chunk = None
+    for r in index['ranges']:
+        if not is_table_selected(r['table']):
+            continue
+        if chunk is not None and chunk.table == r['table'] and chunk.database == r['database'] and \
+           chunk.input_end == r['start'] and \
+           ((chunk_size > 0 and chunk.size + r['end'] - r['start'] <= chunk_size) or
+            (chunk_size <= 0 and chunk.stmts < line_per_file)):
+            chunk.input_end = r['end']
+            chunk.size += r['end'] - r['start']
+            chunk.stmts += r['stmts']
+            chunk.rows += r['rows']
+            if chunk.checksum is None or r['checksum'] is None:
+                chunk.checksum = None
             else:
-                if cur_file_lines >= line_per_file:
-                    f_cur_data_file.flush()
-                    f_cur_data_file.close()
-                    f_cur_data_file = None
-                    cur_file_lines = 0
-                    cur_file_idx += 1
-
-                if f_cur_data_file is None:
-                    new_data_file_path = os.path.join(tmp_dir, "f_data_{}.sql".format(cur_file_idx))
-                    all_data_files.append(new_data_file_path)
-                    f_cur_data_file = open(new_data_file_path, "w+")
-                    print_msg("\rCreating data file {}...".format(new_data_file_path), end='')
-                    sys.stdout.flush() # flush stdout so that cursor will not blinking...
-                    cur_file_lines = 0
-
-                f_cur_data_file.write(line)
-                cur_file_lines += 1
-
-    f_schema.flush()
-    f_schema.close()
-    if f_cur_data_file is not None:
-        f_cur_data_file.flush()
-        f_cur_data_file.close()
-
-    print_msg("Done ({} line processed in total)".format(total_lines))
+                chunk.checksum += r['checksum']
+            continue
+        chunk = ChunkInfo(len(chunks), None, r['table'], r['end'] - r['start'], r['rows'], None,
+                          r['start'], r['end'], r['stmts'], r['database'], r['checksum'], True)
+        chunks.append(chunk)
+    return chunks
+
+def load_dump_index(index):
+    """
+        Instead of split_file(): write the schema and session preamble of
+        index into tmp dir, and take data chunks from index.
+    """
+    print_msg("Taking chunks of input file `{}` from dump index `{}` ...".format(input_file, get_index_file()))
+    create_tmp_dir()
+    with open(input_file, "rb") as ifile:
+        for path, byte_ranges in [(schema_file, index['schema']), (session_preamble_file, index['preamble'])]:
+            with open(path, "wb+") as f_out:
+                for start, end in byte_ranges:
+                    ifile.seek(start)
+                    f_out.write(ifile.read(end - start))
+    all_chunks.extend(get_index_chunks(index))
+    print_msg("Done ({} chunks of {} tables)".format(len(all_chunks), len(set([chunk.table for chunk in all_chunks]))))
+
+def read_input_range(start, end):
+    """ Bytes [start, end) of the input file, which is memory-mapped once per process """
+    global input_mmap
+    if input_mmap is None:
+        with open(input_file, "rb") as ifile:
+            input_mmap = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+    return input_mmap[start:end]
+
+#
+# Manifest and status journal for resuming a load
+#
+def write_manifest(load_schema_file):
+    """
+        Write the chunk list, deferred index DDLs and table columns to
+        manifest_file. The file is replaced by rename, so that it is either
+        complete or absent.
+    """
+    manifest = {'input_file': input_file,
+                'database': options.database,
+                'schema_file': load_schema_file,
+                'chunks': [chunk.to_dict() for chunk in all_chunks],
+                'index_recover_ddl_stmts': index_recover_ddl_stmts,
+                'table_columns': table_columns}
+    tmp_manifest_file = manifest_file + ".tmp"
+    with open(tmp_manifest_file, "w+") as f_manifest:
+        json.dump(manifest, f_manifest)
+        f_manifest.flush()
+        os.fsync(f_manifest.fileno())
+    os.rename(tmp_manifest_file, manifest_file)
+
+def load_manifest():
+    """
+        Restore chunk list and deferred index DDLs from manifest_file.
+        Returns schema file to load, or None if there is no manifest.
+    """
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, "r") as f_manifest:
+        manifest = json.load(f_manifest)
+    if manifest['input_file'] != input_file or manifest['database'] != options.database:
+        raise Exception("Manifest `{}` is of loading `{}` into `{}`, can not resume loading `{}` into `{}`".format(
+            manifest_file, manifest['input_file'], manifest['database'], input_file, options.database))
+    all_chunks.extend([ChunkInfo.from_dict(d) for d in manifest['chunks']])
+    index_recover_ddl_stmts.extend([(table, stmt) for table, stmt in manifest['index_recover_ddl_stmts']])
+    table_columns.update(manifest.get('table_columns', {}))
+    return manifest['schema_file']
+
+def set_status(key, status):
+    """
+        Append a status change of a chunk (or other step of loading) to
+        status_file. Each record is a single O_APPEND write, so records of
+        concurrent workers never interleave, and a crash loses at most the
+        record being written.
+    """
+    record = "{} {}\n".format(key, status).encode('utf-8')
+    fd = os.open(status_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, record)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def read_status():
+    """ Returns dict of key -> last recorded status """
+    statuses = {}
+    if not os.path.exists(status_file):
+        return statuses
+    with open(status_file, "rb") as f_status:
+        for line in f_status:
+            # Skip a record torn by crash
+            if not line.endswith(b'\n'):
+                continue
+            key, status = line.decode('utf-8', 'replace').rstrip('\n').rsplit(' ', 1)
+            statuses[key] = status
+    return statuses
+
+def chunk_key(chunk_idx):
+    return target_key("chunk {}".format(chunk_idx))
+
+def index_key(table):
+    return target_key("index {}".format(table))
+
+def schema_key():
+    return target_key("schema")
+
+def schema_unit_key(unit_idx):
+    return target_key("schema unit {}".format(unit_idx))
+
+#
+# Load metrics
+#
+# Upper bounds in seconds of the chunk load latency histogram
+latency_buckets = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+metrics_queue = None
+load_metrics = None
+phase_seconds = {}
+
+def record_chunk_metrics(task_id, chunk, seconds, ok, retries):
+    if metrics_queue is not None:
+        target = cur_target.name if is_fanout() else None
+        metrics_queue.put((task_id, chunk.table, chunk.size, chunk.rows, chunk.stmts, seconds, ok, retries, target))
+
+def format_bytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n) < 1024:
+            return "{:.1f} {}".format(n, unit)
+        n /= 1024.0
+    return "{:.1f} TB".format(n)
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+class LoadCounters:
+    def __init__(self):
+        self.chunks = 0
+        self.failed_chunks = 0
+        self.retries = 0
+        self.bytes = 0
+        self.rows = 0
+        self.stmts = 0
+        self.seconds = 0.0
+
+    def add(self, size, rows, stmts, seconds, ok, retries):
+        self.retries += retries
+        self.seconds += seconds
+        if not ok:
+            self.failed_chunks += 1
+            return
+        self.chunks += 1
+        self.bytes += size
+        self.rows += rows
+        self.stmts += stmts
+
+    def to_dict(self):
+        return {'chunks': self.chunks, 'failed_chunks': self.failed_chunks,
+                'retries': self.retries, 'bytes': self.bytes, 'rows': self.rows,
+                'statements': self.stmts, 'load_seconds': round(self.seconds, 3)}
+
+class LoadMetrics(threading.Thread):
+    """
+        Collect the chunk records put into metrics_queue by loading workers
+        into counters per worker, per table and per target server and a
+        histogram of chunk load latency, and print throughput and ETA every progress_interval
+        seconds. ETA is based on total_bytes to load, if known.
+
+        Runs as a thread of the main process, so that the counters are at
+        hand for the final report.
+    """
+    def __init__(self, queue, progress_interval):
+        super(LoadMetrics, self).__init__()
+        self.queue = queue
+        self.progress_interval = progress_interval
+        self.daemon = True
+        self.total_bytes = None
+        self.total = LoadCounters()
+        self.tables = {}
+        self.workers = {}
+        self.targets = {}
+        self.latency_counts = [0] * (len(latency_buckets) + 1)
+        self.start_time = time.time()
+        self.last_progress_time = self.start_time
+        self.last_progress_bytes = 0
+        self.last_progress_rows = 0
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(True, 1)
+            except Empty:
+                record = False
+            if record is None:
+                break
+            if record:
+                self.add(*record)
+            if self.progress_interval > 0 and \
+               time.time() - self.last_progress_time >= self.progress_interval:
+                self.print_progress()
+
+    def add(self, task_id, table, size, rows, stmts, seconds, ok, retries, target=None):
+        self.total.add(size, rows, stmts, seconds, ok, retries)
+        self.tables.setdefault(table, LoadCounters()).add(size, rows, stmts, seconds, ok, retries)
+        self.workers.setdefault(task_id, LoadCounters()).add(size, rows, stmts, seconds, ok, retries)
+        if target is not None:
+            self.targets.setdefault(target, LoadCounters()).add(size, rows, stmts, seconds, ok, retries)
+        bucket = 0
+        while bucket < len(latency_buckets) and seconds > latency_buckets[bucket]:
+            bucket += 1
+        self.latency_counts[bucket] += 1
+
+    def print_progress(self):
+        now = time.time()
+        interval = max(now - self.last_progress_time, 0.001)
+        elapsed = max(now - self.start_time, 0.001)
+        msg = "[progress] {} loaded in {} chunks, {}/s".format(
+            format_bytes(self.total.bytes), self.total.chunks,
+            format_bytes((self.total.bytes - self.last_progress_bytes) / interval))
+        if self.total.rows > 0:
+            msg += ", {:.0f} rows/s".format((self.total.rows - self.last_progress_rows) / interval)
+        if self.total_bytes:
+            done = min(float(self.total.bytes) / self.total_bytes, 1.0)
+            msg += ", {:.1f}% of {}".format(done * 100, format_bytes(self.total_bytes))
+            if self.total.bytes > 0:
+                msg += ", ETA {}".format(format_seconds(elapsed / done - elapsed))
+        if self.total.failed_chunks > 0:
+            msg += ", {} failed".format(self.total.failed_chunks)
+        print_msg(msg)
+        self.last_progress_time = now
+        self.last_progress_bytes = self.total.bytes
+        self.last_progress_rows = self.total.rows
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def latency_histogram(self):
+        """ Returns cumulative counts per upper bound, as of Prometheus """
+        histogram = []
+        count = 0
+        for i in range(len(latency_buckets)):
+            count += self.latency_counts[i]
+            histogram.append((latency_buckets[i], count))
+        histogram.append(("+Inf", count + self.latency_counts[-1]))
+        return histogram
+
+#
+# Adaptive concurrency
+#
+concurrency_controller = None
+
+def get_status_values(sql):
+    """ Returns dict of name -> int value of SHOW STATUS / VARIABLES output """
+    values = {}
+    output = check_output(""" {} -e "{}" """.format(get_mysql_exe_cmd(), sql))
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if len(fields) == 2 and fields[1].isdigit():
+            values[fields[0]] = int(fields[1])
+    return values
+
+def get_redo_log_capacity():
+    values = get_status_values("SHOW VARIABLES WHERE Variable_name IN "
+                               "('innodb_redo_log_capacity', 'innodb_log_file_size', 'innodb_log_files_in_group')")
+    if 'innodb_redo_log_capacity' in values:
+        return values['innodb_redo_log_capacity']
+    if 'innodb_log_file_size' in values:
+        return values['innodb_log_file_size'] * values.get('innodb_log_files_in_group', 2)
+    return None
+
+def get_server_load():
+    """ Returns Threads_running, Innodb_row_lock_waits and checkpoint_age, if found """
+    values = get_status_values("SHOW GLOBAL STATUS WHERE Variable_name IN "
+                               "('Threads_running', 'Innodb_row_lock_waits')")
+    output = check_output(""" {} -e "SHOW ENGINE INNODB STATUS\\G" """.format(get_mysql_exe_cmd()))
+    lsn = re.search(r'Log sequence number\s+(\d+)', output)
+    checkpoint = re.search(r'Last checkpoint at\s+(\d+)', output)
+    if lsn is not None and checkpoint is not None:
+        values['checkpoint_age'] = int(lsn.group(1)) - int(checkpoint.group(1))
+    return values
+
+class ConcurrencyController(threading.Thread):
+    """
+        Adjust num of active loading workers between min_parallel and
+        max_parallel by hill climbing on the throughput seen by load_metrics.
+        Every interval the num is stepped in the current direction while
+        throughput keeps improving, turned back when it drops, and held
+        (after one step back down) when more workers bring no gain.
+
+        With watch_server, new row lock waits or a checkpoint age over 3/4
+        of redo log capacity step the num down whatever the throughput.
+
+        All max_parallel workers are forked up front; those with task id not
+        below the num park before taking the next chunk, see wait_active().
+    """
+    interval = 10
+    min_gain = 0.05
+    checkpoint_age_limit = 0.75
+
+    def __init__(self, min_parallel, max_parallel, watch_server):
+        super(ConcurrencyController, self).__init__()
+        self.daemon = True
+        self.min_parallel = min(max(min_parallel, 1), max_parallel)
+        self.max_parallel = max_parallel
+        self.watch_server = watch_server
+        self.active = Value(ctypes.c_int, self.min_parallel, lock=False)
+        self.stopped = threading.Event()
+        self.direction = 1
+        self.last_time = time.time()
+        self.last_bytes = 0
+        self.last_throughput = None
+        self.last_row_lock_waits = None
+        self.redo_log_capacity = None
+        if watch_server:
+            self.redo_log_capacity = get_redo_log_capacity()
+
+    def run(self):
+        print_info("[auto parallel] Start with {} of max {} workers".format(self.active.value, self.max_parallel))
+        while not self.stopped.wait(self.interval):
+            self.adjust()
+
+    def stop(self):
+        """ Stop adjusting, and wake all parked workers up to finish """
+        self.stopped.set()
+        self.active.value = self.max_parallel
+
+    def server_pressure(self):
+        """ Returns reason to reduce workers by server status, or None """
+        try:
+            values = get_server_load()
+        except Exception as e:
+            print_warn("[auto parallel] Failed to get server status: {}".format(str(e)))
+            return None
+        reasons = []
+        row_lock_waits = values.get('Innodb_row_lock_waits')
+        if row_lock_waits is not None and self.last_row_lock_waits is not None and \
+           row_lock_waits > self.last_row_lock_waits:
+            reasons.append("{} new row lock waits".format(row_lock_waits - self.last_row_lock_waits))
+        self.last_row_lock_waits = row_lock_waits
+        checkpoint_age = values.get('checkpoint_age')
+        if checkpoint_age is not None and self.redo_log_capacity and \
+           checkpoint_age > self.checkpoint_age_limit * self.redo_log_capacity:
+            reasons.append("checkpoint age {} of redo log capacity {}".format(
+                format_bytes(checkpoint_age), format_bytes(self.redo_log_capacity)))
+        print_if_verbose("[auto parallel] Server status: {}".format(
+            ", ".join(["{}={}".format(k, v) for k, v in sorted(values.items())])))
+        if len(reasons):
+            return ", ".join(reasons)
+        return None
+
+    def adjust(self):
+        now = time.time()
+        loaded = load_metrics.total.bytes
+        throughput = (loaded - self.last_bytes) / max(now - self.last_time, 0.001)
+        self.last_time = now
+        self.last_bytes = loaded
+        cur = self.active.value
+        step = max(cur // 4, 1)
+        pressure = None
+        if self.watch_server:
+            pressure = self.server_pressure()
+
+        if pressure is not None:
+            self.direction = -1
+            new = cur - step
+            reason = pressure
+        elif throughput <= 0:
+            # Nothing finished in this interval, e.g. chunks larger than interval
+            new = cur
+            reason = "no chunk loaded"
+        elif self.last_throughput is None:
+            new = cur + step
+            reason = "probing"
+        elif throughput > self.last_throughput * (1 + self.min_gain):
+            new = cur + self.direction * step
+            reason = "throughput up"
+        elif throughput < self.last_throughput * (1 - self.min_gain):
+            self.direction = -self.direction
+            new = cur + self.direction * step
+            reason = "throughput down"
+        elif self.direction > 0:
+            # More workers bring no gain, give back the last step
+            self.direction = -1
+            new = cur - step
+            reason = "throughput flat"
+        else:
+            new = cur
+            reason = "throughput flat"
+        if throughput > 0:
+            self.last_throughput = throughput
+        new = min(max(new, self.min_parallel), self.max_parallel)
+
+        msg = "[auto parallel] {} -> {} workers at {}/s ({})".format(cur, new, format_bytes(throughput), reason)
+        if new != cur:
+            print_info(msg)
+            self.active.value = new
+        else:
+            print_if_verbose(msg)
+
+def wait_active(task_id, is_done=None):
+    """
+        Park worker task_id while it is over the num of active workers of
+        concurrency_controller. Returns False if is_done() turns true while
+        parked, i.e. there is nothing left for this worker.
+    """
+    if concurrency_controller is None:
+        return True
+    while task_id >= concurrency_controller.active.value:
+        if is_done is not None and is_done():
+            return False
+        time.sleep(0.5)
+    return True
+
+def start_concurrency_controller():
+    """ Must be called before loading workers are forked """
+    global concurrency_controller
+    if not options.auto_parallel or options.parallel <= 1:
+        return
+    concurrency_controller = ConcurrencyController(options.min_parallel, options.parallel, options.watch_server)
+    concurrency_controller.start()
+
+def stop_concurrency_controller():
+    global concurrency_controller
+    if concurrency_controller is None:
+        return
+    concurrency_controller.stop()
+    concurrency_controller.join()
+    concurrency_controller = None
+
+def start_load_metrics(total_bytes=None):
+    """ Start collecting metrics; must be called before loading workers are forked """
+    global metrics_queue, load_metrics
+    if load_metrics is not None:
+        load_metrics.total_bytes = total_bytes
+        return
+    metrics_queue = Queue()
+    load_metrics = LoadMetrics(metrics_queue, options.progress_interval)
+    load_metrics.total_bytes = total_bytes
+    load_metrics.start()
+
+def write_run_report(elapsed_seconds, succeeded):
+    """
+        Write metrics of this run to report_file as JSON, and to
+        prometheus_file in Prometheus text format if given.
+    """
+    if load_metrics is None:
+        return
+    load_metrics.stop()
+    total = load_metrics.total
+    report = {
+        'input_file': input_file,
+        'database': options.database,
+        'options': dict((name, getattr(options, name)) for name in [
+            'parallel', 'table_parallel', 'split_parallel', 'line_per_file', 'chunk_size',
+            'rows_per_chunk', 'statement_size', 'streaming', 'load_data', 'defer_indexes',
+            'index_parallel', 'schema_parallel', 'max_retries', 'resume', 'split_only', 'targets',
+            'fanout', 'routes', 'verify', 'verify_parallel', 'tables', 'exclude_tables']),
+        'succeeded': succeeded,
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'split': {
+            'input_bytes': os.path.getsize(input_file) if os.path.exists(input_file) else 0,
+            'chunks': len(all_chunks),
+            'bytes': sum([chunk.size for chunk in all_chunks]),
+            'rows': sum([chunk.rows for chunk in all_chunks])},
+        'phase_seconds': dict((phase, round(seconds, 3)) for phase, seconds in phase_seconds.items()),
+        'total': total.to_dict(),
+        'bytes_per_second': round(total.bytes / max(elapsed_seconds, 0.001), 1),
+        'rows_per_second': round(total.rows / max(elapsed_seconds, 0.001), 1),
+        'chunk_load_seconds': {
+            'buckets': [[le, count] for le, count in load_metrics.latency_histogram()],
+            'sum': round(total.seconds, 3),
+            'count': total.chunks + total.failed_chunks},
+        'tables': dict((table, counters.to_dict()) for table, counters in load_metrics.tables.items()),
+        'workers': dict((str(task_id), counters.to_dict()) for task_id, counters in load_metrics.workers.items()),
+        'targets': dict((target, counters.to_dict()) for target, counters in load_metrics.targets.items()),
+    }
+    if len(verify_summary):
+        report['verify'] = verify_summary
+    with open(options.report_file, "w+") as f_report:
+        json.dump(report, f_report, indent=2, sort_keys=True)
+    print_msg("Run report is written to `{}`".format(options.report_file))
+
+    if not options.prometheus_file:
+        return
+    def label(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"')
+    lines = []
+    for name, attr, help_msg in [('bytes', 'bytes', 'Bytes of data chunks loaded'),
+                                 ('rows', 'rows', 'Rows loaded (estimated if INSERTs are not tokenized)'),
+                                 ('statements', 'stmts', 'Statements of data chunks loaded'),
+                                 ('chunks', 'chunks', 'Data chunks loaded'),
+                                 ('failed_chunks', 'failed_chunks', 'Data chunks failed after retries')]:
+        lines.append("# HELP pload_table_{}_total {}".format(name, help_msg))
+        lines.append("# TYPE pload_table_{}_total counter".format(name))
+        for table, counters in sorted(load_metrics.tables.items()):
+            lines.append('pload_table_{}_total{{table="{}"}} {}'.format(name, label(table), getattr(counters, attr)))
+        lines.append("# HELP pload_worker_{}_total {}".format(name, help_msg))
+        lines.append("# TYPE pload_worker_{}_total counter".format(name))
+        for task_id, counters in sorted(load_metrics.workers.items()):
+            lines.append('pload_worker_{}_total{{worker="{}"}} {}'.format(name, task_id, getattr(counters, attr)))
+        if len(load_metrics.targets):
+            lines.append("# HELP pload_target_{}_total {}".format(name, help_msg))
+            lines.append("# TYPE pload_target_{}_total counter".format(name))
+            for target, counters in sorted(load_metrics.targets.items()):
+                lines.append('pload_target_{}_total{{target="{}"}} {}'.format(name, label(target), getattr(counters, attr)))
+    lines.append("# HELP pload_chunk_load_seconds Latency of loading a data chunk")
+    lines.append("# TYPE pload_chunk_load_seconds histogram")
+    for le, count in load_metrics.latency_histogram():
+        lines.append('pload_chunk_load_seconds_bucket{{le="{}"}} {}'.format(le, count))
+    lines.append("pload_chunk_load_seconds_sum {}".format(total.seconds))
+    lines.append("pload_chunk_load_seconds_count {}".format(total.chunks + total.failed_chunks))
+    lines.append("# HELP pload_phase_seconds Duration of loading phases")
+    lines.append("# TYPE pload_phase_seconds gauge")
+    for phase, seconds in sorted(phase_seconds.items()):
+        lines.append('pload_phase_seconds{{phase="{}"}} {}'.format(phase, seconds))
+    lines.append("# HELP pload_elapsed_seconds Duration of the whole run")
+    lines.append("# TYPE pload_elapsed_seconds gauge")
+    lines.append("pload_elapsed_seconds {}".format(elapsed_seconds))
+    if len(verify_summary):
+        lines.append("# HELP pload_verify_mismatched_tables Tables not matching the dump after loading")
+        lines.append("# TYPE pload_verify_mismatched_tables gauge")
+        lines.append("pload_verify_mismatched_tables {}".format(len(verify_summary['mismatched'])))
+    lines.append("# HELP pload_success Whether all data chunks and indexes are loaded")
+    lines.append("# TYPE pload_success gauge")
+    lines.append("pload_success {}".format(1 if succeeded else 0))
+    # Textfile collectors may read at any time, so replace the file by rename
+    tmp_prometheus_file = options.prometheus_file + ".tmp"
+    with open(tmp_prometheus_file, "w+") as f_prom:
+        f_prom.write("\n".join(lines) + "\n")
+    os.rename(tmp_prometheus_file, options.prometheus_file)
+    print_msg("Prometheus metrics are written to `{}`".format(options.prometheus_file))
+
+class MysqlSession:
+    """
+        A long-lived mysql client process fed through its stdin, so that a
+        loading worker pays process spawn, connect and auth only once.
+
+        After every chunk a marker query is sent; reading the marker back
+        means the chunk is done, while EOF means the client aborted on an
+        error inside the chunk. The session is restarted for the next chunk.
+    """
+    def __init__(self, db, task_id=0):
+        self.db = db
+        self.task_id = task_id
+        self.process = None
+        self.err_file = None
+        self.marker_seq = 0
+        self.connect_cnt = 0
+
+    def start(self):
+        cmd = "{mysql_exe_cmd} --batch --skip-column-names {infile_arg}{db_arg}".format(
+                mysql_exe_cmd=get_mysql_exe_cmd(), db_arg=self.db,
+                infile_arg="--local-infile=1 " if options.load_data else "")
+        print_if_verbose("[task {task_id_arg}] Start mysql session: `{cmd_arg}`".format(
+            task_id_arg=self.task_id, cmd_arg=cmd))
+        self.err_file = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(shlex.split(cmd), shell=False,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=self.err_file)
+        self.connect_cnt += 1
+        if os.path.exists(session_preamble_file):
+            with open(session_preamble_file, "rb") as f_preamble:
+                self.execute(f_preamble.read())
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self, data, atomic=False, database=None, on_line=None):
+        """
+            Run data in the session and return its output. With atomic, data
+            is run in a single transaction, which is rolled back as the client
+            exits on error. With database, data is run in that database
+            instead of db. With on_line, every output line is passed to it
+            instead of being returned.
+        """
+        if not self.is_alive():
+            self.start()
+        self.marker_seq += 1
+        marker = "pload_done_{}_{}".format(self.task_id, self.marker_seq).encode()
+        try:
+            if database is not None:
+                self.process.stdin.write(get_use_stmt(database))
+            if atomic:
+                self.process.stdin.write(b"START TRANSACTION;\n")
+            self.process.stdin.write(data)
+            if not data.endswith(b'\n'):
+                self.process.stdin.write(b'\n')
+            if atomic:
+                self.process.stdin.write(b"COMMIT;\n")
+            self.process.stdin.write(b"SELECT '" + marker + b"';\n")
+            self.process.stdin.flush()
+        except (IOError, OSError) as e:
+            if e.errno != errno.EPIPE:
+                raise
+        output = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                break
+            if line.rstrip() == marker:
+                return b''.join(output)
+            if on_line is not None:
+                on_line(line)
+            else:
+                output.append(line)
+        retcode = self.process.wait()
+        self.err_file.seek(0)
+        err = self.err_file.read().decode('utf-8', 'replace').strip()
+        self.close()
+        raise Exception("mysql session exited with error code {}, err: {}".format(retcode, err))
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except (IOError, OSError):
+            pass
+        self.process.wait()
+        self.err_file.close()
+        self.process = None
+        self.err_file = None
+
+def get_chunk_task_info(chunk, total_file_cnt=None):
+    if total_file_cnt is not None:
+        return "({}/{})".format(chunk.idx, total_file_cnt)
+    return "({})".format(chunk.idx)
+
+def read_chunk(task_id, chunk, data=None, total_file_cnt=None):
+    """
+        Returns SQL of chunk, read from its data file or the input file
+        unless kept in memory as data.
+    """
+    task_info = get_chunk_task_info(chunk, total_file_cnt)
+    if chunk.in_input:
+        print_msg("[task {task_id_arg}] {task_arg} Loading bytes [{start_arg}, {end_arg}) of input file".format(
+            task_id_arg=task_id, task_arg=task_info, start_arg=chunk.input_start, end_arg=chunk.input_end))
+        data = read_input_range(chunk.input_start, chunk.input_end)
+    elif chunk.path is not None:
+        print_msg("[task {task_id_arg}] {task_arg} Loading file `{file_arg}`".format(
+            task_id_arg=task_id, task_arg=task_info, file_arg=chunk.path))
+        with open(chunk.path, "rb") as f_data:
+            data = f_data.read()
+    else:
+        print_msg("[task {task_id_arg}] {task_arg} Loading chunk of {size_arg} bytes".format(
+            task_id_arg=task_id, task_arg=task_info, size_arg=len(data)))
+    return data
+
+def remove_chunk_files(task_id, chunk, total_file_cnt=None):
+    if chunk.path is not None and options.delete_after_load:
+        print_if_verbose("[task {task_id_arg}] {task_arg} File loaded, remove now: {file_arg}".format(
+                task_id_arg=task_id, task_arg=get_chunk_task_info(chunk, total_file_cnt), file_arg=chunk.path))
+        os.remove(chunk.path)
+    # Rows file of a streamed LOAD DATA chunk is not kept
+    if chunk.infile is not None and (chunk.path is None or options.delete_after_load):
+        os.remove(chunk.infile)
+
+def source_chunk(session, chunk, data=None, total_file_cnt=None):
+    data = read_chunk(session.task_id, chunk, data, total_file_cnt)
+
+    # A chunk is loaded all or nothing, so that it can be retried
+    try:
+        session.execute(data, True, chunk.database)
+    except Exception as e:
+        raise Exception("Failed to load chunk {}: {}".format(get_chunk_task_info(chunk, total_file_cnt), str(e)))
+
+    remove_chunk_files(session.task_id, chunk, total_file_cnt)
+
+def load_chunk(session, chunk, data=None, total_file_cnt=None):
+    """
+        source_chunk() with up to max_retries retries on failure. Status of
+        the chunk is recorded in status_file, and load time in metrics.
+        Returns True if loaded.
+    """
+    key = chunk_key(chunk.idx)
+    set_status(key, STATUS_LOADING)
+    max_retries = max(options.max_retries, 0)
+    for retry in range(max_retries + 1):
+        if retry > 0:
+            print_warn("[task {}] Retry chunk ({}), {}/{}".format(session.task_id, chunk.idx, retry, max_retries))
+        start = time.time()
+        try:
+            source_chunk(session, chunk, data, total_file_cnt)
+            record_chunk_metrics(session.task_id, chunk, time.time() - start, True, retry)
+            set_status(key, STATUS_DONE)
+            return True
+        except Exception as e:
+            print_msg("Exception when insert data: {}".format(str(e)))
+    record_chunk_metrics(session.task_id, chunk, time.time() - start, False, max_retries)
+    set_status(key, STATUS_FAILED)
+    return False
 
 def source_single_file(db, file_path, task_id=0, cur_file_idx = None, total_file_cnt = None):
     cmd = "{mysql_exe_cmd} {db_arg} -e 'source {file_arg}'".format(
@@ -321,6 +2309,8 @@ def source_single_file(db, file_path, task_id=0, cur_file_idx = None, total_file
     task_info = ""
     if cur_file_idx is not None and total_file_cnt is not None:
         task_info = "({}/{})".format(cur_file_idx, total_file_cnt)
+    elif cur_file_idx is not None:
+        task_info = "({})".format(cur_file_idx)
 
     if options.verbose:
         print_msg("[task {task_id_arg}] {task_arg} cmd: `{cmd_arg}`".format(
@@ -347,7 +2337,7 @@ class MyProcess(Process):
         try:
             self.work()
         except Exception as e:
-            print_msg(e.message)
+            print_msg(str(e))
             traceback.print_exc()
             sys.exit(1)
 
@@ -372,6 +2362,12 @@ class MyProcessPool:
             p.join()
             self.results.append(p.exitcode)
 
+    def isAlive(self):
+        for p in self.process:
+            if p.is_alive():
+                return True
+        return False
+
     def getResult(self):
         for result in self.results:
             if result != 0:
@@ -399,37 +2395,408 @@ class MyAtomicCounter:
         with self.counter.get_lock():
             self.counter.value = value
 
+class SplitWorker(MyProcess):
+    def __init__(self, range_id, start, end, line_counter, insert_row_counter, database=None):
+        super(SplitWorker, self).__init__()
+        self.range_id = range_id
+        self.database = database
+        self.start_pos = start
+        self.end_pos = end
+        self.line_counter = line_counter
+        self.insert_row_counter = insert_row_counter
+
+    def work(self):
+        splitter = DumpSplitter(None, self.range_id, self.database)
+        with open(input_file, "rb") as ifile:
+            mm = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+            with open(schema_part_file(self.range_id), "wb+") as f_schema:
+                splitter.split(MmapRangeReader(mm, self.start_pos, self.end_pos), f_schema, self.start_pos)
+            mm.close()
+        with open(chunk_list_file(self.range_id), "w+") as f_list:
+            for chunk in splitter.chunks:
+                f_list.write(json.dumps(chunk.to_dict()) + "\n")
+        self.line_counter.increment(splitter.total_lines)
+        self.insert_row_counter.increment(splitter.insert_rows)
+
+def schema_part_file(range_id):
+    return os.path.join(tmp_dir, "f_schema_part_{}.sql".format(range_id))
+
+def chunk_list_file(range_id):
+    return os.path.join(tmp_dir, "f_chunks_{}.lst".format(range_id))
+
+def get_database_at(mm, pos):
+    """ Database of the last USE statement before pos of the memory-mapped dump """
+    use_pos = mm.rfind(b'\nUSE ', 0, pos)
+    if use_pos >= 0:
+        use_pos += 1
+    elif pos > 0 and mm[:4] == b'USE ':
+        use_pos = 0
+    else:
+        return None
+    eol = mm.find(b'\n', use_pos)
+    return get_use_database(mm[use_pos:eol if eol >= 0 else len(mm)])
+
+def split_file_parallel():
+    """
+        Split input file by options.split_parallel processes. The file is
+        memory-mapped and cut into byte ranges, each range boundary is moved
+        to the start of the next INSERT line, so that no statement spans two
+        ranges (mysqldump escapes newlines inside strings). Schema parts and
+        chunk lists of all ranges are then concatenated in range order.
+        Each range starts in the database of the last USE statement before it.
+    """
+    file_size = os.path.getsize(input_file)
+    boundaries = [0]
+    databases = [None]
+    with open(input_file, "rb") as ifile:
+        mm = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+        for i in range(1, options.split_parallel):
+            pos = max(file_size * i // options.split_parallel, boundaries[-1])
+            next_insert = mm.find(b'\nINSERT', max(pos - 1, 0))
+            boundaries.append(file_size if next_insert < 0 else next_insert + 1)
+            databases.append(get_database_at(mm, boundaries[-1]))
+        mm.close()
+    boundaries.append(file_size)
+
+    line_counter = MyAtomicCounter()
+    insert_row_counter = MyAtomicCounter()
+    split_pool = MyProcessPool()
+    for range_id in range(options.split_parallel):
+        print_if_verbose("Split byte range [{}, {}) by worker {}".format(
+            boundaries[range_id], boundaries[range_id + 1], range_id))
+        split_pool.addProcess(SplitWorker(range_id, boundaries[range_id],
+                                          boundaries[range_id + 1], line_counter,
+                                          insert_row_counter, databases[range_id]))
+    split_pool.start()
+    split_pool.join()
+    if not split_pool.getResult():
+        raise Exception("Failed to split input file in parallel")
+
+    chunks = []
+    with open(schema_file, "wb+") as f_schema:
+        for range_id in range(options.split_parallel):
+            with open(schema_part_file(range_id), "rb") as f_part:
+                shutil.copyfileobj(f_part, f_schema)
+            os.remove(schema_part_file(range_id))
+            with open(chunk_list_file(range_id), "r") as f_list:
+                for line in f_list:
+                    chunk = ChunkInfo.from_dict(json.loads(line))
+                    chunk.idx = len(chunks)
+                    chunks.append(chunk)
+            os.remove(chunk_list_file(range_id))
+    return chunks, line_counter.get(), insert_row_counter.get()
+
+class TableScheduler:
+    """
+        Hand out data chunks to loading workers table by table.
+
+        Tables are ordered by size, largest first. Each worker takes the next
+        chunk (in dump order) of the table with the most remaining bytes per
+        worker already loading it, so workers are spread across tables in
+        proportion to their remaining work and big tables are not left to a
+        single worker at the end. With table_parallel no more than that num
+        of workers load the same table at a time.
+
+        Chunks of waiting_tables are not handed out until table_ready() is
+        called for them, i.e. their tables are created by SchemaWorker.
+
+        State is kept in shared memory, so the scheduler is created before
+        workers are forked and used from all of them.
+    """
+    def __init__(self, chunks, table_parallel=0, waiting_tables=None):
+        self.table_parallel = max(table_parallel, 0)
+        table_bytes = {}
+        table_chunks = {}
+        for chunk in chunks:
+            table_bytes[chunk.table] = table_bytes.get(chunk.table, 0) + chunk.size
+            table_chunks.setdefault(chunk.table, []).append(chunk.idx)
+        self.tables = sorted(table_chunks.keys(), key=lambda t: -table_bytes[t])
+        self.table_index = dict((t, i) for i, t in enumerate(self.tables))
+        self.table_chunks = [table_chunks[t] for t in self.tables]
+        self.chunk_sizes = dict((chunk.idx, chunk.size) for chunk in chunks)
+        self.lock = Lock()
+        self.next_pos = Array(ctypes.c_long, len(self.tables), lock=False)
+        self.active = Array(ctypes.c_long, len(self.tables), lock=False)
+        self.remaining_bytes = Array(ctypes.c_longlong, [table_bytes[t] for t in self.tables], lock=False)
+        waiting_tables = waiting_tables or set()
+        self.ready = Array(ctypes.c_int, [0 if t in waiting_tables else 1 for t in self.tables], lock=False)
+
+    def pick_table(self):
+        """ Returns index of table to load next, -1 if all done, None to wait """
+        best = None
+        best_score = None
+        pending = False
+        for i in range(len(self.tables)):
+            if self.next_pos[i] >= len(self.table_chunks[i]):
+                continue
+            pending = True
+            if not self.ready[i]:
+                continue
+            if self.table_parallel > 0 and self.active[i] >= self.table_parallel:
+                continue
+            score = float(self.remaining_bytes[i]) / (self.active[i] + 1)
+            if best_score is None or score > best_score:
+                best = i
+                best_score = score
+        if best is None and not pending:
+            return -1
+        return best
+
+    def done(self):
+        """ Returns True if all chunks are handed out """
+        with self.lock:
+            return self.pick_table() == -1
+
+    def next_chunk(self, wait=True):
+        """
+            Returns (table index, chunk index) of the next chunk to load, or
+            (-1, -1) if all chunks are handed out. The caller calls
+            release_table() with the table index once the chunk is loaded.
+            Without wait, (None, None) is returned instead of waiting for a
+            table under table_parallel.
+        """
+        while True:
+            with self.lock:
+                table_idx = self.pick_table()
+                if table_idx == -1:
+                    return -1, -1
+                if table_idx is not None:
+                    chunk_idx = self.table_chunks[table_idx][self.next_pos[table_idx]]
+                    self.next_pos[table_idx] += 1
+                    self.active[table_idx] += 1
+                    self.remaining_bytes[table_idx] -= self.chunk_sizes[chunk_idx]
+                    return table_idx, chunk_idx
+            # All tables with pending chunks are at table_parallel
+            if not wait:
+                return None, None
+            time.sleep(0.05)
+
+    def release_table(self, table_idx):
+        with self.lock:
+            self.active[table_idx] -= 1
+
+    def table_ready(self, table, ok=True):
+        """ Hand out chunks of table from now on, or skip them if it was not created """
+        if table not in self.table_index:
+            return
+        table_idx = self.table_index[table]
+        with self.lock:
+            if not ok:
+                self.next_pos[table_idx] = len(self.table_chunks[table_idx])
+                self.remaining_bytes[table_idx] = 0
+            self.ready[table_idx] = 1
+
+    def all_ready(self):
+        with self.lock:
+            for i in range(len(self.tables)):
+                self.ready[i] = 1
+
 class InsertWorker(MyProcess):
-    def __init__(self, counter, task_id):
+    def __init__(self, scheduler, task_id, target=None):
         super(MyProcess, self).__init__()
-        self.counter = counter
+        self.scheduler = scheduler
         self.task_id = task_id
+        self.target = target
 
     def run(self):
-       total_file_cnt = len(all_data_files)
+       if self.target is not None:
+           use_target(self.target)
+       total_file_cnt = len(all_chunks)
+       session = MysqlSession(options.database, self.task_id)
        while True:
-           cur_idx = self.counter.increment(1)
-           cur_idx -= 1
-           if cur_idx >= total_file_cnt:
+           if not wait_active(self.task_id, self.scheduler.done):
                break
-           try:
-               source_single_file(options.database, all_data_files[cur_idx],
-                                  self.task_id, cur_idx, total_file_cnt)
-           except Exception as e:
-               print_msg("Exception when insert data: {}".format(str(e)))
+           table_idx, cur_idx = self.scheduler.next_chunk()
+           if cur_idx < 0:
+               break
+           load_chunk(session, all_chunks[cur_idx], None, total_file_cnt)
+           self.scheduler.release_table(table_idx)
+       session.close()
+       print_if_verbose("[task {}] Done with {} connection(s)".format(self.task_id, session.connect_cnt))
+
+def source_parallel(target_chunks, target_units=None):
+    """
+        Load chunks of every (target, chunks) of target_chunks by a pool of
+        options.parallel workers of its own; pools of all targets run at the
+        same time. Target is None for the server of the options.
 
-def source_parallel():
+        Table units in target_units (target -> schema units) are created by
+        options.schema_parallel SchemaWorker of the same pool, and data of a
+        table is loaded once it is created.
+    """
     process_pool = MyProcessPool()
-    atomic_count = MyAtomicCounter()
-    for task_id in range(options.parallel):
-        new_process = InsertWorker(atomic_count, task_id)
-        process_pool.addProcess(new_process)
+    for target, chunks in target_chunks:
+        table_units = [unit for unit in (target_units or {}).get(target, []) if unit.kind == 'table']
+        scheduler = None
+        if len(chunks):
+            waiting_tables = get_waiting_tables(chunks, table_units) if len(table_units) else None
+            scheduler = TableScheduler(chunks, options.table_parallel, waiting_tables)
+            print_if_verbose("Tables in loading order{}: {}".format(
+                "" if target is None else " of " + target.name, ", ".join(scheduler.tables)))
+            for i in range(options.parallel):
+                # Task ids are unique across targets
+                new_process = InsertWorker(scheduler, len(process_pool.process), target)
+                process_pool.addProcess(new_process)
+        if len(table_units):
+            print_info("Creating {} tables{} by {} sessions".format(
+                len(table_units), "" if target is None else " on " + target.name, options.schema_parallel))
+            counter = MyAtomicCounter()
+            done_counter = MyAtomicCounter()
+            for i in range(max(min(options.schema_parallel, len(table_units)), 1)):
+                process_pool.addProcess(SchemaWorker(counter, done_counter, len(process_pool.process),
+                                                     table_units, scheduler, target))
+    start_concurrency_controller()
     process_pool.start()
     process_pool.join()
+    stop_concurrency_controller()
     res = process_pool.getResult()
     if not res:
         print_msg("Loading failed with unknown error")
 
+class AsyncChunkSource:
+    """
+        Chunks and per-chunk bookkeeping for the asyncio engine in
+        pload_async.py: hands out chunks by TableScheduler without blocking
+        the event loop, and records status and metrics of loaded chunks the
+        same way as load_chunk(). read_chunk(), mark_loading() and
+        mark_done() do file I/O (status records are synced to disk), and
+        are run in an executor by pload_async.py.
+    """
+    def __init__(self, chunks):
+        self.scheduler = TableScheduler(chunks, options.table_parallel)
+        # Chunk index -> table index in scheduler, of chunks being loaded
+        self.loading_tables = {}
+        self.total_file_cnt = len(all_chunks)
+        self.max_retries = max(options.max_retries, 0)
+        # Leave room for the packet header
+        self.max_packet = get_max_allowed_packet() - 1024
+        self.preamble = b''
+        if os.path.exists(session_preamble_file):
+            with open(session_preamble_file, "rb") as f_preamble:
+                self.preamble = f_preamble.read()
+        self.connect_args = {'user': options.user, 'password': options.password,
+                             'db': options.database, 'local_infile': options.load_data}
+        if len(options.socket):
+            self.connect_args['unix_socket'] = options.socket
+        else:
+            self.connect_args['host'] = options.host
+            self.connect_args['port'] = int(options.port)
+
+    def next_chunk(self, task_id):
+        """ Returns next chunk to load, None to wait, or False if there is none left """
+        if concurrency_controller is not None and task_id >= concurrency_controller.active.value:
+            if self.scheduler.done():
+                return False
+            return None
+        table_idx, chunk_idx = self.scheduler.next_chunk(False)
+        if table_idx is None:
+            return None
+        if chunk_idx < 0:
+            return False
+        self.loading_tables[chunk_idx] = table_idx
+        return all_chunks[chunk_idx]
+
+    def mark_loading(self, chunk):
+        set_status(chunk_key(chunk.idx), STATUS_LOADING)
+
+    def read_chunk(self, task_id, chunk):
+        return read_chunk(task_id, chunk, None, self.total_file_cnt)
+
+    def retry_chunk(self, task_id, chunk, retry, e):
+        print_msg("Exception when insert data: Failed to load chunk {}: {}".format(
+            get_chunk_task_info(chunk, self.total_file_cnt), str(e)))
+        if retry < self.max_retries:
+            print_warn("[task {}] Retry chunk ({}), {}/{}".format(task_id, chunk.idx, retry + 1, self.max_retries))
+
+    def chunk_done(self, task_id, chunk, seconds, retries, ok):
+        self.scheduler.release_table(self.loading_tables.pop(chunk.idx))
+        record_chunk_metrics(task_id, chunk, seconds, ok, retries)
+
+    def mark_done(self, task_id, chunk, ok):
+        if ok:
+            remove_chunk_files(task_id, chunk, self.total_file_cnt)
+            set_status(chunk_key(chunk.idx), STATUS_DONE)
+        else:
+            set_status(chunk_key(chunk.idx), STATUS_FAILED)
+
+def source_async(chunks):
+    """
+        Load chunks with options.parallel connections driven by one event
+        loop, see pload_async.py.
+    """
+    if sys.version_info < (3, 7):
+        raise Exception("--engine async needs Python 3.7 or later")
+    # Imported only here, the module is Python 3 only
+    import pload_async
+    source = AsyncChunkSource(chunks)
+    start_concurrency_controller()
+    try:
+        pload_async.run(source, options.parallel)
+    finally:
+        stop_concurrency_controller()
+
+class StreamingInsertWorker(MyProcess):
+    def __init__(self, chunk_queue, task_id):
+        super(MyProcess, self).__init__()
+        self.chunk_queue = chunk_queue
+        self.task_id = task_id
+
+    def run(self):
+       session = MysqlSession(options.database, self.task_id)
+       while True:
+           wait_active(self.task_id)
+           item = self.chunk_queue.get()
+           if item is None:
+               break
+           chunk, data = item
+           load_chunk(session, chunk, data)
+       session.close()
+       print_if_verbose("[task {}] Done with {} connection(s)".format(self.task_id, session.connect_cnt))
+
+streaming_pool = None
+
+# Blocks while max_pending_chunks data files are waiting to be loaded, which
+# throttles the splitter down to the loading speed.
+def put_chunk(chunk_queue, item):
+    while True:
+        try:
+            chunk_queue.put(item, True, 1)
+            return
+        except Full:
+            if not streaming_pool.isAlive():
+                raise Exception("All loading workers exited, stop splitting")
+
+def split_and_source_streaming():
+    global streaming_pool
+    max_pending_chunks = options.max_pending_chunks
+    if max_pending_chunks <= 0:
+        max_pending_chunks = 2 * options.parallel
+    chunk_queue = Queue(max_pending_chunks)
+    streaming_pool = MyProcessPool()
+    for task_id in range(max(options.parallel, 1)):
+        new_process = StreamingInsertWorker(chunk_queue, task_id)
+        streaming_pool.addProcess(new_process)
+    start_concurrency_controller()
+    streaming_pool.start()
+
+    schema_tail_file = None
+    try:
+        schema_tail_file = split_file(chunk_queue)
+    finally:
+        # Make sure workers exit even if splitting failed, parked ones too
+        stop_concurrency_controller()
+        for task_id in range(max(options.parallel, 1)):
+            chunk_queue.put(None)
+        streaming_pool.join()
+
+    res = streaming_pool.getResult()
+    if not res:
+        print_msg("Loading failed with unknown error")
+
+    if schema_tail_file is not None:
+        print_msg("Load schema statements after data `{}` using single thread".format(schema_tail_file))
+        source_single_file(options.database, schema_tail_file)
+
 def do_create_db(database):
     create_db_cmd = ("{mysql_exec_arg} -e 'CREATE DATABASE IF NOT EXISTS {db_arg}'").format(
             mysql_exec_arg=get_mysql_exe_cmd(), db_arg=database)
@@ -513,19 +2880,924 @@ def get_innodb_flush_log_at_trx_commit():
     print_if_verbose("Current innodb_flush_log_at_trx_commit setting: {}".format(val))
     return val
 
+def get_max_allowed_packet():
+    cmd = """ {mysql_exec_arg} -e "SHOW VARIABLES LIKE 'max_allowed_packet'" """.format(mysql_exec_arg=get_mysql_exe_cmd())
+    cmd_res = check_output(cmd)
+    res = re.findall(r'max_allowed_packet\t(.*)', cmd_res, re.MULTILINE)
+    if len(res) < 1:
+        print_msg("Fail to get max_allowed_packet variable from mysqld; SHOW VARIABLES result is:\n{}".format(cmd_res))
+        exit(1)
+    val = int(res[0])
+    print_if_verbose("Current max_allowed_packet setting: {}".format(val))
+    return val
+
 def do_set_innodb_flush_log_at_trx_commit(new_val):
     cmd = """ {mysql_exec_arg} -e "SET GLOBAL innodb_flush_log_at_trx_commit = {new_val_arg}" """.format(
             mysql_exec_arg=get_mysql_exe_cmd(), new_val_arg=new_val)
     check_output(cmd)
 
+#
+# Deferred secondary index build
+#
+index_def_re = re.compile(br'^\s+(?:UNIQUE\s+)?(?:KEY|INDEX)\s')
+unique_def_re = re.compile(br'^\s+UNIQUE\s')
+primary_key_re = re.compile(br'^\s+PRIMARY\s+KEY\s')
+foreign_key_re = re.compile(br'^\s+(?:CONSTRAINT\s.*)?FOREIGN\s+KEY\s')
+column_def_re = re.compile(br'^\s+(`(?:[^`]|``)+`)\s')
+index_columns_re = re.compile(br'\(\s*(`(?:[^`]|``)+`)')
+create_table_re = re.compile(br'^CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(`(?:[^`]|``)+`)')
 
-def remove_secondary_indexes():
-    pass
+def split_table_indexes(table_lines):
+    """
+        Split definition lines of a CREATE TABLE statement (one definition
+        per line as written by mysqldump) into lines to keep and deferrable
+        secondary index definitions.
+
+        Tables with foreign keys are kept as they are, as FKs need their
+        indexes. Unique keys of a table without primary key may be picked as
+        clustered index, and the index leading with an AUTO_INCREMENT column
+        is required, so these are kept too. FULLTEXT and SPATIAL indexes are
+        always kept, InnoDB can't add several of them in one ALTER TABLE.
+    """
+    has_primary_key = False
+    auto_inc_columns = []
+    for line in table_lines:
+        if foreign_key_re.match(line):
+            return table_lines, []
+        if primary_key_re.match(line):
+            has_primary_key = True
+        m = column_def_re.match(line)
+        if m is not None and b'AUTO_INCREMENT' in line.upper():
+            auto_inc_columns.append(m.group(1))
+
+    keep_lines = []
+    index_defs = []
+    for line in table_lines:
+        if index_def_re.match(line) is None or \
+           (not has_primary_key and unique_def_re.match(line)):
+            keep_lines.append(line)
+            continue
+        m = index_columns_re.search(line)
+        if m is not None and m.group(1) in auto_inc_columns:
+            keep_lines.append(line)
+            continue
+        index_defs.append(line.strip().rstrip(b','))
+    # The last definition must not end with comma
+    if len(index_defs) and len(keep_lines):
+        last = keep_lines[-1].rstrip(b'\n').rstrip()
+        if last.endswith(b','):
+            keep_lines[-1] = last[:-1] + b'\n'
+    return keep_lines, index_defs
+
+def remove_secondary_indexes(schema_lines):
+    """
+        Remove secondary index definitions from CREATE TABLE statements in
+        schema_lines, so that tables are created with primary key only.
+        Returns the new schema lines; the ALTER TABLE statements to build the
+        removed indexes are added to index_recover_ddl_stmts and appended to
+        index_recover_ddl_stmts_file before any data is loaded.
+    """
+    new_lines = []
+    recover_stmts = []
+    database = None
+    table = None
+    table_lines = []
+    for line in schema_lines:
+        if table is None:
+            use_database = get_use_database(line)
+            if use_database is not None:
+                database = use_database
+            m = create_table_re.match(line)
+            if m is not None:
+                table = m.group(1).decode('utf-8', 'replace')
+            new_lines.append(line)
+            continue
+        if not line.startswith(b')'):
+            table_lines.append(line)
+            continue
+        keep_lines, index_defs = split_table_indexes(table_lines)
+        new_lines.extend(keep_lines)
+        new_lines.append(line)
+        if len(index_defs):
+            stmt = "ALTER TABLE {} {};".format(qualify_table(database or options.database, table), ", ".join(
+                ["ADD " + d.decode('utf-8', 'replace') for d in index_defs]))
+            # Named as tables of data chunks
+            recover_stmts.append((qualify_table(database, table), stmt))
+        table = None
+        table_lines = []
+    if table is not None:
+        new_lines.extend(table_lines)
+
+    with open(index_recover_ddl_stmts_file, "a+") as f_recover:
+        for table, stmt in recover_stmts:
+            f_recover.write(stmt + "\n")
+    index_recover_ddl_stmts.extend(recover_stmts)
+    return new_lines
+
+class IndexBuildWorker(MyProcess):
+    def __init__(self, counter, task_id, stmts, target=None):
+        super(MyProcess, self).__init__()
+        self.counter = counter
+        self.task_id = task_id
+        self.stmts = stmts
+        self.target = target
+
+    def run(self):
+       if self.target is not None:
+           use_target(self.target)
+       session = MysqlSession(options.database, self.task_id)
+       total_cnt = len(self.stmts)
+       while True:
+           cur_idx = self.counter.increment(1) - 1
+           if cur_idx >= total_cnt:
+               break
+           table, stmt = self.stmts[cur_idx]
+           print_msg("[task {}] ({}/{}) Building secondary indexes of table {}".format(
+               self.task_id, cur_idx, total_cnt, table))
+           print_if_verbose("[task {}] {}".format(self.task_id, stmt))
+           set_status(index_key(table), STATUS_LOADING)
+           try:
+               session.execute(stmt.encode('utf-8'))
+               set_status(index_key(table), STATUS_DONE)
+           except Exception as e:
+               print_msg("Exception when building indexes of table {}: {}".format(table, str(e)))
+               set_status(index_key(table), STATUS_FAILED)
+       session.close()
+
+def recover_secondary_indexes():
+    statuses = read_status()
+    # Largest tables first, so that they don't run alone at the end
+    table_bytes = {}
+    for chunk in all_chunks:
+        table_bytes[chunk.table] = table_bytes.get(chunk.table, 0) + chunk.size
+    process_pool = MyProcessPool()
+    for target in (targets if is_fanout() else [None]):
+        if target is not None:
+            use_target(target)
+        # Indexes built before resuming
+        stmts = [(table, stmt) for table, stmt in index_recover_ddl_stmts
+                 if statuses.get(index_key(table)) != STATUS_DONE]
+        if not len(stmts):
+            continue
+        stmts.sort(key=lambda ts: -table_bytes.get(ts[0], 0))
+
+        print_info("Building secondary indexes of {} tables{} (parallel={}). DDL statements are in `{}`".format(
+            len(stmts), "" if target is None else " on " + target.name, options.index_parallel,
+            index_recover_ddl_stmts_file))
+        atomic_count = MyAtomicCounter()
+        for i in range(max(min(options.index_parallel, len(stmts)), 1)):
+            process_pool.addProcess(IndexBuildWorker(atomic_count, len(process_pool.process), stmts, target))
+    if not len(process_pool.process):
+        return
+    process_pool.start()
+    process_pool.join()
+    if not process_pool.getResult():
+        print_msg("Building secondary indexes failed with unknown error")
+
+#
+# Parallel schema creation
+#
+delimiter_re = re.compile(br'^DELIMITER\s+(\S+)', re.I)
+version_comment_re = re.compile(br'/\*!\d*|\*/')
+drop_stmt_re = re.compile(br'^DROP\s', re.I)
+# Statements around data of a table, which are meaningless without the data
+data_section_stmt_re = re.compile(br'^(?:UNLOCK\s+TABLES|LOCK\s+TABLES\s|ALTER\s+TABLE\s+\S+\s+(?:DISABLE|ENABLE)\s+KEYS)', re.I)
+# Restore of a session variable saved before the object, e.g. SET sql_mode = @saved_sql_mode
+restore_setting_re = re.compile(br'=\s*@saved_')
+schema_object_re = re.compile(br'^CREATE\s+(?:OR\s+REPLACE\s+)?(?:ALGORITHM\s*=\s*\w+\s+)?'
+                              br'(?:DEFINER\s*=\s*\S+\s+)?(?:SQL\s+SECURITY\s+\w+\s+)?(?:TEMPORARY\s+)?'
+                              br'(DATABASE|SCHEMA|TABLE|VIEW|TRIGGER|PROCEDURE|FUNCTION|EVENT)\s+'
+                              br'(?:IF\s+NOT\s+EXISTS\s+)?(`(?:[^`]|``)+`|[\w$]+)', re.I)
+SCHEMA_UNIT_KINDS = {b'DATABASE': 'database', b'SCHEMA': 'database', b'TABLE': 'table', b'VIEW': 'view'}
+
+class SchemaUnit:
+    """
+        DDL statements of one schema object, run by one session: the CREATE
+        statement with DROP statements and session settings around it.
+        Kind is database, table, view, or post for triggers, routines,
+        events and any other statement; desc names the object in logs.
+        settings are the session settings of the unit, which are kept when
+        the unit is filtered out.
+    """
+    def __init__(self, idx, kind, name, desc, database, lines):
+        self.idx = idx
+        self.kind = kind
+        self.name = name
+        self.desc = desc
+        self.database = database
+        self.data = b''.join(lines)
+        self.settings = b''.join([line for line in lines if is_session_setting(line)])
+
+def split_schema_units(schema_path):
+    """
+        Split the schema file into SchemaUnit in dump order. Statements are
+        ended by the current DELIMITER; USE statements are not kept but set
+        the database of the units after them. LOCK TABLES and DISABLE KEYS
+        around data, and settings after the last object which only restore
+        session variables of the dump, are dropped.
+    """
+    units = []
+    database = None
+    delimiter = b';'
+    # Statements before the CREATE statement of the next unit
+    pending = []
+    # Unit which the following restore settings belong to
+    unit = None
+    stmt = []
+    with open(schema_path, "rb") as f_schema:
+        for line in f_schema:
+            if not len(stmt):
+                if not len(line.strip()) or line.startswith(b'--'):
+                    continue
+                m = delimiter_re.match(line)
+                if m is not None:
+                    delimiter = m.group(1)
+                    if unit is not None and delimiter == b';':
+                        unit.data += line
+                    else:
+                        unit = None
+                        pending.append(line)
+                    continue
+            stmt.append(line)
+            if not line.rstrip().endswith(delimiter):
+                continue
+            text = b''.join(stmt)
+            stmt = []
+            plain = version_comment_re.sub(b'', text).strip()
+            use_database = get_use_database(plain)
+            if use_database is not None:
+                database = use_database
+                unit = None
+                continue
+            if data_section_stmt_re.match(plain):
+                continue
+            if is_session_setting(text):
+                if unit is not None and restore_setting_re.search(text):
+                    unit.data += text
+                    unit.settings += text
+                else:
+                    unit = None
+                    pending.append(text)
+                continue
+            if drop_stmt_re.match(plain):
+                unit = None
+                pending.append(text)
+                continue
+            m = schema_object_re.match(plain)
+            if m is not None:
+                kind = SCHEMA_UNIT_KINDS.get(m.group(1).upper(), 'post')
+                name = m.group(2).decode('utf-8', 'replace')
+                if kind == 'table':
+                    # Named as tables of data chunks
+                    name = qualify_table(database, name)
+                desc = "{} {}".format(m.group(1).decode('utf-8').lower(), name)
+            else:
+                kind = 'post'
+                name = plain.split(b'\n')[0][:64].decode('utf-8', 'replace')
+                desc = "`{}`".format(name)
+            unit = SchemaUnit(len(units), kind, name, desc, database, pending + [text])
+            units.append(unit)
+            pending = []
+    return units
+
+def filter_schema_file(schema_path):
+    """
+        Rewrite schema file without tables and views not selected by
+        --tables / --exclude_tables, keeping their session settings.
+    """
+    units = split_schema_units(schema_path)
+    database = None
+    skipped = 0
+    tmp_schema_path = schema_path + ".tmp"
+    with open(tmp_schema_path, "wb+") as f_schema:
+        for unit in units:
+            if unit.database != database and unit.database is not None:
+                f_schema.write(get_use_stmt(unit.database))
+                database = unit.database
+            if unit.kind in ('table', 'view') and not is_table_selected(qualify_table(unit.database, unit.name)):
+                f_schema.write(unit.settings)
+                skipped += 1
+            else:
+                f_schema.write(unit.data)
+    os.rename(tmp_schema_path, schema_path)
+    print_info("Skip {} tables and views not selected by --tables / --exclude_tables".format(skipped))
+
+def create_schema_unit(session, unit):
+    """ Run DDL of unit in session, returns True if created """
+    key = schema_unit_key(unit.idx)
+    print_msg("[task {}] ({}/{}) Creating {}".format(session.task_id, unit.idx, len(schema_units), unit.desc))
+    set_status(key, STATUS_LOADING)
+    try:
+        session.execute(unit.data, False, unit.database)
+    except Exception as e:
+        print_msg("Exception when creating {}: {}".format(unit.desc, str(e)))
+        set_status(key, STATUS_FAILED)
+        return False
+    set_status(key, STATUS_DONE)
+    return True
+
+def source_schema_units(units):
+    """ Create units one by one in dump order by a single session """
+    session = MysqlSession(options.database)
+    for unit in units:
+        create_schema_unit(session, unit)
+    session.close()
+
+class SchemaWorker(MyProcess):
+    """
+        Create table units of units, and let scheduler hand out data chunks
+        of each table once it is created. Tables of chunks without a unit
+        are made ready when all units are done.
+    """
+    def __init__(self, counter, done_counter, task_id, units, scheduler=None, target=None):
+        super(MyProcess, self).__init__()
+        self.counter = counter
+        self.done_counter = done_counter
+        self.task_id = task_id
+        self.units = units
+        self.scheduler = scheduler
+        self.target = target
+
+    def run(self):
+       if self.target is not None:
+           use_target(self.target)
+       session = MysqlSession(options.database, self.task_id)
+       total_cnt = len(self.units)
+       while True:
+           cur_idx = self.counter.increment(1) - 1
+           if cur_idx >= total_cnt:
+               break
+           unit = self.units[cur_idx]
+           ok = False
+           try:
+               ok = create_schema_unit(session, unit)
+           finally:
+               if self.scheduler is not None:
+                   self.scheduler.table_ready(unit.name, ok)
+                   if self.done_counter.increment(1) == total_cnt:
+                       self.scheduler.all_ready()
+       session.close()
+
+def get_waiting_tables(chunks, table_units):
+    """ Tables of chunks which may not exist until table_units are created """
+    pending_names = set([unit.name for unit in table_units])
+    created = set([unit.name for unit in schema_units if unit.kind == 'table' and unit.name not in pending_names])
+    return set([chunk.table for chunk in chunks if chunk.table not in created])
+
+#
+# Post-load verification
+#
+generated_column_re = re.compile(br'\sGENERATED\s+ALWAYS\s|\sAS\s*\(', re.I)
+
+def get_table_columns(schema_path):
+    """
+        Table (named as tables of data chunks) -> column names of CREATE
+        TABLE statements in schema_path, in table order. Generated columns
+        are left out, as their values are not in the dump.
+    """
+    columns = {}
+    database = None
+    table = None
+    with open(schema_path, "rb") as f_schema:
+        for line in f_schema:
+            if table is None:
+                use_database = get_use_database(line)
+                if use_database is not None:
+                    database = use_database
+                m = create_table_re.match(line)
+                if m is not None:
+                    table = qualify_table(database, m.group(1).decode('utf-8', 'replace'))
+                    columns[table] = []
+                continue
+            if line.startswith(b')'):
+                table = None
+                continue
+            m = column_def_re.match(line)
+            if m is not None and generated_column_re.search(line) is None:
+                columns[table].append(m.group(1).decode('utf-8', 'replace'))
+    return columns
+
+def get_checksum_expr(columns):
+    """ Server side counterpart of summing row_checksum() of all rows """
+    return "SUM(CRC32(CONCAT_WS(CHAR(31), {})))".format(
+        ", ".join(["IFNULL({}, CHAR(30))".format(column) for column in columns]))
+
+def get_table_stats(chunks):
+    """
+        Returns [(table, rows, checksum, columns)] of tables of chunks. The
+        checksum is None if any chunk of the table has none, or columns of
+        the table are unknown.
+    """
+    stats = {}
+    for chunk in chunks:
+        rows, checksum = stats.get(chunk.table, (0, 0))
+        if checksum is None or chunk.checksum is None:
+            checksum = None
+        else:
+            checksum += chunk.checksum
+        stats[chunk.table] = (rows + chunk.rows, checksum)
+    result = []
+    for table in sorted(stats.keys()):
+        rows, checksum = stats[table]
+        columns = table_columns.get(table)
+        if options.verify != "checksum" or not columns:
+            checksum = None
+        result.append((table, rows, checksum, columns))
+    return result
+
+def verify_key(table):
+    return target_key("verify {}".format(table))
+
+class VerifyWorker(MyProcess):
+    def __init__(self, counter, task_id, tables, target=None):
+        super(MyProcess, self).__init__()
+        self.counter = counter
+        self.task_id = task_id
+        self.tables = tables
+        self.target = target
+
+    def run(self):
+       if self.target is not None:
+           use_target(self.target)
+       target_info = "" if self.target is None else " on " + self.target.name
+       session = MysqlSession(options.database, self.task_id)
+       total_cnt = len(self.tables)
+       while True:
+           cur_idx = self.counter.increment(1) - 1
+           if cur_idx >= total_cnt:
+               break
+           table, rows, checksum, columns = self.tables[cur_idx]
+           print_if_verbose("[task {}] ({}/{}) Verifying table {}".format(self.task_id, cur_idx, total_cnt, table))
+           set_status(verify_key(table), STATUS_LOADING)
+           sql = "SELECT COUNT(*){} FROM {};".format(
+               "" if checksum is None else ", " + get_checksum_expr(columns), table)
+           try:
+               values = session.execute(sql.encode('utf-8')).split(b'\n')[0].split(b'\t')
+               loaded_rows = int(values[0])
+               # SUM() of no rows is NULL
+               loaded_checksum = 0 if checksum is None or values[1] == b'NULL' else int(values[1])
+           except Exception as e:
+               print_msg("Exception when verifying table {}: {}".format(table, str(e)))
+               set_status(verify_key(table), STATUS_FAILED)
+               continue
+           mismatches = []
+           if loaded_rows != rows:
+               mismatches.append("{} rows in dump, {} rows loaded".format(rows, loaded_rows))
+           if checksum is not None and loaded_checksum != checksum:
+               mismatches.append("checksum {} of dump, {} of loaded rows".format(checksum, loaded_checksum))
+           if len(mismatches):
+               print_warn("Table {}{} mismatches: {}".format(table, target_info, ", ".join(mismatches)))
+               set_status(verify_key(table), STATUS_FAILED)
+           else:
+               set_status(verify_key(table), STATUS_DONE)
+       session.close()
+
+def verify_tables():
+    """
+        Compare rows (and checksums) of tables counted while splitting with
+        the loaded tables, verify_parallel tables at a time per target.
+        Mismatched tables are marked failed in status_file.
+    """
+    chunks = all_chunks + streamed_chunks
+    if options.verify == "checksum" and not len(table_columns) and os.path.exists(schema_file):
+        table_columns.update(get_table_columns(schema_file))
+    process_pool = MyProcessPool()
+    target_tables = []
+    for target in (targets if is_fanout() else [None]):
+        tables = get_table_stats(get_target_chunks(chunks, target))
+        if not len(tables):
+            continue
+        target_tables.append((target, tables))
+        count_only = len([table for table, rows, checksum, columns in tables if checksum is None])
+        print_info("Verifying {} tables{} by {} (parallel={}){}".format(
+            len(tables), "" if target is None else " on " + target.name, options.verify, options.verify_parallel,
+            "" if options.verify == "count" or not count_only else ", {} of them by row count only".format(count_only)))
+        atomic_count = MyAtomicCounter()
+        for i in range(max(min(options.verify_parallel, len(tables)), 1)):
+            process_pool.addProcess(VerifyWorker(atomic_count, len(process_pool.process), tables, target))
+    if not len(process_pool.process):
+        return
+    process_pool.start()
+    process_pool.join()
+    if not process_pool.getResult():
+        print_msg("Verification failed with unknown error")
+
+    statuses = read_status()
+    mismatched = []
+    for target, tables in target_tables:
+        if target is not None:
+            use_target(target)
+        mismatched.extend([table if target is None else "{} on {}".format(table, target.name)
+                           for table, rows, checksum, columns in tables
+                           if statuses.get(verify_key(table)) != STATUS_DONE])
+    use_target(targets[0])
+    verify_summary['mode'] = options.verify
+    verify_summary['tables'] = sum([len(tables) for target, tables in target_tables])
+    verify_summary['mismatched'] = sorted(mismatched)
+    if len(mismatched):
+        print_warn("{} of {} tables mismatch after loading".format(len(mismatched), verify_summary['tables']))
+    else:
+        print_info("All {} tables match the dump".format(verify_summary['tables']))
+
+#
+# Parallel export
+#
+export_manifest_name = "pload_export.json"
+# Data types of columns exported as plain numbers, or as hex literals
+export_int_types = set(['tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint'])
+export_number_types = export_int_types | set(['decimal', 'numeric', 'float', 'double', 'real', 'year'])
+export_binary_types = set(['binary', 'varbinary', 'tinyblob', 'blob', 'mediumblob', 'longblob', 'geometry',
+                           'point', 'linestring', 'polygon', 'multipoint', 'multilinestring', 'multipolygon',
+                           'geometrycollection', 'geomcollection'])
+# Settings of exporting sessions, replayed by loading sessions
+export_session_settings = (b"/*!40101 SET NAMES utf8mb4 */;\n"
+                           b"/*!40103 SET TIME_ZONE='+00:00' */;\n"
+                           b"/*!40101 SET SQL_MODE='NO_AUTO_VALUE_ON_ZERO' */;\n")
+batch_escape_re = re.compile(br'\\(.)', re.S)
+batch_escapes = {b'n': b'\n', b't': b'\t', b'0': b'\0', b'\\': b'\\'}
+
+def unescape_batch(m):
+    return batch_escapes.get(m.group(1), b'\\' + m.group(1))
+
+def quote_string(value):
+    return "'{}'".format(value.replace('\\', '\\\\').replace("'", "\\'"))
+
+def query_rows(session, sql):
+    """ Returns rows of sql run in session, as lists of str """
+    output = session.execute(sql.encode('utf-8')).decode('utf-8', 'replace')
+    return [line.split('\t') for line in output.split('\n') if len(line)]
+
+def get_export_value_expr(column, data_type):
+    """ SQL expression rendering value of column as in an INSERT of mysqldump """
+    if data_type in export_number_types:
+        return "IFNULL({}, 'NULL')".format(column)
+    if data_type == 'bit':
+        return "IFNULL(CAST({} + 0 AS CHAR), 'NULL')".format(column)
+    if data_type in export_binary_types:
+        return "IF({0} IS NULL, 'NULL', IF(LENGTH({0}) = 0, '''''', CONCAT('0x', HEX({0}))))".format(column)
+    return "QUOTE({})".format(column)
+
+class ExportTask:
+    """
+        Rows of table to export into chunk file idx by sql, which returns
+        each row as a tuple of an INSERT. rows_checksum is False if the
+        rows can not be checksummed as loaded, see row_checksum().
+    """
+    def __init__(self, idx, table, sql, insert_prefix, rows_checksum, desc):
+        self.idx = idx
+        self.table = table
+        self.sql = sql
+        self.insert_prefix = insert_prefix
+        self.rows_checksum = rows_checksum
+        self.desc = desc
+
+def get_export_tasks(session, chunk_size):
+    """
+        Tasks exporting base tables of the database selected by --tables /
+        --exclude_tables, largest first. A table with a single integer
+        primary key is cut into key ranges of about chunk_size bytes by its
+        data length, any other table is exported by one task.
+    """
+    tasks = []
+    tables = query_rows(session, "SELECT TABLE_NAME, IFNULL(DATA_LENGTH, 0) FROM information_schema.TABLES "
+                                 "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE';")
+    for name, data_length in sorted(tables, key=lambda t: -int(t[1])):
+        table = quote_name(name)
+        if not is_table_selected(table):
+            continue
+        columns = query_rows(session, "SELECT COLUMN_NAME, DATA_TYPE, EXTRA, COLUMN_KEY FROM information_schema.COLUMNS "
+                                      "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = {} "
+                                      "ORDER BY ORDINAL_POSITION;".format(quote_string(name)))
+        # Generated columns are computed by the server
+        stored = [(quote_name(c[0]), c[1].lower()) for c in columns if 'GENERATED' not in c[2].upper()]
+        insert_prefix = "INSERT INTO {} ".format(table)
+        if len(stored) < len(columns):
+            insert_prefix += "({}) ".format(",".join([column for column, data_type in stored]))
+        insert_prefix += "VALUES "
+        rows_checksum = len(stored) == len(columns) and 'bit' not in [data_type for column, data_type in stored]
+        select = "SELECT CONCAT('(', CONCAT_WS(',', {}), ')') FROM {}".format(
+            ", ".join([get_export_value_expr(column, data_type) for column, data_type in stored]), table)
+        keys = [(quote_name(c[0]), c[1].lower()) for c in columns if c[3] == 'PRI']
+        conditions = [None]
+        if len(keys) == 1 and keys[0][1] in export_int_types and int(data_length) > chunk_size:
+            key = keys[0][0]
+            low, high = query_rows(session, "SELECT MIN({0}), MAX({0}) FROM {1};".format(key, table))[0]
+            if low != 'NULL':
+                low = int(low)
+                high = int(high)
+                num = max(min(int(data_length) // chunk_size + 1, high - low + 1), 1)
+                bounds = [low + (high - low + 1) * i // num for i in range(1, num)]
+                conditions = []
+                for i in range(num):
+                    cond = []
+                    if i > 0:
+                        cond.append("{} >= {}".format(key, bounds[i - 1]))
+                    if i < num - 1:
+                        cond.append("{} < {}".format(key, bounds[i]))
+                    conditions.append(" AND ".join(cond) or None)
+        for cond in conditions:
+            sql = select + ("" if cond is None else " WHERE " + cond) + ";"
+            desc = table + ("" if cond is None else " WHERE " + cond)
+            tasks.append(ExportTask(len(tasks), table, sql, insert_prefix.encode('utf-8'), rows_checksum, desc))
+    return tasks
+
+class ExportChunkWriter:
+    """
+        Write rows of an export task into its chunk file as INSERT
+        statements of at most statement_size bytes, counting rows and
+        their checksums as DumpSplitter does.
+    """
+    def __init__(self, task, path, statement_size):
+        self.task = task
+        self.path = path
+        self.statement_size = statement_size
+        self.fd = open(path, "wb+")
+        self.size = 0
+        self.rows = 0
+        self.stmts = 0
+        self.stmt_bytes = 0
+        self.checksum = 0 if task.rows_checksum else None
+
+    def add_line(self, line):
+        if line.endswith(b'\n'):
+            line = line[:-1]
+        # Newlines in strings are escaped as by mysqldump
+        row = batch_escape_re.sub(unescape_batch, line).replace(b'\n', b'\\n').replace(b'\r', b'\\r')
+        if self.stmt_bytes > 0 and self.stmt_bytes + len(row) + 3 > self.statement_size:
+            self.close_statement()
+        if self.stmt_bytes == 0:
+            data = self.task.insert_prefix + row
+        else:
+            data = b',' + row
+        self.fd.write(data)
+        self.stmt_bytes += len(data)
+        self.rows += 1
+        if self.checksum is not None:
+            checksum = row_checksum(row)
+            self.checksum = None if checksum is None else self.checksum + checksum
+
+    def close_statement(self):
+        if self.stmt_bytes == 0:
+            return
+        self.fd.write(b';\n')
+        self.size += self.stmt_bytes + 2
+        self.stmts += 1
+        self.stmt_bytes = 0
+
+    def finish(self):
+        self.close_statement()
+        self.fd.close()
+        return ChunkInfo(self.task.idx, os.path.basename(self.path), self.task.table, self.size,
+                         self.rows, stmts=self.stmts, checksum=self.checksum)
+
+def export_list_file(export_dir, task_id):
+    return os.path.join(export_dir, "f_chunks_{}.lst".format(task_id))
+
+class ExportWorker(MyProcess):
+    """
+        Export tasks by a session in a transaction with a consistent
+        snapshot, started while export_database() holds the global read
+        lock, so that all workers see the same data. A failed session can
+        not join the snapshot again, so the worker exits on any error.
+        ChunkInfo of non-empty chunk files are written to a list file.
+    """
+    def __init__(self, counter, snapshot_counter, task_id, tasks, export_dir):
+        super(ExportWorker, self).__init__()
+        self.counter = counter
+        self.snapshot_counter = snapshot_counter
+        self.task_id = task_id
+        self.tasks = tasks
+        self.export_dir = export_dir
+
+    def work(self):
+        session = MysqlSession(options.database, self.task_id)
+        session.execute(export_session_settings +
+                        b"SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ;\n"
+                        b"START TRANSACTION WITH CONSISTENT SNAPSHOT;\n")
+        self.snapshot_counter.increment(1)
+        statement_size = parse_size(options.statement_size) or 1024 * 1024
+        total_cnt = len(self.tasks)
+        chunks = []
+        while True:
+            cur_idx = self.counter.increment(1) - 1
+            if cur_idx >= total_cnt:
+                break
+            task = self.tasks[cur_idx]
+            path = os.path.join(self.export_dir, "f_data_{}.sql".format(task.idx))
+            print_msg("[task {}] ({}/{}) Exporting {}".format(self.task_id, cur_idx, total_cnt, task.desc))
+            writer = ExportChunkWriter(task, path, statement_size)
+            session.execute(task.sql.encode('utf-8'), on_line=writer.add_line)
+            chunk = writer.finish()
+            if chunk.rows > 0:
+                chunks.append(chunk)
+            else:
+                os.remove(path)
+        session.close()
+        with open(export_list_file(self.export_dir, self.task_id), "w+") as f_list:
+            for chunk in chunks:
+                f_list.write(json.dumps(chunk.to_dict()) + "\n")
+
+def dump_export_schema(path):
+    """ Dump schema of the database by mysqldump next to the mysql binary """
+    mysqldump_path = os.path.join(os.path.dirname(options.mysql_path), "mysqldump")
+    cmd = "{} --no-data --routines --triggers --events --single-transaction {}".format(
+        get_mysql_exe_cmd(mysqldump_path), options.database)
+    print_if_verbose("Dump schema by `{}`".format(cmd))
+    with tempfile.TemporaryFile() as err_file:
+        with open(path + ".tmp", "wb+") as f_dump:
+            retcode = subprocess.call(shlex.split(cmd), stdout=f_dump, stderr=err_file)
+        if retcode:
+            err_file.seek(0)
+            raise Exception("Failed to dump schema by mysqldump, error code {}, err: {}".format(
+                retcode, err_file.read().decode('utf-8', 'replace').strip()))
+    # Skipped as by the splitter
+    with open(path + ".tmp", "rb") as f_dump:
+        with open(path, "wb+") as f_schema:
+            for line in f_dump:
+                if not (line.startswith(b'SET') and b'GTID_PURGED' in line):
+                    f_schema.write(line)
+    os.remove(path + ".tmp")
+    if is_table_filtered():
+        filter_schema_file(path)
+
+def export_database():
+    """
+        Export tables of the database into export_dir by options.parallel
+        ExportWorker: the schema by mysqldump, rows as INSERT statements in
+        chunk files of get_export_tasks(), and a manifest of the chunks, so
+        that `-f <export_dir>` loads them without split. All workers and the
+        schema dump read the same snapshot of the database, taken under
+        FLUSH TABLES WITH READ LOCK, which is released once every worker has
+        started its transaction.
+    """
+    export_dir = os.path.abspath(options.export_dir)
+    if os.path.exists(export_dir) and len(os.listdir(export_dir)):
+        raise Exception("Export dir `{}` is not empty".format(export_dir))
+    check_output("mkdir -p {}".format(export_dir))
+    chunk_size = parse_size(options.chunk_size) or 64 * 1024 * 1024
+    print_msg("Export database `{}` into `{}` (parallel={})".format(options.database, export_dir, options.parallel))
+
+    lock_session = MysqlSession(options.database)
+    process_pool = MyProcessPool()
+    try:
+        lock_session.execute(b"FLUSH TABLES WITH READ LOCK;\n")
+        print_info("Tables are locked for a consistent snapshot")
+        tasks = get_export_tasks(lock_session, chunk_size)
+        dump_export_schema(os.path.join(export_dir, "f_schema.sql"))
+        with open(os.path.join(export_dir, "f_session_preamble.sql"), "wb+") as f_preamble:
+            f_preamble.write(export_session_settings)
+        counter = MyAtomicCounter()
+        snapshot_counter = MyAtomicCounter()
+        for task_id in range(max(min(options.parallel, len(tasks)), 1)):
+            process_pool.addProcess(ExportWorker(counter, snapshot_counter, task_id, tasks, export_dir))
+        process_pool.start()
+        while snapshot_counter.get() < len(process_pool.process):
+            if len([p for p in process_pool.process if p.exitcode]):
+                break
+            time.sleep(0.01)
+        lock_session.execute(b"UNLOCK TABLES;\n")
+        print_info("Tables are unlocked, {} tasks export {} tables".format(
+            len(tasks), len(set([task.table for task in tasks]))))
+    finally:
+        lock_session.close()
+        process_pool.join()
+    if not process_pool.getResult():
+        raise Exception("Failed to export database `{}`".format(options.database))
+
+    chunks = []
+    for task_id in range(len(process_pool.process)):
+        with open(export_list_file(export_dir, task_id), "r") as f_list:
+            chunks.extend([json.loads(line) for line in f_list])
+        os.remove(export_list_file(export_dir, task_id))
+    chunks.sort(key=lambda d: d['idx'])
+    manifest = {'database': options.database,
+                'schema_file': "f_schema.sql",
+                'preamble_file': "f_session_preamble.sql",
+                'chunks': chunks}
+    with open(os.path.join(export_dir, export_manifest_name), "w+") as f_manifest:
+        json.dump(manifest, f_manifest)
+    print_msg("Exported {} rows into {} chunks ({}), load them by `-f {}`".format(
+        sum([d['rows'] for d in chunks]), len(chunks), format_bytes(sum([d['size'] for d in chunks])), export_dir))
+
+def is_export_input():
+    return os.path.isdir(input_file)
+
+def load_export():
+    """
+        Instead of split_file(): take schema, session preamble and data
+        chunks from the manifest of the export in the input dir. Data
+        files are loaded in place and kept for later loads.
+    """
+    export_manifest_file = os.path.join(input_file, export_manifest_name)
+    if not os.path.exists(export_manifest_file):
+        raise Exception("Input dir `{}` is not an export of pload.py, no `{}` in it".format(input_file, export_manifest_name))
+    with open(export_manifest_file, "r") as f_manifest:
+        manifest = json.load(f_manifest)
+    print_msg("Taking chunks of export `{}` of database `{}` ...".format(input_file, manifest['database']))
+    create_tmp_dir()
+    shutil.copyfile(os.path.join(input_file, manifest['schema_file']), schema_file)
+    shutil.copyfile(os.path.join(input_file, manifest['preamble_file']), session_preamble_file)
+    for d in manifest['chunks']:
+        chunk = ChunkInfo.from_dict(d)
+        if not is_table_selected(chunk.table):
+            continue
+        chunk.idx = len(all_chunks)
+        chunk.path = os.path.join(input_file, chunk.path)
+        all_chunks.append(chunk)
+    options.delete_after_load = False
+    print_msg("Done ({} chunks of {} tables)".format(len(all_chunks), len(set([chunk.table for chunk in all_chunks]))))
+
+def prepare_server():
+    """
+        Check connection to the server of the current target, create the
+        database and change server settings to make loading faster. Returns
+        the settings to recover by recover_server() after loading.
+    """
+    # Check connection fist
+    print_msg("Checking mysql connection using command: `{}` ... ".format(get_mysql_exe_cmd()), end="")
+    show_processlist_cmd = """{} -e "show processlist;" """.format(get_mysql_exe_cmd())
+    check_output(show_processlist_cmd)
+    print_msg("OK")
+
+    # Create database if not exists
+    do_create_db(options.database)
+
+    # Check for binlog, if binlog is on, warn.
+    binlog_is_on_1 = check_bool_var("polar_log_bin")
+    binlog_is_on_2 = check_bool_var("log_bin")
+    if binlog_is_on_1 or binlog_is_on_2:
+        print_warn("binlog is ON. Consider turn it off while loading data.")
+
+    # Check for columnar index, if on, warn.
+    columnar_is_on = check_bool_var("polar_enable_imci")
+    if columnar_is_on:
+        print_warn("polar_enable_imci is ON. Consider turn it off while loading data.")
+
+    settings = {}
+    # disable foreign key check if ON
+    settings['fkc_is_on'] = is_fk_on()
+    if settings['fkc_is_on']:
+        print_info("""Foreign key check is ON. Disble it now. Will recover later.""")
+        do_disable_fkc()
+
+    # disable unique_checks if ON and options.fast_mode
+    settings['ukc_is_on'] = is_fk_on()
+    if settings['ukc_is_on'] and options.fast_mode:
+        print_info("""Unique key check is ON. Disble it now. Will recover later.""")
+        do_disable_ukc()
+
+    # enable autocommit to avoid large transaction
+    settings['autocommit_is_off'] = is_autocommit_off()
+    if settings['autocommit_is_off']:
+        print_info("""Autocommit is OFF. Set it to ON to avoid large transaction. Will recover later.""")
+        do_enable_autocommit()
+
+    # Disable innodb_flush_log_at_trx_commit if ON
+    settings['old_innodb_flush_log_at_trx_commit'] = get_innodb_flush_log_at_trx_commit()
+    settings['cur_innodb_flush_log_at_trx_commit'] = settings['old_innodb_flush_log_at_trx_commit']
+    if settings['old_innodb_flush_log_at_trx_commit'] == 1 and options.fast_mode:
+        print_info("""innodb_flush_log_at_trx_commit is not 0 now. Set it to 0 to make data loading faster.""")
+        do_set_innodb_flush_log_at_trx_commit(0)
+        settings['cur_innodb_flush_log_at_trx_commit'] = 0
+
+    # Merged INSERTs must fit into max_allowed_packet
+    if parse_size(options.statement_size) > 0:
+        max_allowed_packet = get_max_allowed_packet()
+        # Leave room for the packet header and the marker query
+        max_statement_size = max_allowed_packet - 1024
+        if parse_size(options.statement_size) > max_statement_size:
+            print_warn("statement_size {} exceeds max_allowed_packet {}. Use {} instead.".format(
+                options.statement_size, max_allowed_packet, max_statement_size))
+            options.statement_size = str(max_statement_size)
+
+    # LOAD DATA LOCAL needs local_infile on server side
+    if options.load_data and not check_bool_var("local_infile"):
+        print_warn("local_infile is OFF. Load data by INSERT instead of LOAD DATA.")
+        options.load_data = False
+    return settings
+
+def recover_server(settings):
+    """ Recover server settings of the current target changed by prepare_server() """
+    if settings['fkc_is_on']:
+        print_msg("""Recover foreign key check to ON.""")
+        do_enable_fkc()
+    if settings['ukc_is_on'] and options.fast_mode:
+        print_msg("""Recover unique key check to ON.""")
+        do_enable_ukc()
+    if settings['autocommit_is_off']:
+        print_msg("""Recover autocommit to OFF.""")
+        do_disable_autocommit()
+    if settings['old_innodb_flush_log_at_trx_commit'] != settings['cur_innodb_flush_log_at_trx_commit']:
+        print_msg("""Recover innodb_flush_log_at_trx_commit to old value: """.format(settings['old_innodb_flush_log_at_trx_commit']))
+        do_set_innodb_flush_log_at_trx_commit(settings['old_innodb_flush_log_at_trx_commit'])
+        settings['cur_innodb_flush_log_at_trx_commit'] = settings['old_innodb_flush_log_at_trx_commit']
 
 #               ---------------------------
 #               ----  start execution ----
 #               ---------------------------
 
+start_log_aggregator()
+
 print_msg("------- Loading data with configuration ----------------")
 print_msg("mysql binary:             {}".format(options.mysql_path))
 print_msg("input mysqldump file:     {}".format(input_file))
@@ -535,104 +3807,305 @@ print_msg("socket:                   {}".format(options.socket))
 print_msg("user:                     {}".format(options.user))
 print_msg("password (ignored now):   {}".format(options.password))
 print_msg("port:                     {}".format(options.port))
+print_msg("targets:                  {}".format(options.targets))
+print_msg("fanout:                   {}".format(options.fanout))
+print_msg("routes:                   {}".format(options.routes))
+print_msg("tables:                   {}".format(options.tables))
+print_msg("exclude tables:           {}".format(options.exclude_tables))
+print_msg("build index:              {}".format(options.build_index))
+print_msg("index file:               {}".format(get_index_file()))
+print_msg("export dir:               {}".format(options.export_dir))
 print_msg("line per data file:       {}".format(options.line_per_file))
+print_msg("chunk size:               {}".format(options.chunk_size))
+print_msg("rows per chunk:           {}".format(options.rows_per_chunk))
+print_msg("statement size:           {}".format(options.statement_size))
+print_msg("split parallel:           {}".format(options.split_parallel))
 print_msg("parallel:                 {}".format(options.parallel))
+print_msg("table parallel:           {}".format(options.table_parallel))
+print_msg("engine:                   {}".format(options.engine))
+print_msg("auto parallel:            {}".format(options.auto_parallel))
+print_msg("min parallel:             {}".format(options.min_parallel))
+print_msg("watch server:             {}".format(options.watch_server))
+print_msg("streaming:                {}".format(options.streaming))
+print_msg("defer indexes:            {}".format(options.defer_indexes))
+print_msg("schema parallel:          {}".format(options.schema_parallel))
+print_msg("load data:                {}".format(options.load_data))
+print_msg("resume:                   {}".format(options.resume))
+print_msg("max retries:              {}".format(options.max_retries))
+print_msg("verify:                   {}".format(options.verify))
+print_msg("verify parallel:          {}".format(options.verify_parallel))
+print_msg("split only:               {}".format(options.split_only))
+print_msg("progress interval:        {}".format(options.progress_interval))
+print_msg("report file:              {}".format(options.report_file))
+print_msg("prometheus file:          {}".format(options.prometheus_file))
 print_msg("verbose:                  {}".format(options.verbose))
 print_msg("-----------------------------")
 
-# Check connection fist
-print_msg("Checking mysql connection using command: `{}` ... ".format(get_mysql_exe_cmd()), end="")
-show_processlist_cmd = """{} -e "show processlist;" """.format(get_mysql_exe_cmd())
-check_output(show_processlist_cmd)
-print_msg("OK")
+# Index only, a later load takes chunks from the index
+if options.build_index:
+    if options.streaming or options.resume or options.split_only:
+        raise Exception("--build_index can not be used with --streaming, --resume or --split_only")
+    phase_start = time.time()
+    build_dump_index()
+    print_msg("Indexed in {:.2f} seconds".format(time.time() - phase_start))
+    sys.exit(0)
+
+# Export only, a later load takes chunks from the export dir
+if options.export_dir is not None:
+    if options.database is None:
+        raise Exception("Please specify a database to export")
+    if options.targets is not None or options.streaming or options.resume or options.split_only:
+        raise Exception("--export_dir can not be used with --targets, --streaming, --resume or --split_only")
+    phase_start = time.time()
+    export_database()
+    print_msg("Exported in {:.2f} seconds".format(time.time() - phase_start))
+    sys.exit(0)
+
+# Split only, to measure the splitter without a server
+if options.split_only:
+    if options.streaming or options.resume:
+        raise Exception("--split_only can not be used with --streaming or --resume")
+    if options.load_data:
+        load_data_charset = get_dump_charset()
+    start_load_metrics(0)
+    phase_start = time.time()
+    split_file()
+    if is_table_filtered():
+        filter_schema_file(schema_file)
+    phase_seconds['split'] = time.time() - phase_start
+    split_bytes = sum([chunk.size for chunk in all_chunks])
+    print_msg("Split {} into {} chunks in {:.2f} seconds ({}/s)".format(
+        format_bytes(split_bytes), len(all_chunks), phase_seconds['split'],
+        format_bytes(split_bytes / max(phase_seconds['split'], 0.001))))
+    print_msg("Chunks are kept in tmp dir `{}`".format(tmp_dir))
+    write_run_report(phase_seconds['split'], True)
+    sys.exit(0)
+
+# Servers to load into
+if options.targets is not None:
+    targets = parse_targets(options.targets)
+    if not len(targets):
+        raise Exception("No target found in --targets `{}`".format(options.targets))
+else:
+    targets = [Target(0, options.socket, options.host, options.port)]
+cur_target = targets[0]
 
-# Create database if not exists
 if options.database is None:
     raise Exception("Please specify a database to load data into")
-do_create_db(options.database)
-
-# Check for binlog, if binlog is on, warn.
-binlog_is_on_1 = check_bool_var("polar_log_bin")
-binlog_is_on_2 = check_bool_var("log_bin")
-if binlog_is_on_1 or binlog_is_on_2:
-    print_warn("binlog is ON. Consider turn it off while loading data.")
-
-# Check for columnar index, if on, warn.
-columnar_is_on = check_bool_var("polar_enable_imci")
-if columnar_is_on:
-    print_warn("polar_enable_imci is ON. Consider turn it off while loading data.")
-
-# disable foreign key check if ON
-fkc_is_on = is_fk_on()
-if fkc_is_on:
-    print_info("""Foreign key check is ON. Disble it now. Will recover later.""")
-    do_disable_fkc()
-
-# disable unique_checks if ON and options.fast_mode
-ukc_is_on = is_fk_on()
-if ukc_is_on and options.fast_mode:
-    print_info("""Unique key check is ON. Disble it now. Will recover later.""")
-    do_disable_ukc()
-
-# enable autocommit to avoid large transaction
-autocommit_is_off = is_autocommit_off()
-if autocommit_is_off:
-    print_info("""Autocommit is OFF. Set it to ON to avoid large transaction. Will recover later.""")
-    do_enable_autocommit()
-
-# Disable innodb_flush_log_at_trx_commit if ON
-old_innodb_flush_log_at_trx_commit = get_innodb_flush_log_at_trx_commit()
-cur_innodb_flush_log_at_trx_commit = old_innodb_flush_log_at_trx_commit
-if old_innodb_flush_log_at_trx_commit == 1 and options.fast_mode:
-    print_info("""innodb_flush_log_at_trx_commit is not 0 now. Set it to 0 to make data loading faster.""")
-    do_set_innodb_flush_log_at_trx_commit(0)
-    cur_innodb_flush_log_at_trx_commit = 0
+if options.resume and options.streaming:
+    raise Exception("Data chunks are not kept in streaming mode, can not resume")
+if options.engine == "async" and options.streaming:
+    raise Exception("Async engine does not support streaming mode, split by --split_parallel processes instead")
+if options.schema_parallel > 0 and options.streaming:
+    raise Exception("Schema is loaded along the input in streaming mode, can not be created by DDL units")
+if is_table_filtered() and options.streaming:
+    raise Exception("Schema is loaded along the input in streaming mode, can not filter tables")
+if is_export_input():
+    if options.streaming:
+        raise Exception("Input dir `{}` is an export, its data files are loaded as they are, not streamed".format(input_file))
+    if options.load_data or parse_size(options.statement_size) > 0 or options.rows_per_chunk > 0:
+        print_info("--load_data, --statement_size and --rows_per_chunk are not applied to data files of an export")
+        options.load_data = False
+if is_fanout():
+    if options.streaming:
+        raise Exception("Streaming mode loads into one server, can not load into {} targets".format(len(targets)))
+    if options.engine == "async":
+        raise Exception("Async engine loads into one server, can not load into {} targets".format(len(targets)))
+    if options.auto_parallel:
+        raise Exception("--auto_parallel watches one server, can not load into {} targets".format(len(targets)))
+    if options.fanout == "route":
+        routes = load_routes()
+    # Chunks are loaded into every target, keep them until the end
+    options.delete_after_load = False
 
+load_failed = False
+# (target, settings to recover) of servers prepared for loading
+server_settings = []
+# Target (None without fan-out) -> schema units to create with --schema_parallel
+target_units = {}
 try:
-    # prepare file
-    split_file()
-    print_msg("---\n")
-
-    # source schema file
-    print_msg("Load schema file `{}` into database `{}` using single thread".format(schema_file, options.database))
-    source_single_file(options.database, schema_file)
-    print_msg("---\n")
-
-    # Remove secondary index for all empty tables inside options.database to make load faster
-    #print_info("Before loading data, remove all secondary index; Will recover later.")
-    #print_info("Original schema file is: `{}`".format(schema_file))
-    #print_info("Index recovering DDL statements will be stored at `{}` for use in case anything failed afterward".format(index_recover_ddl_stmts_file))
-    #tmpfile = open(index_recover_ddl_stmts_file, "w+")
-    #tmpfile.close()
-    #remove_secondary_indexes()
-
-    # sourcing data file
-    if options.parallel <= 1:
-        print_msg("Load data file into database `{}` using single thread".format(options.database))
-        for file in all_data_files:
-            source_single_file(options.database, file)
+    for target in targets:
+        use_target(target)
+        server_settings.append((target, prepare_server()))
+    use_target(targets[0])
+
+    if options.load_data:
+        load_data_charset = get_dump_charset()
+        print_if_verbose("Charset of LOAD DATA files: {}".format(load_data_charset.decode('utf-8')))
+        # Rows are not kept by the line, so cut chunks by size
+        if parse_size(options.chunk_size) <= 0 and options.rows_per_chunk <= 0:
+            options.chunk_size = "64M"
+
+    if options.streaming:
+        # split and load data file at the same time
+        print_msg("Split and load data file into database `{}` in streaming mode (parallel={})".format(options.database, options.parallel))
+        # Split size is not known in advance, estimate it by the input file
+        start_load_metrics(None if is_compressed_input() else os.path.getsize(input_file))
+        phase_start = time.time()
+        split_and_source_streaming()
+        phase_seconds['split_and_load'] = time.time() - phase_start
+        print_msg("---\n")
     else:
-        print_msg("Load data file into database `{}` parallelly (parallel={})".format(options.database, options.parallel))
-        source_parallel()
+        load_schema_file = None
+        if options.resume:
+            load_schema_file = load_manifest()
+            if load_schema_file is None:
+                print_warn("No manifest found in tmp dir `{}`, load from the beginning".format(tmp_dir))
+            else:
+                print_info("Resume loading from manifest `{}`".format(manifest_file))
+
+        if load_schema_file is None:
+            # prepare file, by the dump index if there is one
+            phase_start = time.time()
+            dump_index = None if is_export_input() else get_dump_index()
+            if is_export_input():
+                load_export()
+                phase_seconds['index'] = time.time() - phase_start
+            elif dump_index is not None:
+                load_dump_index(dump_index)
+                phase_seconds['index'] = time.time() - phase_start
+            else:
+                split_file()
+                phase_seconds['split'] = time.time() - phase_start
+            if is_table_filtered():
+                filter_schema_file(schema_file)
+            print_msg("---\n")
 
-    # remove tmp dir
-    shutil.rmtree(tmp_dir)
+            # Remove secondary index from the schema to make load faster
+            load_schema_file = schema_file
+            if options.defer_indexes:
+                print_info("Before loading data, remove all secondary index; Will recover later.")
+                print_info("Original schema file is: `{}`".format(schema_file))
+                print_info("Index recovering DDL statements will be stored at `{}` for use in case anything failed afterward".format(index_recover_ddl_stmts_file))
+                with open(schema_file, "rb") as f_schema:
+                    schema_lines = remove_secondary_indexes(f_schema.readlines())
+                load_schema_file = os.path.join(tmp_dir, "f_schema_no_index.sql")
+                with open(load_schema_file, "wb+") as f_schema:
+                    f_schema.writelines(schema_lines)
+            # Read before the schema file is removed after loading
+            if options.verify == "checksum":
+                table_columns.update(get_table_columns(schema_file))
+            write_manifest(load_schema_file)
+
+        # source schema file, every target gets all tables
+        statuses = read_status()
+        if options.schema_parallel <= 0 and len([key for key in statuses if key.startswith("schema unit ")]):
+            print_info("Schema was partly created by DDL units, continue with --schema_parallel 1")
+            options.schema_parallel = 1
+        if options.schema_parallel > 0:
+            schema_units = split_schema_units(load_schema_file)
+        phase_start = time.time()
+        for target in targets:
+            use_target(target)
+            target_info = " on {}".format(target.name) if is_fanout() else ""
+            if statuses.get(schema_key()) == STATUS_DONE:
+                print_msg("Schema file `{}` is already loaded{}".format(load_schema_file, target_info))
+            elif options.schema_parallel > 0:
+                units = [unit for unit in schema_units if statuses.get(schema_unit_key(unit.idx)) != STATUS_DONE]
+                print_msg("Load schema file `{}` into database `{}`{} by {} of {} DDL units (schema parallel={})".format(
+                    load_schema_file, options.database, target_info, len(units), len(schema_units), options.schema_parallel))
+                # Databases first, tables are created along data, the rest after data
+                source_schema_units([unit for unit in units if unit.kind == 'database'])
+                target_units[target if is_fanout() else None] = units
+            else:
+                print_msg("Load schema file `{}` into database `{}`{} using single thread".format(load_schema_file, options.database, target_info))
+                source_single_file(options.database, load_schema_file)
+                set_status(schema_key(), STATUS_DONE)
+        use_target(targets[0])
+        if len(target_units) and not is_fanout() and (options.parallel <= 1 or options.engine == "async"):
+            # Serial and async loading start once all tables are created
+            source_parallel([(None, [])], target_units)
+        phase_seconds['schema'] = time.time() - phase_start
+        print_msg("---\n")
+
+        # sourcing data file
+        chunk_databases = sorted(set([chunk.database for chunk in all_chunks if chunk.database is not None]))
+        if len(chunk_databases):
+            print_info("Data chunks of {} databases are loaded by one worker pool: {}".format(
+                len(chunk_databases), ", ".join(chunk_databases[:10])))
+        target_chunks = []
+        for target in targets:
+            use_target(target)
+            chunks = get_target_chunks(all_chunks, target)
+            pending_chunks = [chunk for chunk in chunks if statuses.get(chunk_key(chunk.idx)) != STATUS_DONE]
+            if len(pending_chunks) < len(chunks):
+                print_info("{} of {} data chunks are already loaded{}".format(
+                    len(chunks) - len(pending_chunks), len(chunks), " on " + target.name if is_fanout() else ""))
+            target_chunks.append((target, pending_chunks))
+        use_target(targets[0])
+        start_load_metrics(sum([sum([chunk.size for chunk in chunks]) for _, chunks in target_chunks]))
+        phase_start = time.time()
+        if is_fanout():
+            print_msg("Load data file into database `{}` of {} targets ({}, parallel={} per target)".format(
+                options.database, len(targets), options.fanout, options.parallel))
+            source_parallel(target_chunks, target_units)
+        elif options.parallel <= 1:
+            print_msg("Load data file into database `{}` using single thread".format(options.database))
+            session = MysqlSession(options.database)
+            for chunk in pending_chunks:
+                load_chunk(session, chunk, None, len(all_chunks))
+            session.close()
+        elif options.engine == "async":
+            print_msg("Load data file into database `{}` by async engine (connections={})".format(options.database, options.parallel))
+            source_async(pending_chunks)
+        else:
+            print_msg("Load data file into database `{}` parallelly (parallel={})".format(options.database, options.parallel))
+            source_parallel([(None, pending_chunks)], target_units)
+        phase_seconds['data'] = time.time() - phase_start
+
+    if len(index_recover_ddl_stmts):
+        phase_start = time.time()
+        recover_secondary_indexes()
+        phase_seconds['indexes'] = time.time() - phase_start
+        print_msg("---\n")
+
+    if len(schema_units):
+        phase_start = time.time()
+        for target in targets:
+            use_target(target)
+            # Views in dump order before triggers and routines, which may use them
+            units = sorted([unit for unit in target_units.get(target if is_fanout() else None, [])
+                            if unit.kind in ('view', 'post')], key=lambda unit: (unit.kind == 'post', unit.idx))
+            if len(units):
+                print_msg("Create {} views, triggers and routines{} after data".format(
+                    len(units), " on " + target.name if is_fanout() else ""))
+                source_schema_units(units)
+            statuses = read_status()
+            if all([statuses.get(schema_unit_key(unit.idx)) == STATUS_DONE for unit in schema_units]):
+                set_status(schema_key(), STATUS_DONE)
+        use_target(targets[0])
+        phase_seconds['schema_objects'] = time.time() - phase_start
+        print_msg("---\n")
+
+    if options.verify != "none":
+        phase_start = time.time()
+        verify_tables()
+        phase_seconds['verify'] = time.time() - phase_start
+        print_msg("---\n")
+
+    # Chunks and indexes of this run not loaded even after retries
+    statuses = read_status()
+    failed_keys = [key for key, status in statuses.items() if status != STATUS_DONE]
+    for target in targets:
+        use_target(target)
+        failed_keys.extend([chunk_key(chunk.idx) for chunk in get_target_chunks(all_chunks, target)
+                            if chunk_key(chunk.idx) not in statuses])
+    use_target(targets[0])
+    if len(failed_keys):
+        load_failed = True
+        print_warn("{} data chunks / index builds failed: {}".format(len(failed_keys), ", ".join(sorted(failed_keys)[:10])))
+        if not options.streaming:
+            print_warn("Tmp dir `{}` is kept. Fix the errors and run again with --resume to load them.".format(tmp_dir))
+    else:
+        # remove tmp dir
+        shutil.rmtree(tmp_dir)
 except Exception as e:
-    print("Error: {}".format(str(e)))
+    load_failed = True
+    print_msg("Error: {}".format(str(e)))
 finally:
-    if fkc_is_on:
-        print_msg("""Recover foreign key check to ON.""")
-        do_enable_fkc()
-    if ukc_is_on and options.fast_mode:
-        print_msg("""Recover unique key check to ON.""")
-        do_enable_ukc()
-    if autocommit_is_off:
-        print_msg("""Recover autocommit to OFF.""")
-        do_disable_autocommit()
-    if old_innodb_flush_log_at_trx_commit != cur_innodb_flush_log_at_trx_commit:
-        print_msg("""Recover innodb_flush_log_at_trx_commit to old value: """.format(old_innodb_flush_log_at_trx_commit))
-        do_set_innodb_flush_log_at_trx_commit(old_innodb_flush_log_at_trx_commit)
-        cur_innodb_flush_log_at_trx_commit = old_innodb_flush_log_at_trx_commit
+    for target, settings in server_settings:
+        use_target(target)
+        recover_server(settings)
 
 end_time = datetime.now()
 time_delta = (end_time - start_time)
@@ -640,4 +4113,7 @@ time_delta_seconds = time_delta.total_seconds()
 m = ((int)(time_delta_seconds)) / 60
 s = time_delta_seconds - (m * 60)
 
+write_run_report(time_delta_seconds, not load_failed)
 print_msg("------ END OF LOADING (used {} minutes {} seconds) -----".format(m, s))
+if load_failed:
+    sys.exit(1)
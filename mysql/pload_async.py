@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+#coding:utf-8
+
+# Asyncio load engine of pload.py (--engine async)
+#
+# All loading connections are driven by one event loop with aiomysql, instead
+# of a process with its own mysql client per task, so that memory and process
+# count scale with connections, not with Python interpreters. pload.py imports
+# this module only for --engine async, as it is Python 3 only.
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+try:
+    import aiomysql
+    from pymysql.constants import CLIENT
+except ImportError:
+    aiomysql = None
+
+def split_packets(data, max_packet):
+    """
+        Cut SQL of a chunk into batches of whole statements of at most
+        max_packet bytes (a single larger statement is a batch by itself), so
+        that every batch fits into one COM_QUERY packet. Statements are ended
+        by a line ending with ';', as written by DumpSplitter (mysqldump
+        escapes newlines in strings).
+    """
+    batch = []
+    batch_size = 0
+    stmt = []
+    stmt_size = 0
+    for line in data.splitlines(True):
+        stmt.append(line)
+        stmt_size += len(line)
+        if not line.rstrip().endswith(b';'):
+            continue
+        if batch_size > 0 and batch_size + stmt_size > max_packet:
+            yield b''.join(batch)
+            batch = []
+            batch_size = 0
+        batch.extend(stmt)
+        batch_size += stmt_size
+        stmt = []
+        stmt_size = 0
+    batch.extend(stmt)
+    if len(batch):
+        yield b''.join(batch)
+
+class AsyncSession:
+    """
+        A connection of the async engine, the counterpart of MysqlSession in
+        pload.py. The session preamble of the dump (SET NAMES etc.) is run
+        after every connect, and the connection is dropped on any error, so
+        that the transaction of the failed chunk is rolled back.
+    """
+    def __init__(self, connect_args, preamble, max_packet):
+        self.connect_args = connect_args
+        self.preamble = preamble
+        self.max_packet = max_packet
+        self.conn = None
+        self.connect_cnt = 0
+
+    async def connect(self):
+        self.conn = await aiomysql.connect(client_flag=CLIENT.MULTI_STATEMENTS,
+                                           autocommit=True, **self.connect_args)
+        self.connect_cnt += 1
+        if len(self.preamble.strip()):
+            await self.query(self.preamble)
+
+    async def query(self, data):
+        async with self.conn.cursor() as cur:
+            for packet in split_packets(data, self.max_packet):
+                await cur.execute(packet)
+                while await cur.nextset():
+                    pass
+
+    async def execute(self, data, database=None):
+        """ Run SQL of a chunk in a single transaction, in database if given """
+        if self.conn is None:
+            await self.connect()
+        try:
+            if database is not None:
+                await self.conn.select_db(database)
+            await self.conn.begin()
+            await self.query(data)
+            await self.conn.commit()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+async def load_worker(source, task_id):
+    loop = asyncio.get_event_loop()
+    session = AsyncSession(source.connect_args, source.preamble, source.max_packet)
+    while True:
+        chunk = source.next_chunk(task_id)
+        if chunk is False:
+            break
+        if chunk is None:
+            await asyncio.sleep(0.05)
+            continue
+        ok = False
+        # Keep file I/O off the event loop, status records are synced to disk
+        await loop.run_in_executor(None, source.mark_loading, chunk)
+        for retry in range(source.max_retries + 1):
+            start = time.time()
+            try:
+                data = await loop.run_in_executor(None, source.read_chunk, task_id, chunk)
+                await session.execute(data, chunk.database)
+                ok = True
+                break
+            except Exception as e:
+                source.retry_chunk(task_id, chunk, retry, e)
+        source.chunk_done(task_id, chunk, time.time() - start, retry, ok)
+        await loop.run_in_executor(None, source.mark_done, task_id, chunk, ok)
+    session.close()
+
+async def load_all(source, parallel):
+    # A thread per connection, so that file I/O of connections never queues
+    # behind each other in the default executor of a few threads
+    executor = ThreadPoolExecutor(max_workers=parallel)
+    asyncio.get_event_loop().set_default_executor(executor)
+    await asyncio.gather(*[load_worker(source, task_id) for task_id in range(parallel)])
+
+def run(source, parallel):
+    """
+        Load all chunks of source (AsyncChunkSource of pload.py) with
+        parallel connections.
+    """
+    if aiomysql is None:
+        raise Exception("Async engine needs aiomysql, install it by `pip install aiomysql`")
+    asyncio.run(load_all(source, max(parallel, 1)))